@@ -0,0 +1,67 @@
+"""
+MR.EQUIPP — Alert engine (Low Stock + Lost Buy Box)
+Спільний для api.py (/alerts) і dashboard.py (?api=alerts).
+Фільтри рахуються в SQL по останньому знімку, а не по всій історії.
+"""
+import pandas as pd
+
+from typed_views import num
+
+LOW_STOCK_DAYS = 14
+MIN_VELOCITY   = 0
+
+# Останній знімок інвентаря = останній день завантаження (як дефолтна дата в дашборді)
+# num(): нечислове значення ("N/A", "1,234") -> 0, а не помилка касту на весь запит
+LOW_STOCK_SQL = f"""
+    WITH inv AS (
+        SELECT "SKU" AS sku,
+               COALESCE({num('"Available"')}, 0) AS available,
+               COALESCE({num('"Velocity"')}, 0)  AS velocity
+        FROM fba_inventory
+        WHERE created_at >= date_trunc('day', (SELECT MAX(created_at) FROM fba_inventory))
+    )
+    SELECT sku, ROUND(available / velocity) AS days_left, available
+    FROM inv
+    WHERE velocity > :min_velocity AND velocity > 0
+      AND ROUND(available / velocity) < :max_days
+    ORDER BY days_left, sku
+"""
+
+LOST_BUYBOX_SQL = """
+    SELECT asin, sku, price
+    FROM (
+        SELECT DISTINCT ON (asin, marketplace) asin, sku, price, is_buybox_winner
+        FROM pricing_buybox
+        ORDER BY asin, marketplace, snapshot_time DESC
+    ) latest
+    WHERE LOWER(is_buybox_winner::text) IN ('false', '0')
+    ORDER BY asin
+"""
+
+
+def low_stock_params(max_days=LOW_STOCK_DAYS, min_velocity=MIN_VELOCITY) -> dict:
+    return {"max_days": max_days, "min_velocity": min_velocity}
+
+
+def low_stock_records(rows) -> list:
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return []
+    return pd.DataFrame({
+        "type":      "LOW_STOCK",
+        "sku":       df["sku"].fillna(""),
+        "days_left": pd.to_numeric(df["days_left"]).astype(int),
+        "available": pd.to_numeric(df["available"]).astype(int),
+    }).to_dict(orient="records")
+
+
+def lost_buybox_records(rows) -> list:
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return []
+    return pd.DataFrame({
+        "type":  "LOST_BUYBOX",
+        "asin":  df["asin"],
+        "sku":   df["sku"].fillna(""),
+        "price": pd.to_numeric(df["price"], errors="coerce").fillna(0).astype(float),
+    }).to_dict(orient="records")
@@ -3,160 +3,839 @@ MR.EQUIPP BI — FastAPI
 https://mrequipp-api-33065495432e.herokuapp.com
 """
 import os
+import json
+import base64
+import time
+import hashlib
+import itertools
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode
+
 import pandas as pd
-from fastapi import FastAPI, HTTPException, Query
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+
+import alerts_engine
+import api_metrics
+import api_response
+import migrations
+import typed_views
 
-app = FastAPI(title="MR.EQUIPP BI API", version="1.0")
+try:
+    import asyncpg  # noqa: F401
+    from sqlalchemy.ext.asyncio import create_async_engine
+    ASYNC_DB_OK = True
+except ImportError:
+    ASYNC_DB_OK = False
 
 DATABASE_URL = os.getenv("DATABASE_URL", "").replace("postgres://", "postgresql://")
 API_KEY      = os.getenv("API_KEY", "merino2024")
 
+# ── Пул з'єднань (один на процес) ──
+DB_POOL_SIZE       = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW    = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT    = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE    = int(os.getenv("DB_POOL_RECYCLE", "300"))
+SCHEMA_REFRESH_SEC = int(os.getenv("SCHEMA_REFRESH_SEC", "600"))
+
+# ── Async-пул (asyncpg) для агрегатних ендпоінтів ──
+ASYNC_POOL_SIZE      = int(os.getenv("ASYNC_DB_POOL_SIZE", "5"))
+ASYNC_MAX_OVERFLOW   = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "5"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("STATEMENT_TIMEOUT_MS", "15000"))
+QUEUE_TIMEOUT_SEC    = float(os.getenv("API_QUEUE_TIMEOUT_SEC", "10"))
+
+# endpoint -> (одночасних запитів, statement_timeout мс)
+ENDPOINT_LIMITS = {
+    "finance": (2, 30000),
+    "alerts":  (4, 10000),
+    "reviews": (4, 10000),
+}
+
+# ── Пагінація ──
+DEFAULT_PAGE_SIZE  = int(os.getenv("API_PAGE_SIZE", "1000"))
+MAX_PAGE_SIZE      = int(os.getenv("API_MAX_PAGE_SIZE", "10000"))
+STREAM_BATCH       = int(os.getenv("API_STREAM_BATCH", "2000"))
+
+# ── Кеш відповідей (інвалідація за свіжістю таблиць) ──
+RESPONSE_CACHE_MAX = int(os.getenv("RESPONSE_CACHE_MAX", "256"))
+FRESHNESS_TTL_SEC  = float(os.getenv("FRESHNESS_TTL_SEC", "15"))
+FRESHNESS_COLS     = {"fba_inventory": "created_at", "pricing_buybox": "snapshot_time"}
+
+# ── Колонковий експорт: таблиця -> колонка дати для date_from/date_to ──
+EXPORT_TABLES = {
+    "orders":         "purchase_date",
+    "finance_events": "posted_date",
+    "fba_inventory":  "created_at",
+    "pricing_buybox": "snapshot_time",
+    "fba_shipments":  "created_at",
+    "amazon_reviews": "review_date",
+}
+EXPORT_BATCH = int(os.getenv("API_EXPORT_BATCH", "50000"))
+
+_engine      = None
+_engine_lock = threading.Lock()
+_COLS        = {}   # table_name -> [column_name, ...]
+_async_engine = None
+_SEMAPHORES   = {}
+
 def get_engine():
-    return create_engine(DATABASE_URL, pool_pre_ping=True,
-                         connect_args={"connect_timeout": 10})
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    DATABASE_URL,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=True,
+                    connect_args={"connect_timeout": 10,
+                                  "options": "-c statement_timeout=" + str(STATEMENT_TIMEOUT_MS)},
+                )
+                api_metrics.instrument_engine(_engine)
+    return _engine
+
+def dispose_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+def create_async_db():
+    """asyncpg-пул; sslmode з URL (libpq) перекладається у ssl для asyncpg."""
+    url = make_url(DATABASE_URL)
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    connect_args = {"timeout": 10}
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode
+    engine = create_async_engine(
+        url.set(drivername="postgresql+asyncpg", query=query),
+        pool_size=ASYNC_POOL_SIZE,
+        max_overflow=ASYNC_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+    api_metrics.instrument_engine(engine.sync_engine)
+    return engine
+
+def _rows(result) -> list:
+    with api_metrics.timer("transform"):
+        rows = [dict(r) for r in result.mappings()]
+    api_metrics.add_rows(len(rows))
+    return rows
+
+def _sync_rows(sql: str, params: dict, timeout_ms: int) -> list:
+    with get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = " + str(int(timeout_ms))))
+        return _rows(conn.execute(text(sql), params))
+
+async def db_rows(endpoint: str, sql: str, params: dict = None) -> list:
+    """Запит з лімітом одночасних викликів і statement_timeout ендпоінта.
+    Без asyncpg — той самий запит у threadpool на sync-пулі."""
+    limit, timeout_ms = ENDPOINT_LIMITS.get(endpoint, (4, STATEMENT_TIMEOUT_MS))
+    sem = _SEMAPHORES.get(endpoint)
+    if sem is None:                      # ендпоінт без запису в ENDPOINT_LIMITS
+        sem = _SEMAPHORES[endpoint] = asyncio.Semaphore(limit)
+    try:
+        await asyncio.wait_for(sem.acquire(), QUEUE_TIMEOUT_SEC)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Too many concurrent /" + endpoint + " requests")
+    try:
+        if _async_engine is None:
+            return await asyncio.to_thread(_sync_rows, sql, params or {}, timeout_ms)
+        async with _async_engine.connect() as conn:
+            await conn.execute(text("SET LOCAL statement_timeout = " + str(int(timeout_ms))))
+            return _rows(await conn.execute(text(sql), params or {}))
+    except DBAPIError as e:
+        if "statement timeout" in str(e.orig):
+            raise HTTPException(status_code=504, detail="Query timed out")
+        raise
+    finally:
+        sem.release()
+
+async def aget_cols(table: str) -> list:
+    return _COLS.get(table) or await asyncio.to_thread(get_cols, table)
+
+def refresh_cols():
+    """Один запит до information_schema на всі таблиці схеми запитів (current_schema(),
+    тобто public) — кеш колонок. Однойменні таблиці bi / spapi сюди не змішуються."""
+    global _COLS
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() "
+            "ORDER BY table_name, ordinal_position"
+        )).fetchall()
+    cols = {}
+    for t, c in rows:
+        cols.setdefault(t, []).append(c)
+    _COLS = cols
+
+async def _schema_refresher():
+    while True:
+        await asyncio.sleep(SCHEMA_REFRESH_SEC)
+        try:
+            await asyncio.to_thread(refresh_cols)
+        except Exception as e:
+            print(f"⚠️ schema refresh failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    global _async_engine
+    get_engine()
+    # семафори — один раз, у циклі подій застосунку
+    for endpoint, (limit, _) in ENDPOINT_LIMITS.items():
+        _SEMAPHORES[endpoint] = asyncio.Semaphore(limit)
+    if ASYNC_DB_OK:
+        _async_engine = create_async_db()
+    try:
+        await asyncio.to_thread(refresh_cols)
+    except Exception as e:
+        print(f"⚠️ schema preload failed: {e}")
+    task = asyncio.create_task(_schema_refresher())
+    try:
+        yield
+    finally:
+        task.cancel()
+        if _async_engine is not None:
+            await _async_engine.dispose()
+            _async_engine = None
+        dispose_engine()
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with api_metrics.timer("serialize"):
+            return api_response.dumps(content)
+
+app = FastAPI(title="MR.EQUIPP BI API", version="1.0", lifespan=lifespan,
+              default_response_class=FastJSONResponse)
+app.add_middleware(api_response.CompressionMiddleware)
+app.add_middleware(api_metrics.MetricsMiddleware)   # зовнішній: бачить байти після стиснення
 
 def auth(key: str):
     if key != API_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 def get_cols(table: str) -> list:
+    cols = _COLS.get(table)
+    if cols:
+        return cols
+    # таблиця з'явилась після останнього оновлення кешу
     with get_engine().connect() as conn:
-        return pd.read_sql(text(
+        cols = pd.read_sql(text(
             "SELECT column_name FROM information_schema.columns "
-            "WHERE table_name=:t ORDER BY ordinal_position"
+            "WHERE table_schema = current_schema() AND table_name=:t ORDER BY ordinal_position"
         ), conn, params={"t": table})["column_name"].tolist()
+    if cols:
+        _COLS[table] = cols
+    return cols
+
+# ══════════════════════════════════════════
+# Keyset-пагінація: ?after=<cursor>&page_size=N, ?format=ndjson — стрім
+# ══════════════════════════════════════════
+def _q(col: str) -> str:
+    return '"' + col.replace('"', '""') + '"'
+
+def pick_col(cols: list, *names):
+    return next((c for c in cols if c.lower() in names), None)
+
+# фізична адреса рядка — останній ключ keyset у базових таблицях: (created_at, sku)
+# та інші природні ключі не унікальні, і рядки з однаковим ключем на межі сторінки губились
+ROW_ID = "ctid"
+_ROW_ID_OUT = "_row_id"
+
+def key_cols(table: str, *candidates) -> list:
+    """Ключ сортування keyset: для кожної позиції — перша наявна колонка, в кінці ROW_ID."""
+    cols = get_cols(table)
+    keys = [pick_col(cols, *names) for names in candidates]
+    keys = [k for k in keys if k]
+    if not keys:
+        raise HTTPException(status_code=500, detail="No key columns in " + table)
+    return keys + [ROW_ID]
+
+def encode_after(row: dict, keys: list) -> str:
+    raw = json.dumps([row[_ROW_ID_OUT if k == ROW_ID else k] for k in keys], default=str)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _drop_row_id(row: dict) -> dict:
+    row.pop(_ROW_ID_OUT, None)
+    return row
+
+def decode_after(after: str, n: int) -> list:
+    try:
+        vals = json.loads(base64.urlsafe_b64decode(after.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(vals, list) or len(vals) != n:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return vals
+
+def check_format(fmt: str, orient: str = "records"):
+    if fmt not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if not api_response.check_orient(orient):
+        raise HTTPException(status_code=400, detail="orient must be records or split")
+
+def _key_sql(k: str) -> str:
+    return ROW_ID if k == ROW_ID else _q(k)
+
+def _after_cond(keys: list, vals: list):
+    """Рядки після курсора при ORDER BY k DESC NULLS FIRST — розгорнуто по позиціях:
+    row-порівняння (keys) < (cursor) з NULL дає NULL, і такі рядки випадали з пагінації."""
+    params, ors, eq = {}, [], []
+    for i, (k, v) in enumerate(zip(keys, vals)):
+        col = _key_sql(k)
+        if v is None:                      # NULL іде першим — далі лише не-NULL
+            ors.append(eq + [col + " IS NOT NULL"])
+            eq = eq + [col + " IS NULL"]
+            continue
+        p = ":k" + str(i)
+        if k == ROW_ID:
+            p = "CAST(" + p + " AS tid)"
+        params["k" + str(i)] = v
+        ors.append(eq + [col + " < " + p])
+        eq = eq + [col + " = " + p]
+    return "(" + " OR ".join("(" + " AND ".join(c) + ")" for c in ors) + ")", params
+
+def keyset_sql(select: str, table: str, keys: list, where=(), after: str = None):
+    """SELECT ... ORDER BY keys DESC NULLS FIRST з умовою «після курсора» (_after_cond)."""
+    conds, params = list(where), {}
+    if after:
+        cond, params = _after_cond(keys, decode_after(after, len(keys)))
+        conds.append(cond)
+    if ROW_ID in keys:
+        select += ", " + ROW_ID + "::text AS " + _ROW_ID_OUT
+    sql = "SELECT " + select + " FROM " + table
+    if conds:
+        sql += " WHERE " + " AND ".join(conds)
+    sql += " ORDER BY " + ", ".join(_key_sql(k) + " DESC NULLS FIRST" for k in keys)
+    return sql, params
+
+def fetch_page(sql: str, params: dict, keys: list, page_size: int, transform=None):
+    with get_engine().connect() as conn:
+        rows = _rows(conn.execute(text(sql + " LIMIT :_limit"), {**params, "_limit": page_size}))
+    if transform:
+        with api_metrics.timer("transform"):
+            rows = [transform(r) for r in rows]
+    next_after = encode_after(rows[-1], keys) if len(rows) == page_size else None
+    return [_drop_row_id(r) for r in rows], next_after
+
+def _ndjson_rows(sql: str, params: dict, transform=None):
+    # server-side cursor: у пам'яті не більше STREAM_BATCH рядків
+    with get_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=STREAM_BATCH) \
+                     .execute(text(sql), params)
+        for part in result.mappings().partitions(STREAM_BATCH):
+            api_metrics.add_rows(len(part))
+            with api_metrics.timer("serialize"):
+                chunk = b"".join(
+                    api_response.dumps(_drop_row_id(transform(dict(r)) if transform else dict(r))) + b"\n"
+                    for r in part
+                )
+            yield chunk
+
+def stream_ndjson(sql: str, params: dict, page_size: int = None, transform=None):
+    if page_size:
+        sql, params = sql + " LIMIT :_limit", {**params, "_limit": page_size}
+    return StreamingResponse(_ndjson_rows(sql, params, transform),
+                             media_type="application/x-ndjson")
+
+def shape_rows(rows, orient: str):
+    with api_metrics.timer("transform"):
+        return api_response.shape(rows, orient)
+
+def page_size_param(default: int = DEFAULT_PAGE_SIZE):
+    return Query(default, ge=1, le=MAX_PAGE_SIZE)
+
+# ══════════════════════════════════════════
+# Кеш відповідей + ETag / 304
+# Версія даних = MAX(created_at / snapshot_time) таблиць ендпоінта;
+# змінюється лише коли ETL дописує новий знімок.
+# ══════════════════════════════════════════
+_RESP_CACHE = OrderedDict()   # cache_key -> (etag, body bytes)
+_FRESH      = {}              # tables -> (checked_at, version)
+_resp_lock  = threading.Lock()
+
+def data_version(tables: tuple) -> str:
+    now = time.monotonic()
+    hit = _FRESH.get(tables)
+    if hit and now - hit[0] < FRESHNESS_TTL_SEC:
+        return hit[1]
+    sql = "SELECT " + ", ".join(
+        "(SELECT MAX(" + _q(FRESHNESS_COLS[t]) + ")::text FROM " + t + ")" for t in tables)
+    with get_engine().connect() as conn:
+        row = conn.execute(text(sql)).one()
+    version = "|".join(str(v) for v in row)
+    _FRESH[tables] = (now, version)
+    return version
+
+def _if_none_match(request: Request) -> set:
+    raw = request.headers.get("if-none-match", "")
+    return {t.strip().removeprefix("W/") for t in raw.split(",") if t.strip()}
+
+def cache_check(request: Request, endpoint: str, tables: tuple):
+    """-> (cache_key, etag, Response | None). Response — 304 або закешоване тіло."""
+    params = sorted((k, v) for k, v in request.query_params.multi_items() if k != "key")
+    ckey = endpoint + "?" + urlencode(params)
+    try:
+        version = data_version(tables)
+    except Exception as e:
+        print(f"⚠️ freshness probe failed ({endpoint}): {e}")
+        return None, None, None
+    etag    = '"' + hashlib.sha1((ckey + "#" + version).encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    inm = _if_none_match(request)
+    if etag in inm or "*" in inm:
+        return ckey, etag, Response(status_code=304, headers=headers)
+    with _resp_lock:
+        hit = _RESP_CACHE.get(ckey)
+        if hit and hit[0] == etag:
+            _RESP_CACHE.move_to_end(ckey)
+            return ckey, etag, Response(hit[1], media_type="application/json", headers=headers)
+    return ckey, etag, None
+
+def cache_store(ckey: str, etag: str, payload: dict):
+    if ckey is None:
+        return FastJSONResponse(payload)
+    with api_metrics.timer("serialize"):
+        body = api_response.dumps(payload)
+    with _resp_lock:
+        _RESP_CACHE[ckey] = (etag, body)
+        _RESP_CACHE.move_to_end(ckey)
+        while len(_RESP_CACHE) > RESPONSE_CACHE_MAX:
+            _RESP_CACHE.popitem(last=False)
+    return Response(body, media_type="application/json",
+                    headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @app.get("/")
 def root():
     return {"status": "ok", "endpoints": [
-        "/inventory", "/finance", "/orders",
-        "/buybox", "/alerts", "/reviews", "/shipments"
-    ], "auth": "?key=API_KEY"}
+        "/inventory", "/finance", "/finance/rollup?periods=7,30,90&group_by=marketplace,day,sku",
+        "/orders",
+        "/buybox", "/alerts", "/reviews", "/shipments",
+        "/export/{table}?format=parquet|arrow&columns=a,b&date_from=&date_to=",
+        "/metrics"
+    ], "auth": "?key=API_KEY",
+       "pagination": "?page_size=N&after=<next_after> (inventory, orders, shipments, buybox)",
+       "streaming": "?format=ndjson",
+       "orient": "?orient=split — {columns, data: [[...]]} без повтору ключів",
+       "buybox": "?latest=true (останній стан по ASIN, default) | ?latest=false&since=ISO-час (дельта)"}
 
 @app.get("/inventory")
-def inventory(key: str = Query(...)):
+def inventory(request: Request, key: str = Query(...), after: str = None,
+              page_size: int = page_size_param(), format: str = "json",
+              orient: str = "records"):
     auth(key)
-    with get_engine().connect() as conn:
-        df = pd.read_sql(text("SELECT * FROM fba_inventory"), conn)
-    return {"status": "ok", "count": len(df), "data": df.to_dict(orient="records")}
+    check_format(format, orient)
+    keys = key_cols("fba_inventory", ("created_at",), ("sku",))
+    sql, params = keyset_sql("*", "fba_inventory", keys, after=after)
+    if format == "ndjson":
+        return stream_ndjson(sql, params)
+    ckey, etag, hit = cache_check(request, "inventory", ("fba_inventory",))
+    if hit:
+        return hit
+    rows, next_after = fetch_page(sql, params, keys, page_size)
+    return cache_store(ckey, etag, {"status": "ok", "count": len(rows), "page_size": page_size,
+                                    "next_after": next_after,
+                                    "data": shape_rows(rows, orient)})
+
+# ══════════════════════════════════════════
+# 💰 Класифікація finance_events — спільна для /finance і /finance/rollup
+# ══════════════════════════════════════════
+FIN_BUCKETS = [
+    ("gross",       "{e}='Shipment' AND {c}='Principal'"),
+    ("fees",        "{e} IN ('ShipmentFee','RefundFee')"),
+    ("refunds",     "{e}='Refund' AND {c}='Principal'"),
+    ("promos",      "{e}='ShipmentPromo'"),
+    ("adjustments", "{e}='Adjustment'"),
+]
+FIN_DIMS       = ("marketplace", "day", "sku")
+FIN_MAX_PERIOD = 3650
+
+def finance_exprs(cols: list):
+    """SQL-вирази для колонок finance_events або None, якщо немає amount/event_type."""
+    amt    = pick_col(cols, "amount", "amount_value")
+    etype  = pick_col(cols, "event_type", "type")
+    charge = pick_col(cols, "charge_type", "charge")
+    dated  = pick_col(cols, "posted_date", "date", "event_date")
+    if not amt or not etype:
+        return None
+    d = _q(dated) if dated else "created_at"
+    mkt = pick_col(cols, *typed_views.FIN_MARKETPLACE_COLS)
+    sku = pick_col(cols, *typed_views.FIN_SKU_COLS)
+    return {
+        "src": "finance_events",
+        "n": "1",
+        "a": "NULLIF(" + _q(amt) + ", '')::numeric",
+        "e": _q(etype),
+        "c": _q(charge) if charge else "''",
+        "d": d,
+        "marketplace": _q(mkt) if mkt else None,
+        "day": "CAST(" + d + " AS date)",
+        "sku": _q(sku) if sku else None,
+    }
+
+# bi.finance_daily (typed_views): день × marketplace × sku × event_type × charge_type,
+# amount уже NUMERIC і підсумований, n_events — кількість подій
+FIN_DAILY = {
+    "src": "bi.finance_daily",
+    "n": "n_events",
+    "a": "amount",
+    "e": "event_type",
+    "c": "charge_type",
+    "d": "posted_day",
+    "marketplace": "marketplace",
+    "day": "posted_day",
+    "sku": "sku",
+}
+
+async def finance_source():
+    """Вирази над bi.finance_daily, якщо rollup актуальний, інакше — над сирим finance_events."""
+    try:
+        ready = await asyncio.to_thread(typed_views.ready_views, get_engine())
+    except Exception:
+        ready = set()
+    if "finance_daily" in ready:
+        cols = await aget_cols("finance_events")
+        x = dict(FIN_DAILY)
+        # розрізи, яких немає в джерелі, немає й у rollup
+        if not pick_col(cols, *typed_views.FIN_MARKETPLACE_COLS):
+            x["marketplace"] = None
+        if not pick_col(cols, *typed_views.FIN_SKU_COLS):
+            x["sku"] = None
+        return x, cols
+    cols = await aget_cols("finance_events")
+    return finance_exprs(cols), cols
+
+def finance_since(x: dict, days: int) -> str:
+    if x["src"] != "finance_events":
+        return x["d"] + " >= CURRENT_DATE - " + str(int(days))
+    # posted_date у finance_events — TEXT (ISO), порівнюємо як текст
+    return x["d"] + "::text >= (CURRENT_DATE - INTERVAL '" + str(int(days)) + " days')::text"
+
+def finance_totals(r: dict, suffix: str = "") -> dict:
+    vals = {name: float(r[name + suffix] or 0) for name, _ in FIN_BUCKETS}
+    net  = sum(vals.values())
+    out  = {name: round(v, 2) for name, v in vals.items()}
+    out.update({
+        "net": round(net, 2),
+        "margin_pct": round(net / vals["gross"] * 100, 1) if vals["gross"] > 0 else 0,
+        "transactions": int(r["transactions" + suffix] or 0),
+    })
+    return out
 
 @app.get("/finance")
-def finance(key: str = Query(...), days: int = 30):
+async def finance(key: str = Query(...), days: int = 30):
     auth(key)
-    cols  = get_cols("finance_events")
-    amt   = next((c for c in cols if c.lower() in ("amount", "amount_value")), None)
-    etype = next((c for c in cols if c.lower() in ("event_type", "type")), None)
-    charge= next((c for c in cols if c.lower() in ("charge_type", "charge")), None)
-    dated = next((c for c in cols if c.lower() in ("posted_date", "date", "event_date")), None)
-    if not amt or not etype:
-        return {"status": "error", "message": "Columns not found: " + str(cols)}
-    a = 'NULLIF("' + amt + '", \'\')::numeric'
-    e = '"' + etype + '"'
-    c = '"' + charge + '"' if charge else "''"
-    d = '"' + dated + '"' if dated else "created_at"
+    x, cols = await finance_source()
+    if not x:
+        return FastJSONResponse({"status": "error", "message": "Columns not found: " + str(cols)})
     sql = (
-        "SELECT "
-        "SUM(CASE WHEN " + e + "='Shipment' AND " + c + "='Principal' THEN " + a + " ELSE 0 END) AS gross,"
-        "SUM(CASE WHEN " + e + " IN ('ShipmentFee','RefundFee') THEN " + a + " ELSE 0 END) AS fees,"
-        "SUM(CASE WHEN " + e + "='Refund' AND " + c + "='Principal' THEN " + a + " ELSE 0 END) AS refunds,"
-        "SUM(CASE WHEN " + e + "='ShipmentPromo' THEN " + a + " ELSE 0 END) AS promos,"
-        "SUM(CASE WHEN " + e + "='Adjustment' THEN " + a + " ELSE 0 END) AS adjustments,"
-        "COUNT(*) AS transactions "
-        "FROM finance_events "
-        "WHERE " + d + " >= CURRENT_DATE - INTERVAL '" + str(days) + " days'"
+        "SELECT " +
+        ", ".join("SUM(CASE WHEN " + cond.format(**x) + " THEN " + x["a"] + " ELSE 0 END) AS " + name
+                  for name, cond in FIN_BUCKETS) +
+        ", COALESCE(SUM(" + x["n"] + "), 0) AS transactions "
+        "FROM " + x["src"] + " "
+        "WHERE " + finance_since(x, days)
     )
-    with get_engine().connect() as conn:
-        r = pd.read_sql(text(sql), conn).iloc[0]
-    gross  = float(r["gross"] or 0)
-    fees   = float(r["fees"]  or 0)
-    refs   = float(r["refunds"] or 0)
-    promos = float(r["promos"] or 0)
-    adj    = float(r["adjustments"] or 0)
-    net    = gross + fees + refs + promos + adj
-    return {
-        "status": "ok", "period_days": days,
-        "gross": round(gross, 2), "fees": round(fees, 2),
-        "refunds": round(refs, 2), "promos": round(promos, 2),
-        "adjustments": round(adj, 2), "net": round(net, 2),
-        "margin_pct": round(net / gross * 100, 1) if gross > 0 else 0,
-        "transactions": int(r["transactions"])
-    }
+    r = (await db_rows("finance", sql))[0]
+    return FastJSONResponse({"status": "ok", "period_days": days, **finance_totals(r)})
+
+@app.get("/finance/rollup")
+async def finance_rollup(key: str = Query(...), periods: str = "7,30,90", group_by: str = ""):
+    """Кілька періодів × кілька розрізів за один прохід по finance_events.
+    group_by: через кому набори розрізів; розрізи в наборі через '+',
+    напр. group_by=marketplace,day,marketplace+sku. Підсумок () — завжди."""
+    auth(key)
+    try:
+        days = sorted({int(p) for p in periods.split(",") if p.strip()})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="periods must be comma-separated days")
+    if not days or days[0] < 1 or days[-1] > FIN_MAX_PERIOD or len(days) > 6:
+        raise HTTPException(status_code=400, detail="1-6 periods between 1 and " + str(FIN_MAX_PERIOD))
+    sets = [tuple(dict.fromkeys(d.strip() for d in g.split("+") if d.strip()))
+            for g in group_by.split(",") if g.strip()]
+    unknown = {d for g in sets for d in g if d not in FIN_DIMS}
+    if unknown:
+        raise HTTPException(status_code=400, detail="group_by dims: " + ", ".join(FIN_DIMS))
+
+    x, cols = await finance_source()
+    if not x:
+        return FastJSONResponse({"status": "error", "message": "Columns not found: " + str(cols)})
+    dims = [d for d in FIN_DIMS if any(d in g for g in sets)]
+    missing = [d for d in dims if not x[d]]
+    if missing:
+        raise HTTPException(status_code=400, detail="finance_events has no column for: " + ", ".join(missing))
+
+    select = [x[d] + " AS " + d for d in dims]
+    select += ["GROUPING(" + x[d] + ") AS g_" + d for d in dims]
+    for n in days:
+        since = finance_since(x, n)
+        select += ["SUM(" + x["a"] + ") FILTER (WHERE " + cond.format(**x) + " AND " + since + ") AS "
+                   + name + "_" + str(n) for name, cond in FIN_BUCKETS]
+        select.append("COALESCE(SUM(" + x["n"] + ") FILTER (WHERE " + since + "), 0) AS transactions_" + str(n))
+    grouping = ", ".join(["()"] + ["(" + ", ".join(x[d] for d in g) + ")" for g in sets])
+    sql = ("SELECT " + ", ".join(select) + " FROM " + x["src"] + " "
+           "WHERE " + finance_since(x, days[-1]) +
+           (" GROUP BY GROUPING SETS (" + grouping + ")" if sets else ""))
+
+    rows = await db_rows("finance", sql)
+    data = []
+    with api_metrics.timer("transform"):
+        for r in rows:
+            active = [d for d in dims if r["g_" + d] == 0]
+            data.append({
+                "group": "+".join(active) or "total",
+                **{d: r[d] for d in active},
+                "periods": {str(n) + "d": finance_totals(r, "_" + str(n)) for n in days},
+            })
+    return FastJSONResponse({"status": "ok", "periods": days, "count": len(data), "data": data})
 
 @app.get("/orders")
-def orders(key: str = Query(...), days: int = 30):
+def orders(key: str = Query(...), days: int = 30, after: str = None,
+           page_size: int = page_size_param(), format: str = "json",
+           orient: str = "records"):
     auth(key)
+    check_format(format, orient)
     cols     = get_cols("orders")
-    date_col = next((c for c in cols if c.lower() in ("purchase_date", "order_date", "date")), cols[0])
-    sql      = "SELECT * FROM orders WHERE \"" + date_col + "\" >= CURRENT_DATE - INTERVAL '" + str(days) + " days' ORDER BY \"" + date_col + "\" DESC LIMIT 1000"
-    with get_engine().connect() as conn:
-        df = pd.read_sql(text(sql), conn)
-    return {"status": "ok", "period_days": days, "count": len(df),
-            "data": df.to_dict(orient="records")}
+    date_col = pick_col(cols, "purchase_date", "order_date", "date")
+    if not date_col:
+        raise HTTPException(status_code=500, detail="No date column in orders")
+    keys  = key_cols("orders", (date_col,), ("amazon_order_id", "order_id"), ("sku",))
+    # день — purchase_day з індексом після міграції, інакше той самий розбір ISO / DD.MM.YYYY
+    day   = (migrations.day_expr("orders", cols) if date_col == "purchase_date"
+             else migrations.text_day(_q(date_col)))
+    where = [f"{day} >= CURRENT_DATE - {int(days)}"]
+    sql, params = keyset_sql("*", "orders", keys, where, after)
+    if format == "ndjson":
+        return stream_ndjson(sql, params)
+    rows, next_after = fetch_page(sql, params, keys, page_size)
+    return FastJSONResponse({"status": "ok", "period_days": days, "count": len(rows),
+                             "page_size": page_size, "next_after": next_after,
+                             "data": shape_rows(rows, orient)})
+
+def _bb_row(r: dict) -> dict:
+    r["is_buybox_winner"] = str(r.get("is_buybox_winner")).lower() in ("true", "1")
+    return r
+
+_BB_COLS = "asin, sku, is_buybox_winner, price, fulfillment, marketplace, snapshot_time"
+
+def buybox_source(latest: bool, since) -> tuple:
+    """-> (FROM-вираз, params). latest — останній стан кожного (asin, marketplace);
+    since — лише знімки після вказаного часу (дельта)."""
+    where  = " WHERE snapshot_time > :since" if since else ""
+    params = {"since": since} if since else {}
+    if latest:
+        return ("(SELECT DISTINCT ON (asin, marketplace) " + _BB_COLS +
+                " FROM pricing_buybox" + where +
+                " ORDER BY asin, marketplace, snapshot_time DESC) latest"), params
+    return ("(SELECT " + _BB_COLS + " FROM pricing_buybox" + where + ") hist"), params
 
 @app.get("/buybox")
-def buybox(key: str = Query(...)):
+def buybox(request: Request, key: str = Query(...), latest: bool = True,
+           since: datetime = None, after: str = None,
+           page_size: int = page_size_param(), format: str = "json",
+           orient: str = "records"):
     auth(key)
+    check_format(format, orient)
+    source, src_params = buybox_source(latest, since)
+    keys = ["asin", "marketplace"] if latest else ["snapshot_time", "asin", "marketplace"]
+    sql, params = keyset_sql(_BB_COLS, source, keys, after=after)
+    params.update(src_params)
+    if format == "ndjson":
+        return stream_ndjson(sql, params, transform=_bb_row)
+    ckey, etag, hit = cache_check(request, "buybox", ("pricing_buybox",))
+    if hit:
+        return hit
     with get_engine().connect() as conn:
-        df = pd.read_sql(text(
-            "SELECT asin, sku, is_buybox_winner, price, fulfillment, marketplace "
-            "FROM pricing_buybox ORDER BY snapshot_time DESC"
-        ), conn)
-    df["is_buybox_winner"] = df["is_buybox_winner"].astype(str).str.lower().isin(["true", "1"])
-    winners = int(df["is_buybox_winner"].sum())
-    return {"status": "ok", "total": len(df), "winners": winners,
-            "win_rate_pct": round(winners / len(df) * 100, 1) if len(df) > 0 else 0,
-            "data": df.to_dict(orient="records")}
+        total, winners = conn.execute(text(
+            "SELECT COUNT(*), "
+            "COUNT(*) FILTER (WHERE LOWER(is_buybox_winner::text) IN ('true', '1')) "
+            "FROM " + source
+        ), src_params).one()
+    rows, next_after = fetch_page(sql, params, keys, page_size, transform=_bb_row)
+    return cache_store(ckey, etag, {
+        "status": "ok", "latest": latest, "since": since,
+        "total": int(total), "winners": int(winners),
+        "win_rate_pct": round(winners / total * 100, 1) if total > 0 else 0,
+        "count": len(rows), "page_size": page_size, "next_after": next_after,
+        "data": shape_rows(rows, orient)})
 
 @app.get("/alerts")
-def alerts(key: str = Query(...)):
+async def alerts(request: Request, key: str = Query(...),
+                 low_stock_days: int = alerts_engine.LOW_STOCK_DAYS,
+                 min_velocity: float = alerts_engine.MIN_VELOCITY):
     auth(key)
+    ckey, etag, hit = await asyncio.to_thread(
+        cache_check, request, "alerts", ("fba_inventory", "pricing_buybox"))
+    if hit:
+        return hit
     result = []
     try:
-        with get_engine().connect() as conn:
-            inv = pd.read_sql(text("SELECT * FROM fba_inventory"), conn)
-        for col in ["Available", "Velocity"]:
-            if col in inv.columns:
-                inv[col] = pd.to_numeric(inv[col].replace("", None), errors="coerce").fillna(0)
-        if "Velocity" in inv.columns and "Available" in inv.columns:
-            risk = inv[inv["Velocity"] > 0].copy()
-            risk["days"] = (risk["Available"] / risk["Velocity"]).round(0)
-            for _, row in risk[risk["days"] < 14].iterrows():
-                result.append({"type": "LOW_STOCK", "sku": row.get("SKU", ""),
-                                "days_left": int(row["days"]), "available": int(row["Available"])})
+        rows = await db_rows("alerts", alerts_engine.LOW_STOCK_SQL,
+                             alerts_engine.low_stock_params(low_stock_days, min_velocity))
+        with api_metrics.timer("transform"):
+            result += alerts_engine.low_stock_records(rows)
     except Exception as e:
         result.append({"type": "ERROR", "source": "inventory", "message": str(e)})
     try:
-        with get_engine().connect() as conn:
-            bb = pd.read_sql(text(
-                "SELECT asin, sku, price FROM pricing_buybox "
-                "WHERE is_buybox_winner = false OR is_buybox_winner = 'False'"
-            ), conn)
-        for _, row in bb.iterrows():
-            result.append({"type": "LOST_BUYBOX", "asin": row["asin"],
-                           "sku": row.get("sku", ""), "price": float(row.get("price", 0))})
+        rows = await db_rows("alerts", alerts_engine.LOST_BUYBOX_SQL)
+        with api_metrics.timer("transform"):
+            result += alerts_engine.lost_buybox_records(rows)
     except Exception as e:
         result.append({"type": "ERROR", "source": "buybox", "message": str(e)})
-    return {"status": "ok", "alerts_count": len(result), "alerts": result}
+    if any(a["type"] == "ERROR" for a in result):
+        return FastJSONResponse({"status": "ok", "alerts_count": len(result), "alerts": result})
+    return cache_store(ckey, etag, {"status": "ok", "alerts_count": len(result), "alerts": result})
 
 @app.get("/reviews")
-def reviews(key: str = Query(...), limit: int = 100, rating: int = None):
+async def reviews(key: str = Query(...), limit: int = 100, rating: int = None,
+                  orient: str = "records"):
     auth(key)
-    where = "WHERE rating <= " + str(rating) if rating else ""
-    with get_engine().connect() as conn:
-        df = pd.read_sql(text(
-            "SELECT asin, domain, rating, title, review_date "
-            "FROM amazon_reviews " + where +
-            " ORDER BY review_date DESC LIMIT " + str(limit)
-        ), conn)
-    return {"status": "ok", "count": len(df), "data": df.to_dict(orient="records")}
+    check_format("json", orient)
+    where  = "WHERE rating <= :rating " if rating else ""
+    params = {"limit": limit, **({"rating": rating} if rating else {})}
+    rows = await db_rows("reviews",
+        "SELECT asin, domain, rating, title, review_date "
+        "FROM amazon_reviews " + where +
+        "ORDER BY review_date DESC LIMIT :limit", params)
+    return FastJSONResponse({"status": "ok", "count": len(rows), "data": shape_rows(rows, orient)})
 
 @app.get("/shipments")
-def shipments(key: str = Query(...)):
+def shipments(key: str = Query(...), after: str = None,
+              page_size: int = page_size_param(500), format: str = "json",
+              orient: str = "records"):
     auth(key)
+    check_format(format, orient)
     try:
-        with get_engine().connect() as conn:
-            df = pd.read_sql(text("SELECT * FROM fba_shipments ORDER BY created_at DESC LIMIT 500"), conn)
-        return {"status": "ok", "count": len(df), "data": df.to_dict(orient="records")}
+        keys = key_cols("fba_shipments", ("created_at",), ("shipment_id",))
+        sql, params = keyset_sql("*", "fba_shipments", keys, after=after)
+        if format == "ndjson":
+            return stream_ndjson(sql, params)
+        rows, next_after = fetch_page(sql, params, keys, page_size)
+        return FastJSONResponse({"status": "ok", "count": len(rows), "page_size": page_size,
+                                 "next_after": next_after,
+                                 "data": shape_rows(rows, orient)})
+    except HTTPException:
+        raise
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return FastJSONResponse({"status": "error", "message": str(e)})
+
+# ══════════════════════════════════════════
+# 📦 /export/{table} — Parquet / Arrow IPC батчами з server-side курсора
+# ══════════════════════════════════════════
+# Postgres type OID -> Arrow
+_PG_ARROW = {
+    16: pa.bool_(), 20: pa.int64(), 21: pa.int64(), 23: pa.int64(),
+    700: pa.float64(), 701: pa.float64(), 1700: pa.float64(),
+    1082: pa.date32(), 1114: pa.timestamp("us"), 1184: pa.timestamp("us", tz="UTC"),
+}
+
+class _ChunkSink:
+    """File-like для pyarrow: збирає записані байти, віддаємо їх після кожного батча."""
+    def __init__(self):
+        self.chunks, self.pos, self.closed = [], 0, False
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.pos += len(b)
+        return len(b)
+    def tell(self):
+        return self.pos
+    def flush(self):
+        pass
+    def close(self):
+        self.closed = True
+    def drain(self) -> bytes:
+        out, self.chunks = b"".join(self.chunks), []
+        return out
+
+def _arrow_schema(description) -> pa.Schema:
+    return pa.schema([(d[0], _PG_ARROW.get(d[1], pa.string())) for d in description])
+
+def _arrow_batch(part, schema: pa.Schema) -> pa.RecordBatch:
+    arrays = []
+    for values, field in zip(zip(*part), schema):
+        if field.type == pa.float64():
+            values = [None if v is None else float(v) for v in values]
+        elif field.type == pa.string():
+            values = [v if v is None or isinstance(v, str) else
+                      (json.dumps(v, default=str) if isinstance(v, (dict, list)) else str(v))
+                      for v in values]
+        arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _export_stream(sql: str, params: dict, fmt: str):
+    sink = _ChunkSink()
+    with get_engine().connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=EXPORT_BATCH) \
+                     .execute(text(sql), params)
+        parts  = result.partitions(EXPORT_BATCH)
+        first  = next(parts, [])
+        schema = _arrow_schema(result.cursor.description)
+        writer = (pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+                  if fmt == "parquet" else
+                  pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema))
+        for part in itertools.chain([first] if first else [], parts):
+            api_metrics.add_rows(len(part))
+            with api_metrics.timer("transform"):
+                batch = _arrow_batch(part, schema)
+            with api_metrics.timer("serialize"):
+                writer.write_batch(batch)
+            yield sink.drain()
+        writer.close()
+    yield sink.drain()
+
+@app.get("/export/{table}")
+def export(table: str, key: str = Query(...), format: str = "parquet",
+           columns: str = None, date_from: date = None, date_to: date = None):
+    auth(key)
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail="Export tables: " + ", ".join(EXPORT_TABLES))
+    if format not in ("parquet", "arrow"):
+        raise HTTPException(status_code=400, detail="format must be parquet or arrow")
+    cols = get_cols(table)
+    if columns:
+        wanted  = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in wanted if c not in cols]
+        if unknown:
+            raise HTTPException(status_code=400, detail="Unknown columns: " + ", ".join(unknown))
+        select = ", ".join(_q(c) for c in wanted)
+    else:
+        select = "*"
+    date_col = EXPORT_TABLES[table]
+    where, params = [], {}
+    if date_from:
+        where.append("LEFT(" + _q(date_col) + "::text, 10) >= :date_from")
+        params["date_from"] = date_from.isoformat()
+    if date_to:
+        where.append("LEFT(" + _q(date_col) + "::text, 10) <= :date_to")
+        params["date_to"] = date_to.isoformat()
+    sql = "SELECT " + select + " FROM " + table
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    ext, media = (("parquet", "application/vnd.apache.parquet") if format == "parquet"
+                  else ("arrows", "application/vnd.apache.arrow.stream"))
+    return StreamingResponse(
+        _export_stream(sql, params, format), media_type=media,
+        headers={"Content-Disposition": 'attachment; filename="' + table + "." + ext + '"'})
+
+
+@app.get("/metrics")
+def metrics(key: str = Query(...)):
+    """Prometheus: латентність по фазах (db / transform / serialize / total), рядки, байти."""
+    auth(key)
+    return PlainTextResponse(api_metrics.render(), media_type="text/plain; version=0.0.4")
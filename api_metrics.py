@@ -0,0 +1,159 @@
+"""
+MR.EQUIPP — метрики FastAPI (api.py) у форматі Prometheus
+Кожен запит розкладається на фази: db (SQL), transform (рядки -> payload),
+serialize (JSON), total — плюс кількість рядків і байти відповіді.
+"""
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+PHASES  = ("total", "db", "transform", "serialize")
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+_current = ContextVar("bi_api_request", default=None)
+_lock    = threading.Lock()
+_hist    = {}   # (metric, labels) -> [bucket counts..., +Inf, sum]
+_counter = {}   # (metric, labels) -> value
+
+
+def _observe(metric: str, labels: tuple, value: float, buckets=BUCKETS):
+    with _lock:
+        h = _hist.get((metric, labels))
+        if h is None:
+            h = _hist[(metric, labels)] = [0] * (len(buckets) + 2)
+        for i, b in enumerate(buckets):
+            if value <= b:
+                h[i] += 1
+        h[-2] += 1
+        h[-1] += value
+
+
+def _inc(metric: str, labels: tuple, value: float = 1):
+    with _lock:
+        _counter[(metric, labels)] = _counter.get((metric, labels), 0) + value
+
+
+# ── Облік усередині запиту ──
+def add(phase: str, seconds: float):
+    req = _current.get()
+    if req is not None:
+        req[phase] = req.get(phase, 0.0) + seconds
+
+
+def add_rows(n: int):
+    req = _current.get()
+    if req is not None:
+        req["rows"] = req.get("rows", 0) + n
+
+
+@contextmanager
+def timer(phase: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(phase, time.perf_counter() - t0)
+
+
+def instrument_engine(engine):
+    """DB-час усіх запитів рушія (для async — передавати .sync_engine)."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._bi_t0 = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        t0 = getattr(context, "_bi_t0", None)
+        if t0 is not None:
+            add("db", time.perf_counter() - t0)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        req   = {"status": 500, "bytes": 0}
+        token = _current.set(req)
+        t0    = time.perf_counter()
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                req["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                req["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            _current.reset(token)
+            req["total"] = time.perf_counter() - t0
+            route    = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            for phase in PHASES:
+                if phase in req:
+                    _observe("bi_api_request_seconds", (endpoint, phase), req[phase])
+            _observe("bi_api_response_bytes", (endpoint,), req["bytes"], SIZE_BUCKETS)
+            _inc("bi_api_requests_total", (endpoint, str(req["status"])))
+            _inc("bi_api_rows_total", (endpoint,), req.get("rows", 0))
+
+
+# ── Prometheus text exposition ──
+_HELP = {
+    "bi_api_request_seconds": ("histogram", "Request latency by phase (total, db, transform, serialize)",
+                               ("endpoint", "phase"), BUCKETS),
+    "bi_api_response_bytes":  ("histogram", "Response payload bytes on the wire",
+                               ("endpoint",), SIZE_BUCKETS),
+    "bi_api_requests_total":  ("counter", "Requests by endpoint and status", ("endpoint", "status"), None),
+    "bi_api_rows_total":      ("counter", "Rows returned by the database", ("endpoint",), None),
+}
+
+
+def _labels(names, values, extra=""):
+    parts = [n + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"'
+             for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}"
+
+
+def render() -> str:
+    with _lock:
+        hist    = {k: list(v) for k, v in _hist.items()}
+        counter = dict(_counter)
+    out = []
+    for metric, (kind, help_, names, buckets) in _HELP.items():
+        out.append("# HELP " + metric + " " + help_)
+        out.append("# TYPE " + metric + " " + kind)
+        if kind == "histogram":
+            for (m, labels), h in sorted(hist.items()):
+                if m != metric:
+                    continue
+                for b, n in zip(buckets, h):
+                    out.append(metric + "_bucket" + _labels(names, labels, 'le="' + str(b) + '"') + " " + str(n))
+                out.append(metric + "_bucket" + _labels(names, labels, 'le="+Inf"') + " " + str(h[-2]))
+                out.append(metric + "_sum" + _labels(names, labels) + " " + repr(float(h[-1])))
+                out.append(metric + "_count" + _labels(names, labels) + " " + str(h[-2]))
+        else:
+            for (m, labels), v in sorted(counter.items()):
+                if m == metric:
+                    out.append(metric + _labels(names, labels) + " " + str(v))
+    return "\n".join(out) + "\n"
+
+
+def summary() -> dict:
+    """{endpoint: {phase: (count, sum_seconds)}} — для бенчмарку й дебагу."""
+    out = {}
+    with _lock:
+        for (metric, labels), h in _hist.items():
+            if metric == "bi_api_request_seconds":
+                endpoint, phase = labels
+                out.setdefault(endpoint, {})[phase] = (h[-2], h[-1])
+    return out
@@ -0,0 +1,144 @@
+"""
+MR.EQUIPP — спільний шар відповідей API (api.py і ?api= режим dashboard.py)
+- швидка серіалізація (orjson) з нативними NumPy / pandas / Decimal / datetime
+- payload "split": колонки один раз + рядки масивами (без повтору ключів)
+- gzip / brotli за Accept-Encoding (ASGI middleware, працює і зі стрімами)
+"""
+import json
+import zlib
+import datetime as dt
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+    ORJSON_OK = True
+except ImportError:
+    ORJSON_OK = False
+
+try:
+    import brotli
+    BROTLI_OK = True
+except ImportError:
+    BROTLI_OK = False
+
+ORIENTS = ("records", "split")
+
+# вже стиснені або бінарні формати не чіпаємо
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+MIN_COMPRESS_BYTES = 1024
+
+
+def _default(o):
+    if o is pd.NaT or o is pd.NA:
+        return None
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, (pd.Timestamp, dt.datetime, dt.date, dt.time)):
+        return o.isoformat()
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, (bytes, memoryview)):
+        return bytes(o).decode("utf-8", "replace")
+    return str(o)
+
+
+def dumps(obj, indent=False) -> bytes:
+    if ORJSON_OK:
+        opts = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            opts |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=opts)
+    return json.dumps(obj, default=_default, ensure_ascii=False,
+                      indent=2 if indent else None).encode()
+
+
+def check_orient(orient: str) -> bool:
+    return orient in ORIENTS
+
+
+def shape(rows, orient: str = "records"):
+    """list[dict] або DataFrame -> records (list[dict]) чи split ({columns, data})."""
+    if isinstance(rows, pd.DataFrame):
+        if orient == "split":
+            return {"columns": list(rows.columns), "data": rows.to_numpy(dtype=object).tolist()}
+        return rows.to_dict(orient="records")
+    if orient == "split":
+        columns = list(rows[0].keys()) if rows else []
+        return {"columns": columns, "data": [list(r.values()) for r in rows]}
+    return rows
+
+
+def negotiate(accept_encoding: str):
+    accepted = {p.split(";")[0].strip().lower() for p in accept_encoding.split(",")}
+    if BROTLI_OK and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=4)
+            self.compress, self.flush = self._c.process, self._c.finish
+        else:
+            self._c = zlib.compressobj(6, zlib.DEFLATED, 31)
+            self.compress, self.flush = self._c.compress, self._c.flush
+
+
+class CompressionMiddleware:
+    """gzip / brotli для JSON та NDJSON; стрім стискається по шматках."""
+
+    def __init__(self, app, minimum_size: int = MIN_COMPRESS_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers  = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
+        encoding = negotiate(headers.get("accept-encoding", ""))
+        if not encoding:
+            return await self.app(scope, receive, send)
+
+        state = {"start": None, "comp": None, "passthrough": False}
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                resp_headers = {k.decode().lower(): v.decode() for k, v in message.get("headers", [])}
+                ctype = resp_headers.get("content-type", "")
+                if ("content-encoding" in resp_headers or message["status"] == 304
+                        or not ctype.startswith(COMPRESSIBLE)):
+                    state["passthrough"] = True
+                    return await send(message)
+                state["start"] = message
+                return
+            if state["passthrough"] or message["type"] != "http.response.body":
+                return await send(message)
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if state["comp"] is None:
+                start = state["start"]
+                if not more and len(body) < self.minimum_size:
+                    state["passthrough"] = True
+                    await send(start)
+                    return await send(message)
+                state["comp"] = _Compressor(encoding)
+                raw = [(k, v) for k, v in start.get("headers", [])
+                       if k.lower() not in (b"content-length", b"vary")]
+                raw += [(b"content-encoding", encoding.encode()),
+                        (b"vary", b"Accept-Encoding")]
+                await send({**start, "headers": raw})
+            comp = state["comp"]
+            out = comp.compress(body) if body else b""
+            if not more:
+                out += comp.flush()
+            await send({"type": "http.response.body", "body": out, "more_body": more})
+
+        await self.app(scope, receive, wrapped_send)
@@ -9,9 +9,11 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import psycopg2
 from dotenv import load_dotenv
 
+import query_stats
+from frame_cache import cached
+
 load_dotenv()
 
 
@@ -22,16 +24,16 @@ def _get_conn():
     url = os.getenv("DATABASE_URL") or (
         st.secrets.get("DATABASE_URL", "") if hasattr(st, "secrets") else ""
     )
-    return psycopg2.connect(url)
+    return query_stats.connect(url)
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@cached(ttl=600)
 def _query(sql: str, params: tuple = ()) -> pd.DataFrame:
     with _get_conn() as conn:
         return pd.read_sql(sql, conn, params=params)
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@cached(ttl=600)
 def _get_snapshots() -> list:
     df = _query("""
         SELECT snapshot_date FROM cf_item_topics
@@ -42,7 +44,7 @@ def _get_snapshots() -> list:
     return df["snapshot_date"].tolist() if not df.empty else []
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@cached(ttl=600)
 def _get_covered_asins(snap: date) -> pd.DataFrame:
     return _query("""
         SELECT DISTINCT asin, item_name, browse_node_id
@@ -52,7 +54,7 @@ def _get_covered_asins(snap: date) -> pd.DataFrame:
     """, (snap,))
 
 
-@st.cache_data(ttl=600, show_spinner=False)
+@cached(ttl=600)
 def _get_nodes(snap: date) -> pd.DataFrame:
     return _query("""
         SELECT DISTINCT browse_node_id, node_name
@@ -200,7 +202,7 @@ def _tab_overview(snap: date):
     else:
         pivot = returns.pivot_table(
             index="topic", columns="node_name",
-            values="occurrence_pct", aggfunc="first",
+            values="occurrence_pct", aggfunc="first", observed=True,
         ).fillna(0).round(1)
         pivot["_sum"] = pivot.sum(axis=1)
         pivot = pivot.sort_values("_sum", ascending=False).drop(columns=["_sum"])
@@ -465,7 +467,7 @@ def _tab_cross(snap: date):
         return
 
     top_topics = (
-        df.groupby("topic")[metric]
+        df.groupby("topic", observed=True)[metric]
         .mean().dropna().abs()
         .sort_values(ascending=(sent == "positive"))
         .head(max_topics).index.tolist()
@@ -507,11 +507,16 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
+# ── Облік SQL по сторінках (query_stats.py) — до рендеру сторінки все йде на «спільне» ──
+import query_stats as _qstats
+_qstats.set_page("⚙️ Спільне (sidebar, load_data)")
+
 @st.cache_resource
 def get_engine():
     return create_engine(
         DATABASE_URL,
-        connect_args={"options": "-csearch_path=spapi,public", "connect_timeout": 10},
+        connect_args={"options": "-csearch_path=spapi,public", "connect_timeout": 10,
+                      "connection_factory": _qstats.TracedConnection},
         pool_size=3,
         max_overflow=2,
         pool_timeout=10,
@@ -519,6 +524,66 @@ def get_engine():
         pool_recycle=300,
     )
 
+
+# ── Типізовані копії TEXT-таблиць (typed_views.py, схема bi) ──
+import typed_views as _typed
+import frame_cache as _frames
+import prefetch as _prefetch
+import stream_read as _stream
+import migrations as _migrations
+import query_indexes as _qidx
+
+TYPED_REFRESH_SEC = int(os.getenv("TYPED_REFRESH_SEC", "300"))
+AUTO_MIGRATE      = os.getenv("AUTO_MIGRATE", "0") == "1"   # migrations.py + query_indexes.py у фоні при старті (за замовч. — release-крок)
+
+def tv(name: str, alias: str = None) -> str:
+    """FROM-фрагмент типізованої таблиці: bi.<name>, поки не побудована — підзапит з кастами."""
+    return _typed.relation(get_engine(), name, alias)
+
+
+def day_of(table: str, alias: str = None) -> str:
+    """DATE-день рядка сирої таблиці: згенерована колонка з індексом (migrations.py),
+    поки міграція не пройшла — той самий вираз по TEXT."""
+    return _migrations.day_expr(table, _table_cols(table), alias)
+
+
+@st.cache_resource(show_spinner=False)
+def _start_typed_refresher():
+    """Один фоновий потік на процес: оновлює bi.* після кожного завантаження ETL.
+    Окремий рушій з 1 конекшеном — не забирає пул сторінок."""
+    if not DATABASE_URL:
+        return None
+    eng = create_engine(DATABASE_URL, pool_size=1, max_overflow=0, pool_pre_ping=True,
+                        connect_args={"connect_timeout": 10})
+
+    def _loop():
+        if AUTO_MIGRATE:
+            try:
+                for v, name, sec in _migrations.migrate(eng):
+                    print(f"🧱 migration {v} {name}: {sec} с")
+            except Exception as e:
+                print(f"❌ migrations: {e}")
+        # індекси під гарячі запити: створити відсутні (якщо дозволено) і перевірити плани
+        try:
+            _qidx.run(eng, create=AUTO_MIGRATE)
+        except Exception as e:
+            print(f"❌ query indexes: {e}")
+        while True:
+            try:
+                res = _typed.refresh(eng)
+                changed = {k: v for k, v in res.items() if v not in ("fresh", "busy")}
+                if changed:
+                    print(f"🔄 typed views: {changed}")
+            except Exception as e:
+                print(f"❌ typed views refresh: {e}")
+            time.sleep(TYPED_REFRESH_SEC)
+
+    th = threading.Thread(target=_loop, name="typed-views-refresh", daemon=True)
+    th.start()
+    return th
+
+_start_typed_refresher()
+
 # DATA LOADERS
 # ============================================
 
@@ -526,13 +591,13 @@ def get_engine():
 # 🔌 API MODE — ?api=endpoint&key=SECRET
 # Приклад: https://merino-bi.streamlit.app/?api=inventory&key=YOUR_KEY
 # ══════════════════════════════════════════
-import json as _json
+import api_response as _apir
 
 def _api_response(data):
     """Відповідь у JSON через st.code щоб можна було парсити."""
     st.set_page_config(page_title="API", layout="centered")
     st.markdown("```json")
-    st.code(_json.dumps(data, default=str, ensure_ascii=False, indent=2), language="json")
+    st.code(_apir.dumps(data, indent=True).decode(), language="json")
     st.stop()
 
 _qp = st.query_params
@@ -546,13 +611,16 @@ if "api" in _qp:
         _api_response({"error": "Unauthorized", "hint": "Pass ?key=YOUR_API_KEY"})
 
     _engine = get_engine()
+    _orient = _qp.get("orient", "records")
+    if not _apir.check_orient(_orient):
+        _api_response({"error": "orient must be records or split"})
 
     # ── GET /inventory ──
     if _endpoint == "inventory":
         try:
             with _engine.connect() as _c:
                 _df = pd.read_sql(text("SELECT * FROM fba_inventory"), _c)
-            _api_response({"status":"ok","count":len(_df),"data":_df.to_dict(orient="records")})
+            _api_response({"status":"ok","count":len(_df),"data":_apir.shape(_df, _orient)})
         except Exception as e:
             _api_response({"error": str(e)})
 
@@ -563,14 +631,14 @@ if "api" in _qp:
             with _engine.connect() as _c:
                 _r = pd.read_sql(text(f"""
                     SELECT
-                        SUM(CASE WHEN event_type='Shipment' AND charge_type='Principal' THEN NULLIF(amount,'')::numeric ELSE 0 END) AS gross,
-                        SUM(CASE WHEN event_type IN ('ShipmentFee','RefundFee') THEN NULLIF(amount,'')::numeric ELSE 0 END) AS fees,
-                        SUM(CASE WHEN event_type='Refund' AND charge_type='Principal' THEN NULLIF(amount,'')::numeric ELSE 0 END) AS refunds,
-                        SUM(CASE WHEN event_type='ShipmentPromo' THEN NULLIF(amount,'')::numeric ELSE 0 END) AS promos,
-                        SUM(CASE WHEN event_type='Adjustment' THEN NULLIF(amount,'')::numeric ELSE 0 END) AS adjustments,
-                        COUNT(*) AS transactions
-                    FROM finance_events
-                    WHERE posted_date >= CURRENT_DATE - INTERVAL '{_days} days'
+                        SUM(CASE WHEN f.event_type='Shipment' AND f.charge_type='Principal' THEN f.amount ELSE 0 END) AS gross,
+                        SUM(CASE WHEN f.event_type IN ('ShipmentFee','RefundFee') THEN f.amount ELSE 0 END) AS fees,
+                        SUM(CASE WHEN f.event_type='Refund' AND f.charge_type='Principal' THEN f.amount ELSE 0 END) AS refunds,
+                        SUM(CASE WHEN f.event_type='ShipmentPromo' THEN f.amount ELSE 0 END) AS promos,
+                        SUM(CASE WHEN f.event_type='Adjustment' THEN f.amount ELSE 0 END) AS adjustments,
+                        COALESCE(SUM(f.n_events), 0) AS transactions
+                    FROM {tv('finance_daily', 'f')}
+                    WHERE f.posted_day >= CURRENT_DATE - {_days}
                 """), _c).iloc[0]
             gross = float(_r['gross'] or 0)
             fees  = float(_r['fees']  or 0)
@@ -593,11 +661,11 @@ if "api" in _qp:
             with _engine.connect() as _c:
                 _df = pd.read_sql(text(
                     f"SELECT amazon_order_id, purchase_date, sku, item_price, quantity, order_status "
-                    f"FROM orders WHERE purchase_date >= CURRENT_DATE - INTERVAL '{_days} days' "
+                    f"FROM orders WHERE {day_of('orders')} >= CURRENT_DATE - {_days} "
                     f"ORDER BY purchase_date DESC LIMIT 1000"
                 ), _c)
             _api_response({"status":"ok","period_days":_days,"count":len(_df),
-                           "data":_df.to_dict(orient="records")})
+                           "data":_apir.shape(_df, _orient)})
         except Exception as e:
             _api_response({"error": str(e)})
 
@@ -612,29 +680,24 @@ if "api" in _qp:
             winners = int((_df['is_buybox_winner'].astype(str).str.lower() == 'true').sum())
             _api_response({"status":"ok","total":len(_df),"winners":winners,
                            "win_rate_pct":round(winners/len(_df)*100,1) if len(_df)>0 else 0,
-                           "data":_df.to_dict(orient="records")})
+                           "data":_apir.shape(_df, _orient)})
         except Exception as e:
             _api_response({"error": str(e)})
 
     # ── GET /alerts ──
     elif _endpoint == "alerts":
+        import alerts_engine
         alerts = []
         try:
             with _engine.connect() as _c:
-                # Low Stock
-                _inv = pd.read_sql(text("SELECT * FROM fba_inventory"), _c)
-                for col in ['Available','Price','Velocity']:
-                    if col in _inv.columns:
-                        _inv[col] = pd.to_numeric(_inv[col].replace('',''), errors='coerce').fillna(0)
-                if 'Velocity' in _inv.columns and 'Available' in _inv.columns:
-                    _risk = _inv[_inv['Velocity'] > 0].copy()
-                    _risk['days'] = (_risk['Available'] / _risk['Velocity']).round(0)
-                    for _, row in _risk[_risk['days'] < 14].iterrows():
-                        alerts.append({"type":"LOW_STOCK","sku":row.get('SKU',''),"days_left":int(row['days']),"available":int(row['Available'])})
-                # Lost BuyBox
-                _bb = pd.read_sql(text("SELECT asin, sku, price FROM pricing_buybox WHERE is_buybox_winner = false OR is_buybox_winner = 'False'"), _c)
-                for _, row in _bb.iterrows():
-                    alerts.append({"type":"LOST_BUYBOX","asin":row['asin'],"sku":row.get('sku',''),"price":float(row.get('price',0))})
+                # Low Stock (останній знімок)
+                _ls = pd.read_sql(text(alerts_engine.LOW_STOCK_SQL), _c, params=alerts_engine.low_stock_params(
+                    int(_qp.get("low_stock_days", alerts_engine.LOW_STOCK_DAYS)),
+                    float(_qp.get("min_velocity", alerts_engine.MIN_VELOCITY))))
+                alerts += alerts_engine.low_stock_records(_ls)
+                # Lost BuyBox (останній стан по ASIN)
+                _bb = pd.read_sql(text(alerts_engine.LOST_BUYBOX_SQL), _c)
+                alerts += alerts_engine.lost_buybox_records(_bb)
         except Exception as e:
             alerts.append({"type":"ERROR","message":str(e)})
         _api_response({"status":"ok","alerts_count":len(alerts),"alerts":alerts})
@@ -651,7 +714,7 @@ if "api" in _qp:
                     f"FROM amazon_reviews {where} "
                     f"ORDER BY review_date DESC LIMIT {_limit}"
                 ), _c)
-            _api_response({"status":"ok","count":len(_df),"data":_df.to_dict(orient="records")})
+            _api_response({"status":"ok","count":len(_df),"data":_apir.shape(_df, _orient)})
         except Exception as e:
             _api_response({"error": str(e)})
 
@@ -663,62 +726,180 @@ if "api" in _qp:
                 "finance":   "?api=finance&key=K&days=30 → P&L за період",
                 "orders":    "?api=orders&key=K&days=30 → замовлення",
                 "buybox":    "?api=buybox&key=K → Buy Box статус",
-                "alerts":    "?api=alerts&key=K → Low Stock + Lost BB",
+                "alerts":    "?api=alerts&key=K&low_stock_days=14&min_velocity=0 → Low Stock + Lost BB",
                 "reviews":   "?api=reviews&key=K&limit=100&rating=2 → відгуки",
-            }})
+            },
+            "orient": "&orient=split → {columns, data: [[...]]} (inventory, orders, buybox, reviews)"})
     else:
         _api_response({"error": f"Unknown endpoint: {_endpoint}", "hint": "Use ?api=help for docs"})
 
 
-@st.cache_data(ttl=60)
-def load_data():
+# Колонки fba_inventory, які читають Overview і фільтр магазину
+INV_PAGE_COLUMNS = ('created_at', 'SKU', 'ASIN', 'Store Name', 'Available', 'Price', 'Velocity')
+
+
+@_frames.cached(ttl=60)
+def load_inventory_days():
+    """-> (дні знімків fba_inventory від нових, магазини) — для сайдбару, без самих рядків."""
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df = pd.read_sql(text("SELECT * FROM fba_inventory ORDER BY created_at DESC"), conn)
+        real = _table_cols('fba_inventory')
+        with get_engine().connect() as conn:
+            days = [r[0] for r in conn.execute(text(
+                "SELECT DISTINCT created_at::date FROM fba_inventory WHERE created_at IS NOT NULL ORDER BY 1 DESC"
+            ))]
+            stores = [r[0] for r in conn.execute(text(
+                'SELECT DISTINCT "Store Name" FROM fba_inventory WHERE "Store Name" IS NOT NULL ORDER BY 1'
+            ))] if 'Store Name' in real else []
+        return days, stores
+    except Exception as e:
+        st.error(f"Помилка підключення до БД (Inventory): {e}")
+        return [], []
+
+
+@_frames.cached(ttl=60)
+def load_data(columns=INV_PAGE_COLUMNS, date_from=None, date_to=None):
+    """Знімки fba_inventory за період (сайдбар — один день) і лише потрібні колонки."""
+    try:
+        sql, params = _select_sql('fba_inventory', columns, 'created_at::date', date_from, date_to,
+                                  order_by='created_at DESC')
+        with get_engine().connect() as conn:
+            df = pd.read_sql(text(sql), conn, params=params)
+        if df.empty:
+            return df
+        # типи — один раз на завантаження, а не на кожен rerun
+        for col in ['Available','Price','Velocity','Stock Value']:
+            if col not in df.columns: df[col] = 0
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+        df['Stock Value'] = df['Available'] * df['Price']
+        df['created_at']  = pd.to_datetime(df['created_at'])
+        df['date']        = df['created_at'].dt.date
         return df
     except Exception as e:
         st.error(f"Помилка підключення до БД (Inventory): {e}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=60)
-def load_orders():
+# ── Проєкція колонок і вікно дат для loader-ів ──
+# columns / date_from / date_to — аргументи кешованих функцій, тож ключ кешу
+# включає їх: сторінка за 14 днів тягне й кешує лише 14 днів і лише свої колонки.
+def _select_sql(table, columns=None, date_expr=None, date_from=None, date_to=None,
+                order_by=None, schema='public', pyformat=False, since_col=None, since=None):
+    """-> (sql, params). Невідомі колонки відкидаються; date_expr — DATE-вираз дня рядка
+    (day_of() / _migrations.text_day()), межі порівнюються як DATE — індекс по дню працює.
+    since_col/since — лише рядки з watermark >= since (інкрементальне доповнення кешу)."""
+    real = _table_cols(table, schema)
+    cols = [c for c in (columns or []) if c in real]
+    proj = ", ".join(f'"{c}"' for c in cols) if cols else "*"
+    name = table if schema == 'public' else f"{schema}.{table}"
+    ph   = (lambda p: f"%({p})s") if pyformat else (lambda p: f":{p}")
+    where, params = [], {}
+    if date_expr and date_from:
+        where.append(f"({date_expr}) >= CAST({ph('date_from')} AS date)")
+        params['date_from'] = str(date_from)[:10]
+    if date_expr and date_to:
+        where.append(f"({date_expr}) <= CAST({ph('date_to')} AS date)")
+        params['date_to'] = str(date_to)[:10]
+    if since_col and since is not None:
+        where.append(f'"{since_col}" >= {ph("since")}')
+        params['since'] = since
+    sql = f"SELECT {proj} FROM {name}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    return sql, params
+
+
+def _st_date_expr():
+    """DATE: report_date, а якщо порожня — день created_at (як у load_sales_traffic)."""
+    if 'created_at' in _table_cols('sales_traffic', 'spapi'):
+        return _migrations.text_day("COALESCE(NULLIF(report_date::text, ''), created_at::text)")
+    return _migrations.text_day("report_date")
+
+
+@_frames.cached(ttl=60)
+def load_date_bounds(table, date_expr, schema='public'):
+    """(min, max) дати таблиці для віджетів періоду — без завантаження самих рядків."""
+    name = table if schema == 'public' else f"{schema}.{table}"
     try:
-        engine = get_engine()
+        with get_engine().connect() as conn:
+            mn, mx = conn.execute(text(
+                f"SELECT MIN(LEFT(({date_expr})::text, 10)), MAX(LEFT(({date_expr})::text, 10)) FROM {name}"
+            )).fetchone()
+        mn, mx = pd.to_datetime(mn, errors='coerce'), pd.to_datetime(mx, errors='coerce')
+        if pd.isna(mn) or pd.isna(mx):
+            return None, None
+        return mn.date(), mx.date()
+    except Exception:
+        return None, None
+
+
+def _orders_frame(df):
+    # Маппінг реальних колонок → стандартні назви
+    df['Order Date']   = pd.to_datetime(df['purchase_date'], errors='coerce')
+    df['Order ID']     = df['amazon_order_id'] if 'amazon_order_id' in df.columns else df.get('order_id', '')
+    df['SKU']          = df['sku'] if 'sku' in df.columns else ''
+    df['Item Price']   = pd.to_numeric(df.get('item_price', 0), errors='coerce').fillna(0)
+    df['Quantity']     = pd.to_numeric(df.get('quantity', 1), errors='coerce').fillna(1)
+    df['Total Price']  = df['Item Price'] * df['Quantity']
+    df['Order Status'] = df.get('order_status', '')
+    df['Ship Country'] = df.get('ship_country', '')
+    return df
+
+
+def _incremental_load(table, columns, date_expr, date_from, date_to, order_col,
+                      watermarks, keys, process, stream=False):
+    """Спільне для load_orders / load_reviews: кадр у frame_cache, після TTL
+    дотягуються лише рядки з watermark >= останнього, дедуп по натуральному ключу.
+    stream=True — читання пачками server-side курсором (stream_read) для великих таблиць."""
+    real   = _table_cols(table)
+    wm_col = next((c for c in watermarks if c in real), None)
+    keys   = [k for k in keys if k in real]
+    if columns:
+        columns = tuple(dict.fromkeys([*columns, order_col, *([wm_col] if wm_col else []), *keys]))
+    engine = get_engine()
+
+    def fetch(since):
+        sql, params = _select_sql(table, columns, date_expr, date_from, date_to,
+                                  order_by=f'{order_col} DESC', since_col=wm_col, since=since,
+                                  pyformat=stream)
+        if stream:
+            return _stream.read_frame(engine, sql, params)
         with engine.connect() as conn:
-            df = pd.read_sql(text('SELECT * FROM orders ORDER BY purchase_date DESC'), conn)
-        if df.empty:
-            return pd.DataFrame()
-        # Маппінг реальних колонок → стандартні назви
-        df['Order Date']   = pd.to_datetime(df['purchase_date'], errors='coerce')
-        df['Order ID']     = df['amazon_order_id'] if 'amazon_order_id' in df.columns else df.get('order_id', '')
-        df['SKU']          = df['sku'] if 'sku' in df.columns else ''
-        df['Item Price']   = pd.to_numeric(df.get('item_price', 0), errors='coerce').fillna(0)
-        df['Quantity']     = pd.to_numeric(df.get('quantity', 1), errors='coerce').fillna(1)
-        df['Total Price']  = df['Item Price'] * df['Quantity']
-        df['Order Status'] = df.get('order_status', '')
-        df['Ship Country'] = df.get('ship_country', '')
-        return df
+            return pd.read_sql(text(sql), conn, params=params)
+
+    frame = _frames.get_frame((table, columns, date_from, date_to),
+                              keys=keys, watermark=wm_col, sort_by=order_col)
+    return frame.get(fetch, process).copy(deep=False)
+
+
+def load_orders(columns=None, date_from=None, date_to=None):
+    try:
+        df = _incremental_load('orders', columns, day_of('orders'), date_from, date_to,
+                               'purchase_date', ('created_at', 'purchase_date'),
+                               ('amazon_order_id', 'sku'), _orders_frame)
+        return df if not df.empty else pd.DataFrame()
     except Exception as e:
         st.error(f"Помилка завантаження orders: {e}")
         return pd.DataFrame()
 
 
-@st.cache_data(ttl=60)
-def load_settlements():
+@_frames.cached(ttl=60)
+def load_settlements(columns=None, date_from=None, date_to=None):
     try:
         engine = get_engine()
+        # Читаємо реальні назви колонок
+        real_cols = sorted(_table_cols('settlements'))
+        date_col = next((c for c in real_cols if c.lower() in ('posted_date','posted date')), None)
+        # posted_date буває і YYYY-MM-DD, і DD.MM.YYYY — той самий розбір, що в bi.settlements
+        date_expr = (day_of('settlements') if date_col == 'posted_date'
+                     else _migrations.text_day(f'"{date_col}"')) if date_col else None
+        if columns and date_col and date_col not in columns:
+            columns = [*columns, date_col]
+        sql, params = _select_sql('settlements', columns, date_expr, date_from, date_to,
+                                  order_by=f'{date_expr} DESC' if date_col else None)
         with engine.connect() as conn:
-            # Читаємо реальні назви колонок
-            cols_df = pd.read_sql(text(
-                "SELECT column_name FROM information_schema.columns "
-                "WHERE table_name='settlements' ORDER BY ordinal_position"
-            ), conn)
-            real_cols = cols_df['column_name'].tolist()
-            date_col = next((c for c in real_cols if c.lower() in ('posted_date','posted date')), None)
-            order_clause = f'ORDER BY "{date_col}" DESC' if date_col else ''
-            df = pd.read_sql(text(f'SELECT * FROM settlements {order_clause}'), conn)
+            df = pd.read_sql(text(sql), conn, params=params)
 
         if df.empty:
             return pd.DataFrame()
@@ -738,7 +919,11 @@ def load_settlements():
 
         df['Amount']      = pd.to_numeric(df.get('Amount', 0), errors='coerce').fillna(0.0)
         df['Quantity']    = pd.to_numeric(df.get('Quantity', 0), errors='coerce').fillna(0)
-        df['Posted Date'] = pd.to_datetime(df['Posted Date'], dayfirst=True, errors='coerce')
+        # ISO і DD.MM.YYYY окремо: dayfirst=True на ISO міняє місяць з днем
+        _pd  = df['Posted Date'].astype(str)
+        _dmy = _pd.str.match(r'\d{2}\.\d{2}\.\d{4}')
+        _iso = pd.to_datetime(_pd.where(~_dmy), format='ISO8601', errors='coerce', utc=True).dt.tz_localize(None)
+        df['Posted Date'] = _iso.fillna(pd.to_datetime(_pd.where(_dmy).str[:10], format='%d.%m.%Y', errors='coerce'))
         if 'Currency' not in df.columns:
             df['Currency'] = 'USD'
         df = df.dropna(subset=['Posted Date'])
@@ -747,51 +932,56 @@ def load_settlements():
         st.error(f"Error loading settlements: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=60)
-def load_sales_traffic():
-    import psycopg2
-    import psycopg2.extras
-    db_url = DATABASE_URL
-    if not db_url:
+# Колонки, які реально читає сторінка Sales & Traffic
+ST_PAGE_COLUMNS = (
+    'report_date', 'created_at', 'child_asin',
+    'sessions', 'page_views', 'units_ordered', 'ordered_product_sales',
+    'buy_box_percentage', 'mobile_sessions', 'browser_sessions',
+)
+
+_ST_NUMERIC = (
+    'sessions','page_views','units_ordered','units_ordered_b2b',
+    'total_order_items','total_order_items_b2b',
+    'ordered_product_sales','ordered_product_sales_b2b',
+    'session_percentage','page_views_percentage',
+    'buy_box_percentage','unit_session_percentage',
+    'mobile_sessions','mobile_page_views',
+    'browser_sessions','browser_page_views',
+    'mobile_session_percentage','mobile_page_views_percentage',
+    'mobile_unit_session_percentage','mobile_buy_box_percentage',
+    'browser_session_percentage','browser_page_views_percentage',
+    'browser_unit_session_percentage','browser_buy_box_percentage',
+)
+
+
+def _sales_traffic_batch(df):
+    """Типізація однієї пачки sales_traffic (рядкова — можна по пачках)."""
+    for col in _ST_NUMERIC:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+    df['report_date'] = pd.to_datetime(df['report_date'], errors='coerce')
+    if 'created_at' in df.columns:
+        created = pd.to_datetime(df['created_at'], errors='coerce').dt.normalize()
+        if df['report_date'].isna().all():
+            df['report_date'] = created
+        elif df['report_date'].isna().any():
+            mask = df['report_date'].isna()
+            df.loc[mask, 'report_date'] = created[mask]
+    df['report_date'] = df['report_date'].dt.normalize()
+    return df
+
+
+@_frames.cached(ttl=60)
+def load_sales_traffic(columns=None, date_from=None, date_to=None):
+    if not DATABASE_URL:
         return pd.DataFrame()
-    if db_url.startswith("postgres://"):
-        db_url = db_url.replace("postgres://", "postgresql://", 1)
-    conn = None
     try:
-        conn = psycopg2.connect(db_url, connect_timeout=10)
-        cur  = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cur.execute("SELECT * FROM spapi.sales_traffic ORDER BY report_date DESC")
-        rows    = cur.fetchall()
-        columns = [desc[0] for desc in cur.description]
-        cur.close()
-        if not rows:
+        sql, params = _select_sql('sales_traffic', columns, _st_date_expr(), date_from, date_to,
+                                  order_by='report_date DESC', schema='spapi', pyformat=True)
+        # server-side курсор пачками: без повної копії результату в DictCursor-списку
+        df = _stream.read_frame(get_engine(), sql, params, convert=_sales_traffic_batch)
+        if df.empty:
             return pd.DataFrame()
-        df = pd.DataFrame(rows, columns=columns)
-        numeric_cols = [
-            'sessions','page_views','units_ordered','units_ordered_b2b',
-            'total_order_items','total_order_items_b2b',
-            'ordered_product_sales','ordered_product_sales_b2b',
-            'session_percentage','page_views_percentage',
-            'buy_box_percentage','unit_session_percentage',
-            'mobile_sessions','mobile_page_views',
-            'browser_sessions','browser_page_views',
-            'mobile_session_percentage','mobile_page_views_percentage',
-            'mobile_unit_session_percentage','mobile_buy_box_percentage',
-            'browser_session_percentage','browser_page_views_percentage',
-            'browser_unit_session_percentage','browser_buy_box_percentage',
-        ]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-        df['report_date'] = pd.to_datetime(df['report_date'], errors='coerce')
-        if 'created_at' in df.columns:
-            created = pd.to_datetime(df['created_at'], errors='coerce').dt.normalize()
-            if df['report_date'].isna().all():
-                df['report_date'] = created
-            elif df['report_date'].isna().any():
-                mask = df['report_date'].isna()
-                df.loc[mask, 'report_date'] = created[mask]
-        df['report_date'] = df['report_date'].dt.normalize()
         df = df.dropna(subset=['report_date'])
         return df
     except Exception as e:
@@ -799,38 +989,145 @@ def load_sales_traffic():
         print(f"❌ SALES TRAFFIC ERROR: {e}")
         traceback.print_exc()
         return pd.DataFrame()
-    finally:
-        if conn:
-            conn.close()
 
 
-@st.cache_data(ttl=60)
-def load_returns():
+def _returns_col_map(real_cols):
+    """Реальні назви колонок fba_returns (будь-який регістр) -> стандартні ключі."""
+    col_map = {}
+    for c in real_cols:
+        lc = c.lower().replace(' ', '_').replace('-', '_')
+        if lc in ('return_date', 'returndate', 'date'):  col_map['date']     = c
+        elif lc in ('sku', 'seller_sku', 'msku'):      col_map['sku']      = c
+        elif lc in ('asin', 'fnsku'):                  col_map['asin']     = c
+        elif lc in ('quantity', 'qty'):                col_map['qty']      = c
+        elif lc in ('reason', 'return_reason', 'detailed_disposition'): col_map['reason'] = c
+        elif lc in ('status', 'return_status', 'disposition'): col_map['status'] = c
+        elif lc in ('order_id', 'orderid', 'amazon_order_id'): col_map['order_id'] = c
+        elif lc in ('product_name', 'title', 'name', 'product_description'): col_map['name'] = c
+    return col_map
+
+
+@_frames.cached(ttl=300)
+def load_return_rates(date_from=None, date_to=None, by='sku'):
+    """Return rate за період одним SQL: повернення (fba_returns) ⟗ замовлення (bi.orders)
+    по by = 'sku' | 'asin' | 'month'. Рядок з is_total=1 — підсумок за весь період
+    (GROUPING SETS: унікальні замовлення не сумуються по SKU); key=NULL при is_total=0 —
+    група порожнього SKU/ASIN, не підсумок.
+    -> key, is_total, returns, units_returned, orders_returned, orders, units_ordered, price, return_value, return_rate"""
+    cm = _returns_col_map(_table_cols('fba_returns'))
+    if 'date' not in cm or (by != 'month' and by not in cm) or (by == 'asin' and cm['asin'].lower() != 'asin'):
+        return pd.DataFrame()
+    q = lambda c: '"' + c + '"'
+    r_day = f"LEFT({q(cm['date'])}::text, 10)"
+    r_key = f"LEFT({r_day}, 7)" if by == 'month' else f"NULLIF({q(cm[by])}::text, '')"
+    o_key = "to_char(o.purchase_day, 'YYYY-MM')" if by == 'month' else f"NULLIF(o.{by}::text, '')"
+    r_qty = _typed.num(q(cm['qty'])) if 'qty' in cm else "1"
+    r_oid = f"NULLIF({q(cm['order_id'])}::text, '')" if 'order_id' in cm else "NULL"
+    r_where, o_where, params = [], [], {}
+    if date_from:
+        r_where.append(f"{r_day} >= :d1"); o_where.append("o.purchase_day >= CAST(:d1 AS date)")
+        params['d1'] = str(date_from)[:10]
+    if date_to:
+        r_where.append(f"{r_day} <= :d2"); o_where.append("o.purchase_day <= CAST(:d2 AS date)")
+        params['d2'] = str(date_to)[:10]
+    w = lambda conds: ("WHERE " + " AND ".join(conds)) if conds else ""
+    # ціна повернення — середня item_price SKU за весь час (повертають і старі замовлення)
+    price_sql = (f"""
+        , p AS (SELECT o.sku AS k, AVG(o.item_price) AS price FROM {tv('orders', 'o')}
+                WHERE o.item_price IS NOT NULL
+                  AND o.sku IN (SELECT k FROM r WHERE k IS NOT NULL) GROUP BY o.sku)"""
+                 if by == 'sku' else "")
+    sql = f"""
+        WITH r AS (
+            SELECT {r_key} AS k, GROUPING({r_key}) AS g,
+                   COUNT(*) AS returns, COALESCE(SUM({r_qty}), 0) AS units_returned,
+                   COUNT(DISTINCT {r_oid}) AS orders_returned
+            FROM fba_returns {w(r_where)}
+            GROUP BY GROUPING SETS (({r_key}), ())
+        ), o AS (
+            SELECT {o_key} AS k, GROUPING({o_key}) AS g,
+                   COUNT(DISTINCT o.amazon_order_id) AS orders,
+                   COALESCE(SUM(o.quantity), 0) AS units_ordered
+            FROM {tv('orders', 'o')} {w(o_where)}
+            GROUP BY GROUPING SETS (({o_key}), ())
+        ){price_sql}
+        SELECT COALESCE(r.k, o.k) AS key, COALESCE(r.g, o.g) AS is_total,
+               COALESCE(r.returns, 0)          AS returns,
+               COALESCE(r.units_returned, 0)   AS units_returned,
+               COALESCE(r.orders_returned, 0)  AS orders_returned,
+               COALESCE(o.orders, 0)           AS orders,
+               COALESCE(o.units_ordered, 0)    AS units_ordered,
+               {"COALESCE(p.price, 0)" if by == 'sku' else "0"} AS price
+        FROM r FULL OUTER JOIN o ON r.g = o.g AND r.k IS NOT DISTINCT FROM o.k
+        {"LEFT JOIN p ON p.k = r.k" if by == 'sku' else ""}
+        WHERE COALESCE(r.returns, 0) > 0 OR COALESCE(r.g, o.g) = 1
+    """
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df_returns = pd.read_sql(text('SELECT * FROM fba_returns ORDER BY return_date DESC'), conn)
-            df_orders  = pd.read_sql(text("SELECT * FROM orders"), conn)
-        return df_returns, df_orders
+        with get_engine().connect() as conn:
+            df = pd.read_sql(text(sql), conn, params=params)
+    except Exception as e:
+        print(f"load_return_rates: {e}")
+        return pd.DataFrame()
+    for c in df.columns.drop('key'):
+        df[c] = pd.to_numeric(df[c], errors='coerce').fillna(0)
+    df['return_value'] = df['price'] * df['units_returned']
+    df['return_rate']  = (df['orders_returned'] / df['orders'].where(df['orders'] > 0) * 100).fillna(0)
+    return df
+
+
+def return_rate_total(rates) -> float:
+    """% замовлень з поверненням за період — з підсумкового рядка load_return_rates."""
+    if rates is None or rates.empty:
+        return 0.0
+    tot = rates[rates['is_total'] == 1]
+    return float(tot['return_rate'].iloc[0]) if not tot.empty else 0.0
+
+
+def return_rate_keys(rates):
+    """Рядки load_return_rates по ключах (без підсумкового)."""
+    if rates is None or rates.empty:
+        return rates
+    return rates[rates['is_total'] == 0]
+
+
+@_frames.cached(ttl=60)
+def load_returns(date_from=None, date_to=None):
+    """-> (повернення зі стандартними колонками, return rate по SKU з load_return_rates).
+    Таблиця orders сюди більше не тягнеться — ціна й rate рахуються в SQL."""
+    try:
+        real = _table_cols('fba_returns')
+        cm   = _returns_col_map(real)
+        ret_day = _migrations.text_day(f'"{cm["date"]}"') if 'date' in cm else None
+        ret_sql, ret_params = _select_sql('fba_returns', None, ret_day, date_from, date_to,
+                                          order_by=f'"{cm["date"]}" DESC' if 'date' in cm else None)
+        with get_engine().connect() as conn:
+            df_returns = pd.read_sql(text(ret_sql), conn, params=ret_params)
+        df_returns = df_returns.rename(columns={cm[k]: v for k, v in (
+            ('date', 'Return Date'), ('sku', 'SKU'), ('order_id', 'Order ID'),
+            ('qty', 'Quantity'), ('reason', 'Reason')) if k in cm})
+        return df_returns, load_return_rates(date_from, date_to)
     except Exception:
         return pd.DataFrame(), pd.DataFrame()
 
 
-@st.cache_data(ttl=60)
-def load_reviews():
+def _reviews_frame(df):
+    df['review_date'] = pd.to_datetime(df['review_date'], errors='coerce')
+    df['rating']      = pd.to_numeric(df['rating'], errors='coerce').fillna(0).astype(int)
+    if 'is_verified' in df.columns:
+        df['is_verified'] = df['is_verified'].astype(bool)
+    if 'domain' in df.columns:
+        df['domain'] = df['domain'].str.lower().str.strip()
+    return df
+
+
+def load_reviews(columns=None, date_from=None, date_to=None):
     try:
-        engine = get_engine()
-        with engine.connect() as conn:
-            df = pd.read_sql(text('SELECT * FROM amazon_reviews ORDER BY review_date DESC'), conn)
-        if df.empty:
-            return pd.DataFrame()
-        df['review_date'] = pd.to_datetime(df['review_date'], errors='coerce')
-        df['rating']      = pd.to_numeric(df['rating'], errors='coerce').fillna(0).astype(int)
-        if 'is_verified' in df.columns:
-            df['is_verified'] = df['is_verified'].astype(bool)
-        if 'domain' in df.columns:
-            df['domain'] = df['domain'].str.lower().str.strip()
-        return df
+        key = 'review_id' if 'review_id' in _table_cols('amazon_reviews') else 'id'
+        df = _incremental_load('amazon_reviews', columns, _migrations.text_day('review_date'),
+                               date_from, date_to, 'review_date',
+                               ('created_at', 'scraped_at', 'review_date'),
+                               (key,), _reviews_frame, stream=True)
+        return df if not df.empty else pd.DataFrame()
     except Exception:
         return pd.DataFrame()
 
@@ -1002,7 +1299,7 @@ def insights_orders(df_filtered):
     avg_order    = total_rev/total_orders if total_orders > 0 else 0
     days         = max((df_filtered['Order Date'].max()-df_filtered['Order Date'].min()).days,1)
     rev_per_day  = total_rev/days
-    top_sku      = df_filtered.groupby('SKU')['Total Price'].sum().nlargest(1)
+    top_sku      = df_filtered.groupby('SKU', observed=True)['Total Price'].sum().nlargest(1)
     cols = st.columns(2); i = 0
     with cols[i%2]: insight_card("🛒","Средний чек",f"<b>${avg_order:.2f}</b>. +10% к AOV = +${total_rev*0.1:,.0f}.","#1a1a2e"); i+=1
     with cols[i%2]: insight_card("📈","Дневная выручка",f"<b>${rev_per_day:,.0f}/день</b>. Прогноз на месяц: ${rev_per_day*30:,.0f}.","#1a2b1e"); i+=1
@@ -1039,7 +1336,7 @@ def insights_reviews(df, asin=None):
         ver_pct = df['is_verified'].mean()*100
         with cols[i%2]: insight_card("✅","Верификация",f"<b>{ver_pct:.1f}%</b> верифицированы {'— высокое доверие у Amazon.' if ver_pct>=80 else '— следи за политикой.'}","#1a1a2e"); i+=1
     if asin is None and not neg_df.empty and 'asin' in neg_df.columns:
-        worst = neg_df['asin'].value_counts()
+        worst = neg_df['asin'].astype(object).value_counts()
         if not worst.empty:
             with cols[i%2]: insight_card("⚠️",t["insight_toxic"],f"<b>{worst.index[0]}</b> — {worst.iloc[0]} негативных. Начни анализ с него.","#2b0d0d")
 
@@ -1053,35 +1350,31 @@ def show_overview_insights(df_inventory):
     st.markdown("## 🧠 Business Intelligence: Зведені інсайти")
     st.caption("Автоматичний аналіз всіх модулів")
 
-    df_settlements = load_settlements()
-    df_st          = load_sales_traffic()
-    df_orders      = load_orders()
-    df_ret_raw, df_ord_raw = load_returns()
-    df_reviews     = load_reviews()
+    # період фінансового сайдбару (fin_date), без нього — останні 90 днів, не вся історія
+    _rng = st.session_state.get("fin_date")
+    if _rng and len(_rng) == 2:
+        d1, d2 = str(_rng[0]), str(_rng[1])
+    else:
+        d1, d2 = str(dt.date.today() - dt.timedelta(days=90)), str(dt.date.today())
+
+    df_settlements = load_settlements(None, d1, d2)
+    df_st          = load_sales_traffic(ST_PAGE_COLUMNS, d1, d2)
+    df_orders      = load_orders(None, d1, d2)
+    df_ret_raw, df_rates = load_returns(d1, d2)
+    df_reviews     = load_reviews(None, d1, d2)
 
     df_returns  = pd.DataFrame()
-    return_rate = 0
-    if not df_ret_raw.empty:
+    return_rate = return_rate_total(df_rates)
+    if not df_ret_raw.empty and 'Return Date' in df_ret_raw.columns:
         df_ret = df_ret_raw.copy()
         df_ret['Return Date'] = pd.to_datetime(df_ret['Return Date'], errors='coerce')
-        if 'Price' not in df_ret.columns and not df_ord_raw.empty:
-            for col in ['Item Price','item-price','item_price','price']:
-                if col in df_ord_raw.columns:
-                    df_ord_raw[col] = pd.to_numeric(df_ord_raw[col], errors='coerce')
-                    df_ret['Price'] = df_ret['SKU'].map(df_ord_raw.groupby('SKU')[col].mean()).fillna(0)
-                    break
+        if 'Price' not in df_ret.columns and not df_rates.empty and 'SKU' in df_ret.columns:
+            df_ret['Price'] = df_ret['SKU'].astype(object).map(return_rate_keys(df_rates).set_index('key')['price']).fillna(0)
         if 'Price' not in df_ret.columns: df_ret['Price'] = 0
         df_ret['Price']        = pd.to_numeric(df_ret['Price'], errors='coerce').fillna(0)
         df_ret['Quantity']     = pd.to_numeric(df_ret.get('Quantity',1), errors='coerce').fillna(1)
         df_ret['Return Value'] = df_ret['Price'] * df_ret['Quantity']
         df_returns = df_ret
-        if not df_ord_raw.empty:
-            for col in ['Order ID','order-id','order_id','OrderID']:
-                if col in df_ord_raw.columns:
-                    total_orders = df_ord_raw[col].nunique()
-                    unique_ret   = df_returns['Order ID'].nunique() if 'Order ID' in df_returns.columns else 0
-                    return_rate  = unique_ret/total_orders*100 if total_orders > 0 else 0
-                    break
 
     tabs = st.tabs(["💰 Inventory","🏦 Settlements","📈 Трафик (Sales & Traffic)","🛒 Orders","🔙 Повернення (Returns)","⭐ Reviews"])
 
@@ -1103,7 +1396,7 @@ def show_overview_insights(df_inventory):
             df_use  = df_st[df_st['report_date'] >= max_d - dt.timedelta(days=14)]
             df_use  = df_use if not df_use.empty else df_st
             asin_col = 'child_asin' if 'child_asin' in df_use.columns else df_use.columns[0]
-            as_ = df_use.groupby(asin_col).agg({'sessions':'sum','units_ordered':'sum','ordered_product_sales':'sum','buy_box_percentage':'mean'}).reset_index()
+            as_ = df_use.groupby(asin_col, observed=True).agg({'sessions':'sum','units_ordered':'sum','ordered_product_sales':'sum','buy_box_percentage':'mean'}).reset_index()
             as_.columns = ['ASIN','Sessions','Units','Revenue','Buy Box %']
             as_['Conv %'] = (as_['Units']/as_['Sessions']*100).fillna(0)
             insights_sales_traffic(df_use, as_)
@@ -1136,15 +1429,14 @@ def show_overview_insights(df_inventory):
                 # Інвентар
                 df_inv = pd.read_sql(text('SELECT * FROM fba_inventory'), conn)
                 # Продажі за 90 днів
-                df_ord = pd.read_sql(text("""
-                    SELECT sku,
-                        SUBSTRING(purchase_date,1,10)::date AS day,
-                        COUNT(DISTINCT amazon_order_id) AS orders,
-                        SUM(CASE WHEN quantity ~ '^[0-9]+$' THEN quantity::numeric ELSE 1 END) AS units,
-                        SUM(CASE WHEN item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS revenue
-                    FROM orders
-                    WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '90 days'
-                      AND purchase_date IS NOT NULL AND purchase_date != ''
+                df_ord = pd.read_sql(text(f"""
+                    SELECT o.sku,
+                        o.purchase_day AS day,
+                        COUNT(DISTINCT o.amazon_order_id) AS orders,
+                        SUM(COALESCE(o.quantity, 1)) AS units,
+                        SUM(COALESCE(o.item_price, 0)) AS revenue
+                    FROM {tv('orders', 'o')}
+                    WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '90 days'
                     GROUP BY 1, 2
                     ORDER BY 2 DESC
                 """), conn)
@@ -1177,18 +1469,18 @@ def show_overview_insights(df_inventory):
             # Merge з listings status
             if not df_lst.empty and "SKU" in df_inv.columns:
                 df_lst["status"] = df_lst["status"].astype(str).str.lower()
-                status_map = df_lst.groupby("sku")["status"].first().to_dict()
-                df_inv["listing_status"] = df_inv["SKU"].map(status_map).fillna("unknown")
+                status_map = df_lst.groupby("sku", observed=True)["status"].first().to_dict()
+                df_inv["listing_status"] = df_inv["SKU"].astype(object).map(status_map).fillna("unknown")
             else:
                 df_inv["listing_status"] = "unknown"
  
             # Merge з velocity з orders (реальний sold за 30д)
             if not df_ord.empty and "SKU" in df_inv.columns:
                 last_30 = df_ord[pd.to_datetime(df_ord["day"]) >= (pd.Timestamp.now().normalize() - pd.Timedelta(days=30))]
-                sold_30 = last_30.groupby("sku")["units"].sum().to_dict()
-                rev_30  = last_30.groupby("sku")["revenue"].sum().to_dict()
-                df_inv["sold_30d"]    = df_inv["SKU"].map(sold_30).fillna(0).astype(int)
-                df_inv["revenue_30d"] = df_inv["SKU"].map(rev_30).fillna(0)
+                sold_30 = last_30.groupby("sku", observed=True)["units"].sum().to_dict()
+                rev_30  = last_30.groupby("sku", observed=True)["revenue"].sum().to_dict()
+                df_inv["sold_30d"]    = df_inv["SKU"].astype(object).map(sold_30).fillna(0).astype(int)
+                df_inv["revenue_30d"] = df_inv["SKU"].astype(object).map(rev_30).fillna(0)
                 df_inv["velocity_real"] = (df_inv["sold_30d"] / 30).round(2)
                 df_inv["dos_real"] = (df_inv["Available"] / df_inv["velocity_real"].replace(0, float("nan"))).round(0).fillna(0)
             else:
@@ -1315,7 +1607,7 @@ def show_overview_insights(df_inventory):
                     df_agg = df_vel.resample("W", on="day").agg(
                         {"orders":"sum","units":"sum","revenue":"sum"}).reset_index()
                 else:
-                    df_agg = df_vel.groupby("day").agg(
+                    df_agg = df_vel.groupby("day", observed=True).agg(
                         {"orders":"sum","units":"sum","revenue":"sum"}).reset_index()
  
                 col1, col2 = st.columns(2)
@@ -1352,7 +1644,7 @@ def show_overview_insights(df_inventory):
                 # По SKU velocity
                 st.markdown("##### 🏆 Топ 15 SKU по продажах (30д)")
                 sku_vel = df_vel[df_vel["day"] >= (pd.Timestamp.now().normalize() - pd.Timedelta(days=30))]
-                sku_agg = sku_vel.groupby("sku").agg(
+                sku_agg = sku_vel.groupby("sku", observed=True).agg(
                     units=("units","sum"), revenue=("revenue","sum"), orders=("orders","sum")
                 ).reset_index().nlargest(15, "units")
  
@@ -1382,7 +1674,7 @@ def show_overview_insights(df_inventory):
  
                 # Таблиця velocity
                 st.markdown("##### 📋 Velocity таблиця (всі SKU з продажами)")
-                sku_all = sku_vel.groupby("sku").agg(
+                sku_all = sku_vel.groupby("sku", observed=True).agg(
                     units=("units","sum"), revenue=("revenue","sum"), orders=("orders","sum")
                 ).reset_index()
                 sku_all["vel/день"] = (sku_all["units"] / 30).round(2)
@@ -1403,10 +1695,26 @@ def show_overview_insights(df_inventory):
 # ============================================
 
 def get_db_schema():
-    schema = """
-РЕАЛЬНІ ТАБЛИЦІ В БАЗІ ДАНИХ PostgreSQL (використовуй ТОЧНО ці назви):
+    # Типізовані копії (схема bi) — якщо вже побудовані, даємо моделі їх, без CAST-ів
+    try:
+        typed = _typed.ready_views(get_engine())
+    except Exception:
+        typed = set()
+
+    if "sales_traffic" in typed:
+        traffic = """1. bi.sales_traffic — трафік і продажі по ASIN (типізована копія spapi.sales_traffic)
+   ВАЖЛИВО: запит FROM bi.sales_traffic
+   Колонки (точні назви):
+   - report_day (DATE) — дата звіту (для фільтрів і GROUP BY)
+   - child_asin (TEXT) — ASIN товару
+   - parent_asin (TEXT), granularity (TEXT)
 
-1. spapi.sales_traffic — трафік і продажі по ASIN (схема: spapi)
+   Числові колонки вже NUMERIC — CAST НЕ ПОТРІБЕН:
+   sessions, page_views, page_views_percentage, buy_box_percentage,
+   units_ordered, units_ordered_b2b, unit_session_percentage,
+   ordered_product_sales, ordered_product_sales_b2b, total_order_items, session_percentage"""
+    else:
+        traffic = """1. spapi.sales_traffic — трафік і продажі по ASIN (схема: spapi)
    ВАЖЛИВО: таблиця в схемі spapi, запит: FROM spapi.sales_traffic
    Колонки (точні назви):
    - report_date (DATE) — дата звіту
@@ -1424,30 +1732,74 @@ def get_db_schema():
    - ordered_product_sales → CAST(ordered_product_sales AS FLOAT)
    - ordered_product_sales_b2b → CAST(ordered_product_sales_b2b AS FLOAT)
    - total_order_items → CAST(total_order_items AS FLOAT)
-   - session_percentage → CAST(session_percentage AS FLOAT)
+   - session_percentage → CAST(session_percentage AS FLOAT)"""
+
+    if "settlements" in typed:
+        settlements = """3. bi.settlements — фінансові розрахунки Amazon (типізована копія settlements)
+   Колонки: posted_day (DATE), posted_date (TEXT, оригінал), transaction_type,
+   order_id, sku, amount (NUMERIC), quantity (NUMERIC), currency, marketplace"""
+    else:
+        settlements = """3. settlements — фінансові розрахунки Amazon
+   Колонки з подвійними лапками: "Settlement ID", "Posted Date" (DD.MM.YYYY),
+   "Transaction Type", "Order ID", "SKU", "Amount" (TEXT→CAST AS FLOAT),
+   "Currency", "Quantity", "Marketplace\""""
+
+    if "fba_inventory" in typed:
+        inventory = """4. bi.fba_inventory — FBA Inventory (типізована копія, всі знімки)
+   Колонки (великі літери, лапки): "SKU","ASIN","Available","Price","Velocity",
+   "Days of Supply","Store Name","Market Place" — числові вже NUMERIC;
+   snapshot_day (DATE) — день знімка; поточний стан: WHERE snapshot_day = (SELECT MAX(snapshot_day) FROM bi.fba_inventory)
+   ⚠️ "Stock Value" НЕ існує — рахуй: "Available"*"Price\""""
+    else:
+        inventory = """4. fba_inventory — FBA Inventory
+   Група А (великі літери, лапки): "SKU","ASIN","Available","Price","Velocity",
+   "Days of Supply","Store Name","Market Place"
+   ⚠️ "Stock Value" НЕ існує — рахуй: CAST("Available" AS FLOAT)*CAST("Price" AS FLOAT)"""
+
+    if "orders" in typed:
+        orders = """6. bi.orders — замовлення (типізована копія orders)
+   Колонки: amazon_order_id, purchase_day (DATE), purchase_date (TEXT, оригінал),
+   sku, asin, quantity (NUMERIC), item_price (NUMERIC), order_status, ship_country"""
+    else:
+        orders = """6. orders — замовлення. Колонки: "Order ID","Order Date","SKU","ASIN",
+   "Quantity","Item Price","Order Status","Ship Country\""""
+
+    finance = ""
+    if "finance_events" in typed:
+        finance = """
+7. bi.finance_events — фінансові події Amazon (типізована копія finance_events)
+   Колонки: posted_day (DATE), event_type, charge_type, amount (NUMERIC),
+   quantity (NUMERIC), seller_sku, amazon_order_id
+   Gross = event_type='Shipment' AND charge_type='Principal'
+"""
+    if "finance_daily" in typed:
+        finance += """
+8. bi.finance_daily — денні суми finance_events (для P&L/KPI — швидше за bi.finance_events)
+   Колонки: posted_day (DATE), marketplace, sku, event_type, charge_type,
+   amount (NUMERIC, сума), quantity (NUMERIC, сума), n_events (кількість подій)
+"""
+
+    schema = f"""
+РЕАЛЬНІ ТАБЛИЦІ В БАЗІ ДАНИХ PostgreSQL (використовуй ТОЧНО ці назви):
+
+{traffic}
 
 2. amazon_reviews — відгуки покупців
    Колонки: id, asin, domain, rating (INT 1-5), title, content, author,
    review_date (DATE), is_verified (BOOL), product_attributes, scraped_at
 
-3. settlements — фінансові розрахунки Amazon
-   Колонки з подвійними лапками: "Settlement ID", "Posted Date" (DD.MM.YYYY),
-   "Transaction Type", "Order ID", "SKU", "Amount" (TEXT→CAST AS FLOAT),
-   "Currency", "Quantity", "Marketplace"
+{settlements}
 
-4. fba_inventory — FBA Inventory
-   Група А (великі літери, лапки): "SKU","ASIN","Available","Price","Velocity",
-   "Days of Supply","Store Name","Market Place"
-   ⚠️ "Stock Value" НЕ існує — рахуй: CAST("Available" AS FLOAT)*CAST("Price" AS FLOAT)
+{inventory}
 
 5. returns — повернення. Колонки: "Order ID","Return Date","SKU","ASIN",
    "Quantity","Reason","Status","Customer Comments"
 
-6. orders — замовлення. Колонки: "Order ID","Order Date","SKU","ASIN",
-   "Quantity","Item Price","Order Status","Ship Country"
-
+{orders}
+{finance}
 КРИТИЧНІ ПРАВИЛА:
-- spapi.sales_traffic: завжди FROM spapi.sales_traffic
+- Таблиці bi.* вже типізовані: дати — DATE, числа — NUMERIC, CAST не потрібен
+- spapi.sales_traffic: завжди FROM spapi.sales_traffic (якщо немає bi.sales_traffic)
 - Завжди LIMIT 50, тільки SELECT/WITH
 - Колонки з великої літери — в подвійних лапках
 - NULLIF для уникнення ділення на нуль
@@ -1509,7 +1861,8 @@ def run_ai_sql_pipeline(question: str, section_key: str, gemini_model, context:
             ('"Quantity"', 'INT'), ('"Item Price"', 'FLOAT'),
             ('"Amount"', 'FLOAT'),
         ]
-        for _col, _type in _nullif_pairs:
+        # bi.* вже NUMERIC — NULLIF(число, '') там впаде
+        for _col, _type in ([] if 'bi.' in sql_query else _nullif_pairs):
             _old = f'CAST({_col} AS {_type})'
             _new = f"CAST(NULLIF({_col}, '') AS {_type})"
             sql_query = sql_query.replace(_old, _new)
@@ -1852,18 +2205,16 @@ def show_inventory_unified():
     # Підтягуємо avg daily revenue по SKU з orders (останні 30 днів)
     try:
         with engine.connect() as conn:
-            rev_by_sku = pd.read_sql(text("""
+            rev_by_sku = pd.read_sql(text(f"""
                 SELECT
-                    sku,
-                    SUM(CASE WHEN item_price ~ '^[0-9.]+$'
-                        THEN item_price::numeric ELSE 0 END) AS revenue_30d,
-                    SUM(CASE WHEN quantity ~ '^[0-9]+$'
-                        THEN quantity::numeric ELSE 1 END)   AS units_30d,
-                    COUNT(DISTINCT amazon_order_id)           AS orders_30d
-                FROM orders
-                WHERE SUBSTRING(purchase_date, 1, 10)::date >= CURRENT_DATE - INTERVAL '30 days'
-                  AND sku IS NOT NULL AND sku != ''
-                GROUP BY sku
+                    o.sku,
+                    SUM(COALESCE(o.item_price, 0))    AS revenue_30d,
+                    SUM(COALESCE(o.quantity, 1))      AS units_30d,
+                    COUNT(DISTINCT o.amazon_order_id) AS orders_30d
+                FROM {tv('orders', 'o')}
+                WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '30 days'
+                  AND o.sku IS NOT NULL AND o.sku != ''
+                GROUP BY o.sku
             """), conn)
     except Exception:
         rev_by_sku = pd.DataFrame()
@@ -2350,6 +2701,128 @@ def show_etl_status():
     if empty_cnt > 0:  st.info(f"⏳ {empty_cnt} таблиць порожні")
     if ok_cnt == len(modules): st.success("✅ Всі завантажувачі працюють нормально!")
 
+    # ── Типізовані копії (bi.*) — оновлюються фоном після кожного завантаження ──
+    st.markdown("---")
+    st.markdown("#### 🧮 Типізовані таблиці (bi)")
+    tv_rows = _typed.status(engine)
+    if tv_rows:
+        st.dataframe(pd.DataFrame([{
+            "Таблиця":   f"bi.{r['view_name']}",
+            "Рядків":    f"{int(r['row_count'] or 0):,}",
+            "Watermark": str(r['watermark'] or "—"),
+            "Оновлено":  str(r['refreshed_at'])[:19] if r['refreshed_at'] else "—",
+            "Повна":     str(r.get('full_at'))[:19] if r.get('full_at') else "—",
+            "Секунд":    r['duration_sec'],
+        } for r in tv_rows]), width="stretch", hide_index=True)
+    else:
+        st.info("⏳ bi.* ще не побудовані — запити йдуть у сирі таблиці з кастами")
+    if st.button("🔄 Оновити bi зараз", key="typed_refresh_now"):
+        with st.spinner("Оновлення..."):
+            st.write(_typed.refresh(engine, force=True))
+
+    # ── Індекси гарячих запитів (query_indexes.py) — перевірка EXPLAIN при старті ──
+    st.markdown("---")
+    st.markdown("#### 🧭 Індекси гарячих запитів")
+    qi_rows = _qidx.LAST_REPORT
+    if st.button("🔍 Перевірити плани зараз", key="qidx_verify"):
+        with st.spinner("EXPLAIN..."):
+            qi_rows = _qidx.verify(engine)
+    if qi_rows:
+        bad = [r for r in qi_rows if r["warning"]]
+        if bad:
+            st.warning(f"⚠️ {len(bad)} гарячих запитів без індексу — див. таблицю")
+        st.dataframe(pd.DataFrame([{
+            "Запит":   r["where"],
+            "Індекс":  r["index"],
+            "Таблиця": r["table"],
+            "Рядків":  f"{r['rows']:,}" if r["rows"] is not None else "—",
+            "План":    r["plan"] or "—",
+            "⚠️":      r["warning"],
+        } for r in qi_rows]), width="stretch", hide_index=True)
+    else:
+        st.info("⏳ Перевірка ще не виконувалась (фоновий потік при старті)")
+
+    # ── Продуктивність запитів (query_stats.py) — ковзне вікно останніх QUERY_STATS_MAX ──
+    st.markdown("---")
+    st.markdown("#### ⏱️ Запити: найповільніші / найважчі сторінки")
+    qs = _qstats.stats()
+    st.caption(f"Останні {qs['records']:,} з {qs['max_records']:,} запитів "
+               f"за {qs['window_sec'] / 60:.0f} хв · цей процес, усі сесії · байти — оцінка за вибіркою рядків")
+    pg_rows = _qstats.pages()
+    if pg_rows:
+        st.dataframe(pd.DataFrame([{
+            "Сторінка":    p["page"],
+            "Рендерів":    p["runs"],
+            "Запитів":     p["queries"],
+            "Різних SQL":  p["distinct_sql"],
+            "БД, с":       round(p["db_sec"], 2),
+            "С / рендер":  round(p["sec_per_run"], 2) if p["sec_per_run"] is not None else "—",
+            "Рядків":      f"{p['rows']:,}",
+            "≈MB":         round(p["bytes"] / 1e6, 1),
+        } for p in pg_rows]), width="stretch", hide_index=True)
+        slow = _qstats.slowest(20)
+        st.dataframe(pd.DataFrame([{
+            "Відбиток":  q["fp"],
+            "Викликів":  q["calls"],
+            "Σ, с":      round(q["total_sec"], 2),
+            "Сер., с":   round(q["avg_sec"], 3),
+            "Макс, с":   round(q["max_sec"], 2),
+            "Рядків":    f"{q['rows']:,}",
+            "≈MB":       round(q["bytes"] / 1e6, 1),
+            "Сторінки":  ", ".join(q["pages"]),
+            "SQL":       q["sql"][:300],
+        } for q in slow]), width="stretch", hide_index=True,
+            height=min(50 + len(slow) * 35, 600))
+    else:
+        st.info("⏳ Запитів ще не зафіксовано")
+    if st.button("🧹 Скинути статистику запитів", key="qstats_clear"):
+        _qstats.clear()
+        st.rerun()
+
+    # ── Спільний кеш даних (один на процес, для всіх сесій) ──
+    st.markdown("---")
+    st.markdown("#### 🗄️ Кеш даних")
+    cs = _frames.CACHE.stats()
+    hits   = sum(i["hits"] for i in cs["items"])
+    misses = sum(i["misses"] for i in cs["items"])
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Пам'ять", f"{cs['used_mb']:.0f} / {cs['budget_mb']:.0f} MB")
+    c2.metric("Записів", cs["entries"])
+    c3.metric("Hit rate", f"{hits / (hits + misses) * 100:.0f}%" if hits + misses else "—")
+    c4.metric("Витіснено", cs["evictions"])
+    if cs["items"]:
+        st.dataframe(pd.DataFrame([{
+            "Функція": i["name"],
+            "Аргументи": i["args"][:120],
+            "MB":      i["mb"],
+            "Hits":    i["hits"],
+            "Misses":  i["misses"],
+            "Вік, с":  i["age_sec"],
+            "TTL, с":  i["ttl_sec"] or "інкрем.",
+        } for i in cs["items"]]), width="stretch", hide_index=True,
+            height=min(50 + len(cs["items"]) * 35, 450))
+    dt_rows = _frames.dtype_report()
+    if dt_rows:
+        st.caption("Компактні dtype: пам'ять кадру до / після (category, int32)")
+        st.dataframe(pd.DataFrame([{
+            "Loader":    r["name"],
+            "Рядків":    f"{r['rows']:,}",
+            "До, MB":    r["before_mb"],
+            "Після, MB": r["after_mb"],
+            "Стиснення": f"×{r['before_mb'] / r['after_mb']:.1f}" if r["after_mb"] else "—",
+            "category":  r["category"],
+        } for r in dt_rows]), width="stretch", hide_index=True)
+    fr_rows = _frames.stats()
+    if fr_rows:
+        st.caption("Інкрементальні кадри (orders / reviews): повні / дочитування / рядків з БД / "
+                   "піднято з диска після рестарту "
+                   + (f"(`{_frames.DISK_DIR}`)" if _frames.DISK_DIR else "— вимкнено, задайте FRAME_CACHE_DIR"))
+        st.dataframe(pd.DataFrame(fr_rows).astype({"key": str}), width="stretch", hide_index=True)
+    st.caption("Бюджет — FRAME_CACHE_MB; найдовше невикористані записи витісняються першими")
+    if st.button("🧹 Очистити кеш", key="frame_cache_clear"):
+        _frames.clear()
+        st.rerun()
+
 
 def show_api_docs():
     st.markdown("## 🔌 API — доступ до даних")
@@ -2503,36 +2976,118 @@ def show_overview(df_filtered, t, selected_date):
 
     engine = get_engine()
 
+    # Усі запити сторінки незалежні — стартують разом, секції нижче лише читають результати
+    pre = _prefetch.prefetch(engine, {
+        "fin": f"""
+            SELECT
+              SUM(CASE WHEN f.event_type='Shipment' AND f.charge_type='Principal'
+                  THEN f.amount ELSE 0 END) AS gross,
+              SUM(CASE WHEN f.event_type IN ('ShipmentFee','RefundFee')
+                  THEN f.amount ELSE 0 END) AS fees,
+              SUM(CASE WHEN f.event_type='Refund' AND f.charge_type='Principal'
+                  THEN f.amount ELSE 0 END) AS refs,
+              SUM(CASE WHEN f.event_type='ShipmentPromo'
+                  THEN f.amount ELSE 0 END) AS promos,
+              SUM(CASE WHEN f.event_type='Adjustment'
+                  THEN f.amount ELSE 0 END) AS adj
+            FROM {tv('finance_daily', 'f')}
+            WHERE f.posted_day >= CURRENT_DATE - 30
+        """,
+        "orders30": f"SELECT COUNT(DISTINCT o.amazon_order_id) as cnt FROM {tv('orders', 'o')} WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '30 days'",
+        "ret": (
+            "SELECT COUNT(DISTINCT order_id) as ret, "
+            f"(SELECT COUNT(DISTINCT o.amazon_order_id) FROM {tv('orders', 'o')} "
+            " WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '30 days') as ord "
+            "FROM fba_returns WHERE SUBSTRING(return_date::text,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'"
+        ),
+        "bb": (
+            "SELECT COUNT(*) as total, "
+            "SUM(CASE WHEN is_buybox_winner=true OR is_buybox_winner='True' THEN 1 ELSE 0 END) as won "
+            "FROM pricing_buybox"
+        ),
+        "top": (
+            "SELECT o.sku, SUM(o.item_price) as rev, COUNT(*) as orders "
+            f"FROM {tv('orders', 'o')} WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '30 days' "
+            "AND o.item_price IS NOT NULL "
+            "GROUP BY o.sku ORDER BY rev DESC LIMIT 5"
+        ),
+        "ret_trend": f"""
+            SELECT m.month,
+                COALESCE(r.returns,0) AS returns,
+                COALESCE(o.orders,1) AS orders
+            FROM (
+                SELECT SUBSTRING(return_date::text,1,7) AS month
+                FROM fba_returns
+                WHERE SUBSTRING(return_date::text,1,10)::date >= CURRENT_DATE - INTERVAL '6 months'
+                GROUP BY 1
+            ) m
+            LEFT JOIN (
+                SELECT SUBSTRING(return_date::text,1,7) AS month, COUNT(DISTINCT order_id) AS returns
+                FROM fba_returns GROUP BY 1
+            ) r ON r.month = m.month
+            LEFT JOIN (
+                SELECT TO_CHAR(o.purchase_day, 'YYYY-MM') AS month, COUNT(DISTINCT o.amazon_order_id) AS orders
+                FROM {tv('orders', 'o')} GROUP BY 1
+            ) o ON o.month = m.month
+            ORDER BY 1
+        """,
+        "bb_lost": (
+            "SELECT asin, price FROM pricing_buybox "
+            "WHERE is_buybox_winner::text NOT IN ('true','True','t','1','yes') "
+            "ORDER BY price DESC LIMIT 8"
+        ),
+        "mom": f"""
+            SELECT
+                SUM(CASE WHEN o.purchase_day >= date_trunc('month', CURRENT_DATE)
+                    THEN o.item_price ELSE 0 END) AS this_month,
+                SUM(CASE WHEN o.purchase_day < date_trunc('month', CURRENT_DATE)
+                    THEN o.item_price ELSE 0 END) AS last_month,
+                COUNT(DISTINCT CASE WHEN o.purchase_day >= date_trunc('month', CURRENT_DATE)
+                    THEN o.amazon_order_id END) AS this_orders,
+                COUNT(DISTINCT CASE WHEN o.purchase_day < date_trunc('month', CURRENT_DATE)
+                    THEN o.amazon_order_id END) AS last_orders
+            FROM {tv('orders', 'o')}
+            WHERE o.purchase_day >= date_trunc('month', CURRENT_DATE - INTERVAL '1 month')
+              AND o.purchase_day <  date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+        """,
+        "inb": (
+            "SELECT s.shipment_id, s.shipment_name, s.shipment_status, s.destination_fc, "
+            "SUM(NULLIF(i.quantity_shipped,'')::numeric) as shipped, SUM(NULLIF(i.quantity_received,'')::numeric) as received "
+            "FROM fba_shipments s "
+            "LEFT JOIN fba_shipment_items i ON s.shipment_id = i.shipment_id "
+            "WHERE s.shipment_status IN ('WORKING','SHIPPED','IN_TRANSIT','RECEIVING') "
+            "GROUP BY 1,2,3,4 ORDER BY MAX(s.created_at) DESC LIMIT 10"
+        ),
+        "daily": (
+            "SELECT o.purchase_day AS d, "
+            "SUM(o.item_price) AS rev "
+            f"FROM {tv('orders', 'o')} "
+            "WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '30 days' "
+            "AND o.item_price IS NOT NULL "
+            "GROUP BY 1 ORDER BY 1"
+        ),
+        "ord_d": (
+            "SELECT o.purchase_day AS d, COUNT(DISTINCT o.amazon_order_id) AS cnt "
+            f"FROM {tv('orders', 'o')} "
+            "WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '30 days' "
+            "GROUP BY 1 ORDER BY 1"
+        ),
+    })
+
     # ══════════════════════════════════════
     # 1. ФІНАНСИ (з finance_events, 30 днів)
     # ══════════════════════════════════════
     net=gross=fees=refs=promos=adj=0; fin_orders=0
     try:
-        with engine.connect() as conn:
-            fr = pd.read_sql(text("""
-                SELECT
-                  SUM(CASE WHEN event_type='Shipment' AND charge_type='Principal'
-                      THEN NULLIF(amount,'')::numeric ELSE 0 END) AS gross,
-                  SUM(CASE WHEN event_type IN ('ShipmentFee','RefundFee')
-                      THEN NULLIF(amount,'')::numeric ELSE 0 END) AS fees,
-                  SUM(CASE WHEN event_type='Refund' AND charge_type='Principal'
-                      THEN NULLIF(amount,'')::numeric ELSE 0 END) AS refs,
-                  SUM(CASE WHEN event_type='ShipmentPromo'
-                      THEN NULLIF(amount,'')::numeric ELSE 0 END) AS promos,
-                  SUM(CASE WHEN event_type='Adjustment'
-                      THEN NULLIF(amount,'')::numeric ELSE 0 END) AS adj
-                FROM finance_events
-                WHERE posted_date IS NOT NULL AND posted_date != ''
-                  AND SUBSTRING(posted_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'
-            """), conn).iloc[0]
-            gross = float(fr["gross"] or 0)
-            fees  = float(fr["fees"]  or 0)
-            refs  = float(fr["refs"]  or 0)
-            promos= float(fr["promos"] or 0)
-            adj   = float(fr["adj"]   or 0)
-            net   = gross + fees + refs + promos + adj
-            oc = pd.read_sql(text("SELECT COUNT(DISTINCT amazon_order_id) as cnt FROM orders WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'"), conn).iloc[0]
-            fin_orders = int(oc["cnt"] or 0)
+        fr    = pre["fin"].iloc[0]
+        gross = float(fr["gross"] or 0)
+        fees  = float(fr["fees"]  or 0)
+        refs  = float(fr["refs"]  or 0)
+        promos= float(fr["promos"] or 0)
+        adj   = float(fr["adj"]   or 0)
+        net   = gross + fees + refs + promos + adj
+        oc = pre["orders30"].iloc[0]
+        fin_orders = int(oc["cnt"] or 0)
     except: pass
 
     margin_pct = net/gross*100 if gross > 0 else 0
@@ -2556,26 +3111,15 @@ def show_overview(df_filtered, t, selected_date):
     # ══════════════════════════════════════
     rr_pct=0; bb_pct=0; bb_lost=0
     try:
-        with engine.connect() as conn:
-            ret_r = pd.read_sql(text(
-                "SELECT COUNT(DISTINCT order_id) as ret, "
-                "(SELECT COUNT(DISTINCT amazon_order_id) FROM orders "
-                " WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days') as ord "
-                "FROM fba_returns WHERE SUBSTRING(return_date::text,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'"
-            ), conn).iloc[0]
-            rr_pct = float(ret_r["ret"] or 0) / float(ret_r["ord"] or 1) * 100
+        ret_r  = pre["ret"].iloc[0]
+        rr_pct = float(ret_r["ret"] or 0) / float(ret_r["ord"] or 1) * 100
     except: pass
     try:
-        with engine.connect() as conn:
-            bb_r = pd.read_sql(text(
-                "SELECT COUNT(*) as total, "
-                "SUM(CASE WHEN is_buybox_winner=true OR is_buybox_winner='True' THEN 1 ELSE 0 END) as won "
-                "FROM pricing_buybox"
-            ), conn).iloc[0]
-            total_bb = int(bb_r["total"] or 0)
-            won_bb   = int(bb_r["won"]   or 0)
-            bb_pct   = won_bb/total_bb*100 if total_bb > 0 else 0
-            bb_lost  = total_bb - won_bb
+        bb_r     = pre["bb"].iloc[0]
+        total_bb = int(bb_r["total"] or 0)
+        won_bb   = int(bb_r["won"]   or 0)
+        bb_pct   = won_bb/total_bb*100 if total_bb > 0 else 0
+        bb_lost  = total_bb - won_bb
     except: pass
 
     # ══════════════════════════════════════
@@ -2674,13 +3218,7 @@ def show_overview(df_filtered, t, selected_date):
     with col2:
         st.markdown("#### 🏆 Топ 5 SKU (продажі 30д)")
         try:
-            with engine.connect() as conn:
-                df_top = pd.read_sql(text(
-                    "SELECT sku, SUM(item_price::numeric) as rev, COUNT(*) as orders "
-                    "FROM orders WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days' "
-                    "AND item_price ~ '^[0-9.]+$' "
-                    "GROUP BY sku ORDER BY rev DESC LIMIT 5"
-                ), conn)
+            df_top = pre["top"]
             if not df_top.empty:
                 fig_top = go.Figure(go.Bar(
                     x=df_top["rev"], y=df_top["sku"], orientation="h",
@@ -2703,27 +3241,7 @@ def show_overview(df_filtered, t, selected_date):
     with col1:
         st.markdown("#### 🔴 Returns тренд")
         try:
-            with engine.connect() as conn:
-                df_ret_trend = pd.read_sql(text("""
-                    SELECT m.month,
-                        COALESCE(r.returns,0) AS returns,
-                        COALESCE(o.orders,1) AS orders
-                    FROM (
-                        SELECT SUBSTRING(return_date::text,1,7) AS month
-                        FROM fba_returns
-                        WHERE SUBSTRING(return_date::text,1,10)::date >= CURRENT_DATE - INTERVAL '6 months'
-                        GROUP BY 1
-                    ) m
-                    LEFT JOIN (
-                        SELECT SUBSTRING(return_date::text,1,7) AS month, COUNT(DISTINCT order_id) AS returns
-                        FROM fba_returns GROUP BY 1
-                    ) r ON r.month = m.month
-                    LEFT JOIN (
-                        SELECT SUBSTRING(purchase_date,1,7) AS month, COUNT(DISTINCT amazon_order_id) AS orders
-                        FROM orders GROUP BY 1
-                    ) o ON o.month = m.month
-                    ORDER BY 1
-                """), conn)
+            df_ret_trend = pre["ret_trend"]
             if not df_ret_trend.empty:
                 df_ret_trend['rr'] = (df_ret_trend['returns'] / df_ret_trend['orders'].replace(0,1) * 100).clip(0,50).round(1)
                 colors_ret = ['#F44336' if v > 10 else '#FFC107' if v > 5 else '#4CAF50' for v in df_ret_trend['rr']]
@@ -2745,12 +3263,7 @@ def show_overview(df_filtered, t, selected_date):
     with col2:
         st.markdown("#### ⚠️ BuyBox Lost ASIN")
         try:
-            with engine.connect() as conn:
-                df_bb_lost = pd.read_sql(text(
-                    "SELECT asin, price FROM pricing_buybox "
-                    "WHERE is_buybox_winner::text NOT IN ('true','True','t','1','yes') "
-                    "ORDER BY price DESC LIMIT 8"
-                ), conn)
+            df_bb_lost = pre["bb_lost"]
             if not df_bb_lost.empty:
                 df_bb_lost['price'] = pd.to_numeric(df_bb_lost['price'], errors='coerce').fillna(0)
                 st.dataframe(df_bb_lost.style.format({'price':'${:.2f}'}),
@@ -2763,19 +3276,7 @@ def show_overview(df_filtered, t, selected_date):
     with col3:
         st.markdown("#### 📊 Цей місяць vs минулий")
         try:
-            with engine.connect() as conn:
-                df_mom = pd.read_sql(text("""
-                    SELECT
-                        SUM(CASE WHEN SUBSTRING(purchase_date,1,7) = TO_CHAR(CURRENT_DATE,'YYYY-MM')
-                            AND item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS this_month,
-                        SUM(CASE WHEN SUBSTRING(purchase_date,1,7) = TO_CHAR(CURRENT_DATE - INTERVAL '1 month','YYYY-MM')
-                            AND item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS last_month,
-                        COUNT(DISTINCT CASE WHEN SUBSTRING(purchase_date,1,7) = TO_CHAR(CURRENT_DATE,'YYYY-MM')
-                            THEN amazon_order_id END) AS this_orders,
-                        COUNT(DISTINCT CASE WHEN SUBSTRING(purchase_date,1,7) = TO_CHAR(CURRENT_DATE - INTERVAL '1 month','YYYY-MM')
-                            THEN amazon_order_id END) AS last_orders
-                    FROM orders
-                """), conn).iloc[0]
+            df_mom = pre["mom"].iloc[0]
             this_m = float(df_mom['this_month'] or 0)
             last_m = float(df_mom['last_month'] or 0)
             chg    = (this_m - last_m) / last_m * 100 if last_m > 0 else 0
@@ -2797,15 +3298,7 @@ def show_overview(df_filtered, t, selected_date):
     st.markdown("---")
     st.markdown("#### 🚚 Inbound shipments (активні)")
     try:
-        with engine.connect() as conn:
-            df_inb = pd.read_sql(text(
-                "SELECT s.shipment_id, s.shipment_name, s.shipment_status, s.destination_fc, "
-                "SUM(NULLIF(i.quantity_shipped,'')::numeric) as shipped, SUM(NULLIF(i.quantity_received,'')::numeric) as received "
-                "FROM fba_shipments s "
-                "LEFT JOIN fba_shipment_items i ON s.shipment_id = i.shipment_id "
-                "WHERE s.shipment_status IN ('WORKING','SHIPPED','IN_TRANSIT','RECEIVING') "
-                "GROUP BY 1,2,3,4 ORDER BY MAX(s.created_at) DESC LIMIT 10"
-            ), conn)
+        df_inb = pre["inb"]
         if not df_inb.empty:
             df_inb['received'] = df_inb['received'].fillna(0).astype(int)
             df_inb['shipped']  = df_inb['shipped'].fillna(0).astype(int)
@@ -2827,15 +3320,7 @@ def show_overview(df_filtered, t, selected_date):
     with col1:
         st.markdown("**Денна виручка**")
         try:
-            with engine.connect() as conn:
-                df_daily = pd.read_sql(text(
-                    "SELECT SUBSTRING(purchase_date,1,10)::date AS d, "
-                    "SUM(item_price::numeric) AS rev "
-                    "FROM orders "
-                    "WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days' "
-                    "AND item_price ~ '^[0-9.]+$' "
-                    "GROUP BY 1 ORDER BY 1"
-                ), conn)
+            df_daily = pre["daily"]
             if not df_daily.empty:
                 fig_d = go.Figure(go.Bar(
                     x=df_daily["d"], y=df_daily["rev"],
@@ -2851,13 +3336,7 @@ def show_overview(df_filtered, t, selected_date):
     with col2:
         st.markdown("**Щоденні замовлення**")
         try:
-            with engine.connect() as conn:
-                df_ord_d = pd.read_sql(text(
-                    "SELECT SUBSTRING(purchase_date,1,10)::date AS d, COUNT(DISTINCT amazon_order_id) AS cnt "
-                    "FROM orders "
-                    "WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days' "
-                    "GROUP BY 1 ORDER BY 1"
-                ), conn)
+            df_ord_d = pre["ord_d"]
             if not df_ord_d.empty:
                 fig_od = go.Figure(go.Scatter(
                     x=df_ord_d["d"], y=df_ord_d["cnt"],
@@ -2888,19 +3367,17 @@ def show_overview(df_filtered, t, selected_date):
 
 
 def show_sales_traffic(t):
-    df_st = load_sales_traffic()
-    if df_st.empty:
+    # Межі періоду — окремим MIN/MAX, а рядки тягнемо лише за вибраний діапазон
+    min_date, max_date = load_date_bounds('sales_traffic', _st_date_expr(), 'spapi')
+    if min_date is None:
         st.warning("⚠️ No Sales & Traffic data found."); return
-    min_date = df_st['report_date'].min().date()
-    max_date = df_st['report_date'].max().date()
     date_range = st.sidebar.date_input(t["st_date_range"],
         value=(max(min_date, max_date-dt.timedelta(days=14)), max_date),
         min_value=min_date, max_value=max_date, key="st_date_range")
     if len(date_range)==2:
-        mask = (df_st['report_date'].dt.date>=date_range[0])&(df_st['report_date'].dt.date<=date_range[1])
-        df_filtered = df_st[mask]
+        df_filtered = load_sales_traffic(ST_PAGE_COLUMNS, str(date_range[0]), str(date_range[1]))
     else:
-        df_filtered = df_st
+        df_filtered = load_sales_traffic(ST_PAGE_COLUMNS)
     if df_filtered.empty:
         st.warning("No data for selected period"); return
     st.markdown(f"### {t['sales_traffic_title']}")
@@ -2947,7 +3424,7 @@ def show_sales_traffic(t):
 
     # ── Інсайти ──
     asin_col = 'child_asin' if 'child_asin' in df_filtered.columns else df_filtered.columns[0]
-    as_ = df_filtered.groupby(asin_col).agg(
+    as_ = df_filtered.groupby(asin_col, observed=True).agg(
         {'sessions':'sum','units_ordered':'sum','ordered_product_sales':'sum','buy_box_percentage':'mean'}
     ).reset_index()
     as_.columns = ['ASIN','Sessions','Units','Revenue','Buy Box %']
@@ -2955,7 +3432,7 @@ def show_sales_traffic(t):
     insights_sales_traffic(df_filtered, as_)
 
     st.markdown("---"); st.markdown(t["st_daily_trends"])
-    daily = df_filtered.groupby(df_filtered['report_date'].dt.date).agg(
+    daily = df_filtered.groupby(df_filtered['report_date'].dt.date, observed=True).agg(
         {'sessions':'sum','page_views':'sum','units_ordered':'sum','ordered_product_sales':'sum'}).reset_index()
     daily.columns = ['Date','Sessions','Page Views','Units','Revenue']
     daily['Conversion %'] = (daily['Units']/daily['Sessions']*100).fillna(0)
@@ -2980,7 +3457,7 @@ def show_sales_traffic(t):
     st.plotly_chart(fig_conv, width="stretch")
     st.markdown("---"); st.markdown(t["st_top_asins"])
     asin_col = 'child_asin' if 'child_asin' in df_filtered.columns else df_filtered.columns[0]
-    as_ = df_filtered.groupby(asin_col).agg({'sessions':'sum','page_views':'sum','units_ordered':'sum','ordered_product_sales':'sum','buy_box_percentage':'mean'}).reset_index()
+    as_ = df_filtered.groupby(asin_col, observed=True).agg({'sessions':'sum','page_views':'sum','units_ordered':'sum','ordered_product_sales':'sum','buy_box_percentage':'mean'}).reset_index()
     as_.columns=['ASIN','Sessions','Page Views','Units','Revenue','Buy Box %']
     as_['Conv %'] = (as_['Units']/as_['Sessions']*100).fillna(0)
     col1,col2 = st.columns(2)
@@ -3217,7 +3694,7 @@ def render_money_on_table(eng):
 
     # Розбивка по типу
     st.markdown("#### За типом claim")
-    by_type = df.groupby('claim_type', as_index=False).agg(
+    by_type = df.groupby('claim_type', as_index=False, observed=True).agg(
         units_lost=('units_lost', 'sum'),
         units_paid=('units_paid', 'sum'),
         gap_units=('gap_units', 'sum'),
@@ -3365,7 +3842,7 @@ def show_settlements(t):
     try:
         with engine.connect() as conn:
             bounds = pd.read_sql(text(
-                "SELECT MIN(posted_date)::date as mn, MAX(posted_date)::date as mx FROM settlements"
+                f"SELECT MIN({day_of('settlements')}) as mn, MAX({day_of('settlements')}) as mx FROM settlements"
             ), conn).iloc[0]
         min_date = bounds['mn']
         max_date = bounds['mx']
@@ -3382,30 +3859,30 @@ def show_settlements(t):
     # ══════════════════════════════════════════
     # KPI з settlements
     # ══════════════════════════════════════════
-    # ── KPI з finance_events (повні дані 1.15M рядків) ──
+    # ── KPI з finance_events (денний rollup bi.finance_daily замість 1.15M рядків) ──
     try:
         with engine.connect() as conn:
-            fe_main = pd.read_sql(text("""
+            fe_main = pd.read_sql(text(f"""
                 SELECT
                     -- Gross БЕЗ Tax (Tax збирає Amazon для держави, не наші гроші)
-                    SUM(CASE WHEN event_type = 'Shipment'
-                         AND charge_type = 'Principal'
-                         AND COALESCE(charge_type,'') != 'Tax'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END)          AS gross_sales,
-                    SUM(CASE WHEN event_type = 'Refund' AND charge_type = 'Principal'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END)          AS refunds,
-                    SUM(CASE WHEN event_type IN ('ShipmentFee','RefundFee')
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END)          AS fees,
-                    SUM(CASE WHEN event_type = 'ShipmentPromo'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END)          AS promos,
+                    SUM(CASE WHEN f.event_type = 'Shipment'
+                         AND f.charge_type = 'Principal'
+                         AND COALESCE(f.charge_type,'') != 'Tax'
+                        THEN f.amount ELSE 0 END)                              AS gross_sales,
+                    SUM(CASE WHEN f.event_type = 'Refund' AND f.charge_type = 'Principal'
+                        THEN f.amount ELSE 0 END)                              AS refunds,
+                    SUM(CASE WHEN f.event_type IN ('ShipmentFee','RefundFee')
+                        THEN f.amount ELSE 0 END)                              AS fees,
+                    SUM(CASE WHEN f.event_type = 'ShipmentPromo'
+                        THEN f.amount ELSE 0 END)                              AS promos,
                     -- Adjustments: компенсації Amazon (lost/damaged)
-                    SUM(CASE WHEN event_type = 'Adjustment'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END)          AS adjustments,
-                    SUM(CASE WHEN event_type = 'RefundFee'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END)          AS refund_fees,
-                    COUNT(*)                                                  AS total_rows
-                FROM finance_events
-                WHERE posted_date BETWEEN :d1 AND :d2
+                    SUM(CASE WHEN f.event_type = 'Adjustment'
+                        THEN f.amount ELSE 0 END)                              AS adjustments,
+                    SUM(CASE WHEN f.event_type = 'RefundFee'
+                        THEN f.amount ELSE 0 END)                              AS refund_fees,
+                    SUM(f.n_events)                                            AS total_rows
+                FROM {tv('finance_daily', 'f')}
+                WHERE f.posted_day BETWEEN :d1 AND :d2
             """), conn, params={"d1": d1, "d2": d2}).iloc[0]
     except Exception as e:
         st.error(f"Помилка завантаження finance_events: {e}"); return
@@ -3425,7 +3902,7 @@ def show_settlements(t):
         with engine.connect() as conn:
             ord_r = pd.read_sql(text(
                 "SELECT COUNT(DISTINCT order_id) AS cnt FROM settlements "
-                "WHERE posted_date BETWEEN :d1 AND :d2 AND order_id IS NOT NULL AND order_id != ''"
+                f"WHERE {day_of('settlements')} BETWEEN :d1 AND :d2 AND order_id IS NOT NULL AND order_id != ''"
             ), conn, params={"d1": d1, "d2": d2}).iloc[0]
             orders = int(ord_r['cnt'] or 0)
     except Exception:
@@ -3523,11 +4000,11 @@ def show_settlements(t):
             st.markdown("#### 📈 Тренд — net за день")
             try:
                 with engine.connect() as conn:
-                    daily = pd.read_sql(text("""
-                        SELECT posted_date::date AS date,
+                    daily = pd.read_sql(text(f"""
+                        SELECT {day_of('settlements')} AS date,
                                SUM(NULLIF(amount,'')::numeric) AS net
                         FROM settlements
-                        WHERE posted_date >= :d1 AND posted_date <= :d2
+                        WHERE {day_of('settlements')} BETWEEN :d1 AND :d2
                         GROUP BY 1 ORDER BY 1
                     """), conn, params={"d1": d1, "d2": d2})
                 fig = go.Figure(go.Bar(
@@ -3543,11 +4020,11 @@ def show_settlements(t):
             st.markdown("#### 💸 По типах amount_type")
             try:
                 with engine.connect() as conn:
-                    by_type = pd.read_sql(text("""
+                    by_type = pd.read_sql(text(f"""
                         SELECT amount_type,
                                SUM(NULLIF(amount,'')::numeric) AS total
                         FROM settlements
-                        WHERE posted_date >= :d1 AND posted_date <= :d2
+                        WHERE {day_of('settlements')} BETWEEN :d1 AND :d2
                           AND amount_type IS NOT NULL AND amount_type != ''
                         GROUP BY 1 ORDER BY 2 DESC
                         LIMIT 15
@@ -3566,12 +4043,12 @@ def show_settlements(t):
         st.markdown("#### 📊 По transaction_type")
         try:
             with engine.connect() as conn:
-                by_tt = pd.read_sql(text("""
+                by_tt = pd.read_sql(text(f"""
                     SELECT transaction_type,
                            COUNT(*) AS cnt,
                            SUM(NULLIF(amount,'')::numeric) AS total
                     FROM settlements
-                    WHERE posted_date >= :d1 AND posted_date <= :d2
+                    WHERE {day_of('settlements')} BETWEEN :d1 AND :d2
                     GROUP BY 1 ORDER BY ABS(SUM(NULLIF(amount,'')::numeric)) DESC
                 """), conn, params={"d1": d1, "d2": d2})
             st.dataframe(
@@ -3584,11 +4061,11 @@ def show_settlements(t):
         st.markdown("#### 📋 Останні транзакції")
         try:
             with engine.connect() as conn:
-                df_raw = pd.read_sql(text("""
+                df_raw = pd.read_sql(text(f"""
                     SELECT posted_date, transaction_type, amount_type,
                            order_id, sku, amount, currency
                     FROM settlements
-                    WHERE posted_date >= :d1 AND posted_date <= :d2
+                    WHERE {day_of('settlements')} BETWEEN :d1 AND :d2
                     ORDER BY posted_date DESC LIMIT 500
                 """), conn, params={"d1": d1, "d2": d2})
             st.dataframe(df_raw, width="stretch", hide_index=True, height=400)
@@ -3606,13 +4083,13 @@ def show_settlements(t):
         st.markdown("#### 📊 Finance Events — по типах подій")
         try:
             with engine.connect() as conn:
-                ev_types = pd.read_sql(text("""
-                    SELECT event_type,
-                           COUNT(*)           AS cnt,
-                           SUM(NULLIF(amount,'')::numeric) AS total
-                    FROM finance_events
-                    WHERE posted_date >= :d1 AND posted_date <= :d2
-                    GROUP BY 1 ORDER BY ABS(SUM(NULLIF(amount,'')::numeric)) DESC
+                ev_types = pd.read_sql(text(f"""
+                    SELECT fe.event_type,
+                           SUM(fe.n_events)   AS cnt,
+                           SUM(fe.amount)     AS total
+                    FROM {tv('finance_daily', 'fe')}
+                    WHERE fe.posted_day BETWEEN :d1 AND :d2
+                    GROUP BY 1 ORDER BY ABS(SUM(fe.amount)) DESC
                     LIMIT 30
                 """), conn, params={"d1": d1, "d2": d2})
 
@@ -3636,14 +4113,14 @@ def show_settlements(t):
         st.markdown("#### 💸 По charge_type (комісії)")
         try:
             with engine.connect() as conn:
-                charges = pd.read_sql(text("""
-                    SELECT charge_type,
-                           COUNT(*)             AS cnt,
-                           SUM(NULLIF(amount,'')::numeric) AS total
-                    FROM finance_events
-                    WHERE posted_date >= :d1 AND posted_date <= :d2
-                      AND charge_type IS NOT NULL AND charge_type != ''
-                    GROUP BY 1 ORDER BY SUM(NULLIF(amount,'')::numeric) ASC
+                charges = pd.read_sql(text(f"""
+                    SELECT fe.charge_type,
+                           SUM(fe.n_events)     AS cnt,
+                           SUM(fe.amount)       AS total
+                    FROM {tv('finance_daily', 'fe')}
+                    WHERE fe.posted_day BETWEEN :d1 AND :d2
+                      AND fe.charge_type IS NOT NULL AND fe.charge_type != ''
+                    GROUP BY 1 ORDER BY SUM(fe.amount) ASC
                     LIMIT 20
                 """), conn, params={"d1": d1, "d2": d2})
 
@@ -3671,14 +4148,14 @@ def show_settlements(t):
         st.markdown("#### 📦 По SKU (топ витрат)")
         try:
             with engine.connect() as conn:
-                by_sku = pd.read_sql(text("""
-                    SELECT seller_sku AS sku,
-                           COUNT(*)             AS cnt,
-                           SUM(NULLIF(amount,'')::numeric) AS total
-                    FROM finance_events
-                    WHERE posted_date >= :d1 AND posted_date <= :d2
-                      AND seller_sku IS NOT NULL AND seller_sku != ''
-                    GROUP BY 1 ORDER BY SUM(NULLIF(amount,'')::numeric) ASC
+                by_sku = pd.read_sql(text(f"""
+                    SELECT fe.sku,
+                           SUM(fe.n_events)     AS cnt,
+                           SUM(fe.amount)       AS total
+                    FROM {tv('finance_daily', 'fe')}
+                    WHERE fe.posted_day BETWEEN :d1 AND :d2
+                      AND fe.sku IS NOT NULL AND fe.sku != ''
+                    GROUP BY 1 ORDER BY SUM(fe.amount) ASC
                     LIMIT 20
                 """), conn, params={"d1": d1, "d2": d2})
             if not by_sku.empty:
@@ -3769,17 +4246,7 @@ def show_returns(t=None):
         st.warning("⚠️ Таблиця returns порожня або не існує"); return
 
     # ── маппінг колонок (будь-який регістр) ──
-    col_map = {}
-    for c in real_cols:
-        lc = c.lower().replace(' ', '_').replace('-', '_')
-        if lc in ('return_date', 'returndate', 'date'):  col_map['date']     = c
-        elif lc in ('sku', 'seller_sku', 'msku'):      col_map['sku']      = c
-        elif lc in ('asin', 'fnsku'):                  col_map['asin']     = c
-        elif lc in ('quantity', 'qty'):                col_map['qty']      = c
-        elif lc in ('reason', 'return_reason', 'detailed_disposition'): col_map['reason'] = c
-        elif lc in ('status', 'return_status', 'disposition'): col_map['status'] = c
-        elif lc in ('order_id', 'orderid', 'amazon_order_id'): col_map['order_id'] = c
-        elif lc in ('product_name', 'title', 'name', 'product_description'): col_map['name'] = c
+    col_map = _returns_col_map(real_cols)
 
     date_c  = col_map.get('date',  real_cols[0])
     sku_c   = col_map.get('sku',   None)
@@ -3828,25 +4295,12 @@ def show_returns(t=None):
     if qty_c:
         df_f[qty_c] = pd.to_numeric(df_f[qty_c], errors='coerce').fillna(1)
 
-    # ── Return Value через orders (item_price по SKU) ──
-    try:
-        with engine.connect() as conn:
-            oc = pd.read_sql(text(
-                "SELECT column_name FROM information_schema.columns "
-                "WHERE table_name='orders' ORDER BY ordinal_position"
-            ), conn)['column_name'].tolist()
-            price_col = next((c for c in oc if c.lower() in ('item_price','item-price','itemprice','price')), None)
-            sku_o_col = next((c for c in oc if c.lower() in ('sku','seller_sku')), None)
-            if price_col and sku_o_col and sku_c:
-                _sql = (f'SELECT "{sku_o_col}" as sku,'
-                        f' AVG(NULLIF("{price_col}",\'\')::numeric) as price'
-                        f' FROM orders WHERE NULLIF("{price_col}",\'\') IS NOT NULL GROUP BY 1')
-                prices = pd.read_sql(text(_sql), conn)
-                price_map = prices.set_index('sku')['price'].to_dict()
-                df_f['_price'] = df_f[sku_c].map(price_map).fillna(0)
-            else:
-                df_f['_price'] = 0
-    except Exception:
+    # ── Return rate і ціна по SKU — агрегатом у SQL (повернення ⟗ замовлення за період) ──
+    rates = load_return_rates(d1, d2)
+    if sku_c and not rates.empty:
+        price_map = return_rate_keys(rates).set_index('key')['price']
+        df_f['_price'] = df_f[sku_c].astype(str).map(price_map).fillna(0)
+    else:
         df_f['_price'] = 0
 
     qty_vals = df_f[qty_c] if qty_c else pd.Series([1]*len(df_f))
@@ -3858,17 +4312,8 @@ def show_returns(t=None):
     unique_sku  = df_f[sku_c].nunique() if sku_c else 0
     avg_val     = df_f['Return Value'].mean()
 
-    # return rate vs orders
-    rr = 0
-    try:
-        with engine.connect() as conn:
-            o_count = pd.read_sql(text(
-                f'SELECT COUNT(DISTINCT "{next((c for c in oc if c.lower() in ("order_id","orderid")), oc[0])}") as cnt FROM orders'
-            ), conn).iloc[0]['cnt']
-            ret_orders = df_f[col_map['order_id']].nunique() if 'order_id' in col_map else 0
-            rr = ret_orders / o_count * 100 if o_count > 0 else 0
-    except Exception:
-        pass
+    # return rate: % замовлень періоду з поверненням
+    rr = return_rate_total(rates)
 
     rr_color = "#4CAF50" if rr <= 3 else "#FFC107" if rr <= 8 else "#F44336"
     st.markdown(f"""
@@ -3914,7 +4359,7 @@ def show_returns(t=None):
 
     with col1:
         st.markdown("#### 📅 Тренд повернень по днях")
-        daily = df_f.groupby(df_f[date_c].dt.date).size().reset_index()
+        daily = df_f.groupby(df_f[date_c].dt.date, observed=True).size().reset_index()
         daily.columns = ['Date', 'Count']
         fig = px.bar(daily, x='Date', y='Count', color_discrete_sequence=['#FF6B6B'])
         fig.update_layout(height=320, margin=dict(l=0,r=0,t=10,b=0))
@@ -3935,7 +4380,7 @@ def show_returns(t=None):
     with col3:
         if sku_c:
             st.markdown("#### 🏆 Топ SKU за кількістю")
-            top_sku = df_f[sku_c].value_counts().head(10).reset_index()
+            top_sku = df_f[sku_c].astype(object).value_counts().head(10).reset_index()
             top_sku.columns = ['SKU', 'Returns']
             fig3 = px.bar(top_sku, x='Returns', y='SKU', orientation='h',
                           color='Returns', color_continuous_scale='Oranges')
@@ -3950,7 +4395,7 @@ def show_returns(t=None):
         with col1:
             if sku_c:
                 st.markdown("#### 💰 Топ SKU за вартістю повернень")
-                tv = df_f.groupby(sku_c)['Return Value'].sum().nlargest(10).reset_index()
+                tv = df_f.groupby(sku_c, observed=True)['Return Value'].sum().nlargest(10).reset_index()
                 fig4 = px.bar(tv, x='Return Value', y=sku_c, orientation='h',
                               color='Return Value', color_continuous_scale='Reds')
                 fig4.update_traces(texttemplate='$%{x:,.0f}', textposition='outside')
@@ -3959,12 +4404,25 @@ def show_returns(t=None):
         with col2:
             if reason_c:
                 st.markdown("#### 💸 Вартість по причинах")
-                rv = df_f.groupby(reason_c)['Return Value'].sum().nlargest(8).reset_index()
+                rv = df_f.groupby(reason_c, observed=True)['Return Value'].sum().nlargest(8).reset_index()
                 fig5 = px.pie(rv, values='Return Value', names=reason_c, hole=0.4)
                 fig5.update_layout(height=350)
                 st.plotly_chart(fig5, width="stretch")
         st.markdown("---")
 
+    # ── Return rate по SKU ──
+    by_sku = return_rate_keys(rates)
+    if not by_sku.empty and by_sku['returns'].sum() > 0:
+        st.markdown("#### 📉 Return rate по SKU")
+        rt = (by_sku[by_sku['returns'] > 0]
+              .sort_values(['returns', 'return_rate'], ascending=False).head(30)
+              [['key', 'returns', 'units_returned', 'orders_returned', 'orders', 'return_rate', 'return_value']]
+              .rename(columns={'key': 'SKU', 'returns': 'Повернень', 'units_returned': 'Од. повернуто',
+                               'orders_returned': 'Замовл. з поверн.', 'orders': 'Замовлень',
+                               'return_rate': 'Return rate %', 'return_value': 'Вартість'}))
+        st.dataframe(rt.style.format({'Return rate %': '{:.1f}%', 'Вартість': '${:,.0f}'}),
+                     width="stretch", hide_index=True)
+
     # ── Таблиця ──
     st.markdown("---")
     st.markdown("#### 📋 Деталі повернень")
@@ -4012,7 +4470,7 @@ def show_inventory_finance(df_filtered, t):
 # ============================================
 # 🔎 SEARCH CATALOGUE PERFORMANCE (scp_child / scp_parent)
 # ============================================
-@st.cache_data(ttl=900)
+@_frames.cached(ttl=900)
 def _scp_query(_engine, sql, params):
     """Кешований запит. _engine з підкресленням — щоб Streamlit його не хешував.
     list/tuple-параметри автоматично розгортаються для IN (...) (expanding bindparam)."""
@@ -4533,7 +4991,7 @@ def _show_sqp_body(t=None):
     st.markdown("### 📦 Наші ASIN в пошуку")
     st.caption("Скільки search terms і яка середня позиція / click share по кожному ASIN")
 
-    asin_perf = df[df['our_asin'] != ''].groupby('our_asin').agg(
+    asin_perf = df[df['our_asin'] != ''].groupby('our_asin', observed=True).agg(
         terms_count=('search_term', 'count'),
         avg_position=('our_position', 'mean'),
         avg_click_share=('our_click_share', 'mean'),
@@ -4636,7 +5094,7 @@ def _show_sqp_body(t=None):
 
     if competitor_rows:
         comp_df = pd.DataFrame(competitor_rows)
-        comp_agg = comp_df.groupby('asin').agg(
+        comp_agg = comp_df.groupby('asin', observed=True).agg(
             appearances=('search_term', 'count'),
             avg_click_share=('click_share', 'mean'),
             avg_position=('position', 'mean'),
@@ -4803,9 +5261,13 @@ def show_reviews(t=None):
     """
     if t is None: t = translations.get("UA", {})
 
-    df = load_reviews()
+    # Період по review_date — віджет у фільтрах над таблицею, значення читаємо зараз
+    rev_min, rev_max = load_date_bounds('amazon_reviews', 'review_date')
+    d1, d2, _, _ = period_compute("rev", max_date=rev_max, default="last_12_months")
+    df = load_reviews(date_from=d1, date_to=d2)
     if df.empty:
         st.warning("⚠️ Немає даних відгуків")
+        period_widget("rev", rev_min, rev_max, default="last_12_months")
         return
 
     # ══════════════════════════════════════════════════════
@@ -4950,7 +5412,7 @@ def show_reviews(t=None):
                                 f"[{r['rating']}★] {r['asin']} · {str(r.get('title',''))[:60]} — {str(r.get('content',''))[:300]}"
                                 for _, r in _df_disp.head(50).iterrows()
                             ])
-                            _asin_counts = _df_disp['asin'].value_counts().head(5).to_dict()
+                            _asin_counts = _df_disp['asin'].astype(object).value_counts().head(5).to_dict()
                             _asin_summary = "; ".join([f"{a}: {c}" for a, c in _asin_counts.items()])
                             _rating_dist = _df_disp['rating'].value_counts().sort_index().to_dict()
                             _rating_str = ", ".join([f"{k}★: {v}" for k, v in _rating_dist.items()])
@@ -5132,7 +5594,7 @@ def show_reviews(t=None):
                 _tf1, _tf2 = st.columns([3, 2])
                 with _tf1:
                     # Список ASIN з лічильниками
-                    _asin_counts_tbl = _df_disp.groupby('asin').size().sort_values(ascending=False)
+                    _asin_counts_tbl = _df_disp.groupby('asin', observed=True).size().sort_values(ascending=False)
                     _asin_options = [
                         f"{_a}  ({_c} нов.)" for _a, _c in _asin_counts_tbl.items()
                     ]
@@ -5384,7 +5846,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
                     if 'review_date' in _disp.columns and hasattr(_disp['review_date'], 'dt'):
                         _disp['review_date'] = _disp['review_date'].dt.strftime('%Y-%m-%d')
                     if 'domain' in _disp.columns:
-                        _disp['Country'] = _disp['domain'].map(DOMAIN_LABELS).fillna(_disp['domain'])
+                        _disp['Country'] = _disp['domain'].astype(object).map(DOMAIN_LABELS).fillna(_disp['domain'])
                         _disp = _disp.drop(columns=['domain'])
                     if 'is_amazon_vine' in _disp.columns:
                         _disp['is_amazon_vine'] = _disp['is_amazon_vine'].map({True: '🍇', False: ''}).fillna('')
@@ -5435,7 +5897,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
                     st.info("Немає відгуків під обрані фільтри")
                 elif _vmode.startswith("📦"):
                     # Згруповано: expander на кожний ASIN
-                    for _a, _grp in _df_tbl.groupby('asin', sort=False):
+                    for _a, _grp in _df_tbl.groupby('asin', sort=False, observed=True):
                         _cnt     = len(_grp)
                         _neg     = int((_grp['rating'] <= 3).sum())
                         _avg     = _grp['rating'].mean()
@@ -5466,7 +5928,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
                 with _csv_c1:
                     _csv_filter = _df_tbl.copy()
                     if 'domain' in _csv_filter.columns:
-                        _csv_filter['country'] = _csv_filter['domain'].map(DOMAIN_LABELS).fillna(_csv_filter['domain'])
+                        _csv_filter['country'] = _csv_filter['domain'].astype(object).map(DOMAIN_LABELS).fillna(_csv_filter['domain'])
                     st.download_button(
                         f"📥 CSV по фільтру ({len(_csv_filter)})",
                         _csv_filter.to_csv(index=False).encode(),
@@ -5479,7 +5941,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
                     # Повний дамп усіх нових за період (без ASIN/зірок фільтру)
                     _csv_all = _df_disp.copy()
                     if 'domain' in _csv_all.columns:
-                        _csv_all['country'] = _csv_all['domain'].map(DOMAIN_LABELS).fillna(_csv_all['domain'])
+                        _csv_all['country'] = _csv_all['domain'].astype(object).map(DOMAIN_LABELS).fillna(_csv_all['domain'])
                     st.download_button(
                         f"📥 CSV всі нові ({len(_csv_all)})",
                         _csv_all.to_csv(index=False).encode(),
@@ -5516,7 +5978,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
     with col2:
         st.markdown("#### 📈 Тренд рейтингу по місяцях")
         df_f['month'] = df_f['review_date'].dt.to_period('M').astype(str)
-        monthly = df_f.groupby('month').agg(
+        monthly = df_f.groupby('month', observed=True).agg(
             avg_rating=('rating', 'mean'),
             count=('rating', 'count')
         ).reset_index().tail(12)
@@ -5546,7 +6008,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
     # ══════════════════════════════════════════════════════
     # 5. WORST / BEST ASIN
     # ══════════════════════════════════════════════════════
-    asin_stats = df_f.groupby('asin').agg(
+    asin_stats = df_f.groupby('asin', observed=True).agg(
         count=('rating', 'count'),
         avg_rating=('rating', 'mean'),
         neg_pct=('rating', lambda x: (x <= 2).sum() / len(x) * 100),
@@ -5596,10 +6058,10 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
         st.caption("Клітинки = середній рейтинг · мінімум 3 відгуки для показу")
 
         # Top 20 ASINs за кількістю
-        top_asins = df_f['asin'].value_counts().head(20).index.tolist()
+        top_asins = df_f['asin'].astype(object).value_counts().head(20).index.tolist()
         df_heat = df_f[df_f['asin'].isin(top_asins)]
 
-        heat = df_heat.groupby(['asin', 'domain']).agg(
+        heat = df_heat.groupby(['asin', 'domain'], observed=True).agg(
             avg_r=('rating', 'mean'),
             cnt=('rating', 'count')
         ).reset_index()
@@ -5634,13 +6096,13 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
     if 'domain' in df_f.columns and df_f['domain'].nunique() > 1:
         st.markdown("### 🌍 Аналіз по країнах")
 
-        country_stats = df_f.groupby('domain').agg(
+        country_stats = df_f.groupby('domain', observed=True).agg(
             count=('rating', 'count'),
             avg_rating=('rating', 'mean'),
             neg_pct=('rating', lambda x: (x <= 2).sum() / len(x) * 100),
             pos_pct=('rating', lambda x: (x >= 4).sum() / len(x) * 100),
         ).reset_index().sort_values('count', ascending=False)
-        country_stats['Label'] = country_stats['domain'].map(DOMAIN_LABELS).fillna(country_stats['domain'])
+        country_stats['Label'] = country_stats['domain'].astype(object).map(DOMAIN_LABELS).fillna(country_stats['domain'])
 
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -5701,6 +6163,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
 
     # ── Фільтри прямо над таблицею ─────────────────────────────────────────
     with st.container(border=True):
+        period_widget("rev", rev_min, rev_max, default="last_12_months")
         _f1, _f2 = st.columns([2, 2])
         with _f1:
             st.multiselect(
@@ -5760,7 +6223,7 @@ ASIN-фільтр: {_asins_sig} · Зірки: {_stars_sig} · Період: {_n
 
     df_show = df_show_src[show_cols].copy()
     if 'domain' in df_show.columns:
-        df_show['Country'] = df_show['domain'].map(DOMAIN_LABELS).fillna(df_show['domain'])
+        df_show['Country'] = df_show['domain'].astype(object).map(DOMAIN_LABELS).fillna(df_show['domain'])
         df_show = df_show.drop(columns=['domain'])
     if 'review_date' in df_show.columns:
         df_show['review_date'] = df_show['review_date'].dt.strftime('%Y-%m-%d')
@@ -5827,11 +6290,9 @@ def show_orders(t=None):
     # ══════════════════════════════════════════════════════
     try:
         with engine.connect() as conn:
-            bounds = pd.read_sql(text("""
-                SELECT MIN(SUBSTRING(purchase_date,1,10))::date AS mn,
-                       MAX(SUBSTRING(purchase_date,1,10))::date AS mx
-                FROM orders
-                WHERE purchase_date IS NOT NULL AND purchase_date != ''
+            bounds = pd.read_sql(text(f"""
+                SELECT MIN(o.purchase_day) AS mn, MAX(o.purchase_day) AS mx
+                FROM {tv('orders', 'o')}
             """), conn).iloc[0]
         min_date = bounds['mn']
         max_date = bounds['mx']
@@ -5868,37 +6329,33 @@ def show_orders(t=None):
         with engine.connect() as conn:
             df_orders = pd.read_sql(text(f"""
                 SELECT
-                    SUBSTRING(o.purchase_date, 1, 10)::date  AS date,
+                    o.purchase_day                           AS date,
                     o.asin,
                     MIN(o.sku)                               AS sku,
-                    SUM(CASE WHEN o.quantity ~ '^[0-9]+$'
-                        THEN o.quantity::numeric ELSE 1 END)  AS units,
-                    SUM(CASE WHEN o.item_price ~ '^[0-9.]+$'
-                        THEN o.item_price::numeric ELSE 0 END) AS revenue,
+                    SUM(COALESCE(o.quantity, 1))             AS units,
+                    SUM(COALESCE(o.item_price, 0))           AS revenue,
                     COUNT(DISTINCT o.amazon_order_id)         AS orders_cnt,
                     STRING_AGG(DISTINCT NULLIF(o.promotion_ids,''), ', ') AS promo_ids,
                     STRING_AGG(DISTINCT NULLIF(o.price_designation,''), ', ') AS price_desig
-                FROM orders o
-                WHERE SUBSTRING(o.purchase_date, 1, 10)::date BETWEEN :d1 AND :d2
-                  AND o.purchase_date IS NOT NULL AND o.purchase_date != ''
+                FROM {tv('orders', 'o')}
+                WHERE o.purchase_day BETWEEN :d1 AND :d2
                   AND o.asin IS NOT NULL AND o.asin != ''
                   {where_extra}
                 GROUP BY 1, 2
                 ORDER BY 1 DESC, revenue DESC
             """), conn, params=params)
 
-            df_traffic = pd.read_sql(text("""
+            df_traffic = pd.read_sql(text(f"""
                 SELECT
-                    report_date::date                        AS date,
-                    child_asin                               AS asin,
-                    MAX(parent_asin)                         AS parent_asin,
-                    SUM(NULLIF(page_views,'')::numeric)      AS impressions,
-                    SUM(NULLIF(sessions,'')::numeric)        AS sessions
-                FROM spapi.sales_traffic
-                WHERE report_date != '' AND report_date IS NOT NULL
-                  AND child_asin != '' AND child_asin IS NOT NULL
-                  AND granularity = 'SKU'
-                  AND report_date::date BETWEEN :d1 AND :d2
+                    st.report_day                            AS date,
+                    st.child_asin                            AS asin,
+                    MAX(st.parent_asin)                      AS parent_asin,
+                    SUM(st.page_views)                       AS impressions,
+                    SUM(st.sessions)                         AS sessions
+                FROM {tv('sales_traffic', 'st')}
+                WHERE st.child_asin != '' AND st.child_asin IS NOT NULL
+                  AND st.granularity = 'SKU'
+                  AND st.report_day BETWEEN :d1 AND :d2
                 GROUP BY 1, 2
             """), conn, params={"d1": d1, "d2": d2})
 
@@ -6077,15 +6534,15 @@ def show_orders(t=None):
 
     # Для daily chart: sessions per parent MAX, потім SUM across parents
     # (sessions між child-ами одного parent перекриваються)
-    daily_parent_sess = df.groupby(['date', 'parent_asin']).agg(
+    daily_parent_sess = df.groupby(['date', 'parent_asin'], observed=True).agg(
         sessions=('sessions', 'max'),
         impressions=('impressions', 'max'),
-    ).reset_index().groupby('date').agg(
+    ).reset_index().groupby('date', observed=True).agg(
         sessions=('sessions', 'sum'),
         impressions=('impressions', 'sum'),
     ).reset_index()
 
-    daily_orders = df.groupby('date').agg(
+    daily_orders = df.groupby('date', observed=True).agg(
         units=('units', 'sum'), revenue=('revenue', 'sum'),
         orders_cnt=('orders_cnt', 'sum'),
     ).reset_index()
@@ -6159,7 +6616,7 @@ def show_orders(t=None):
     # ══════════════════════════════════════════════════════
     st.markdown("### 🏆 Зведена по ASIN")
 
-    asin_agg = df.groupby(['asin', 'parent_asin']).agg(
+    asin_agg = df.groupby(['asin', 'parent_asin'], observed=True).agg(
         sku=('sku', 'first'), units=('units', 'sum'), revenue=('revenue', 'sum'),
         orders_cnt=('orders_cnt', 'sum'), impressions=('impressions', 'sum'),
         sessions=('sessions', 'sum'),
@@ -6427,7 +6884,7 @@ def show_orders(t=None):
     )
 
     # ── Агрегація orders (units/revenue/orders) по (period, parent) ──
-    parent_agg_ord = df_work.groupby(['period', 'parent_key']).agg(
+    parent_agg_ord = df_work.groupby(['period', 'parent_key'], observed=True).agg(
         units=('units', 'sum'),
         revenue=('revenue', 'sum'),
         orders_cnt=('orders_cnt', 'sum'),
@@ -6466,7 +6923,7 @@ def show_orders(t=None):
             parent_traffic_raw['period'] = parent_traffic_raw['date'].dt.to_period('M').apply(lambda p: p.start_time)
         else:
             parent_traffic_raw['period'] = parent_traffic_raw['date']
-        parent_traffic = parent_traffic_raw.groupby(['period', 'parent_key']).agg(
+        parent_traffic = parent_traffic_raw.groupby(['period', 'parent_key'], observed=True).agg(
             sessions=('sessions', 'sum'),
             impressions=('impressions', 'sum'),
         ).reset_index()
@@ -6478,7 +6935,7 @@ def show_orders(t=None):
         _tr['parent_key'] = _tr['parent_asin'].where(
             _tr['parent_asin'].fillna('') != '', _tr['asin']
         )
-        _tr_daily = _tr.groupby(['date', 'parent_key']).agg(
+        _tr_daily = _tr.groupby(['date', 'parent_key'], observed=True).agg(
             sessions=('sessions', 'max'),
             impressions=('impressions', 'max'),
         ).reset_index()
@@ -6489,7 +6946,7 @@ def show_orders(t=None):
             _tr_daily['period'] = _tr_daily['date'].dt.to_period('M').apply(lambda p: p.start_time)
         else:
             _tr_daily['period'] = _tr_daily['date']
-        parent_traffic = _tr_daily.groupby(['period', 'parent_key']).agg(
+        parent_traffic = _tr_daily.groupby(['period', 'parent_key'], observed=True).agg(
             sessions=('sessions', 'sum'),
             impressions=('impressions', 'sum'),
         ).reset_index()
@@ -6526,7 +6983,7 @@ def show_orders(t=None):
     else:
         # Обмежуємо кількість parent-ів щоб не рендерити тисячі expander-ів
         # Групуємо по parent, беремо топ по total revenue
-        parent_totals = parent_agg.groupby('parent_key').agg(
+        parent_totals = parent_agg.groupby('parent_key', observed=True).agg(
             total_rev=('revenue', 'sum')
         ).reset_index().nlargest(max_parents, 'total_rev')
         top_parents = parent_totals['parent_key'].tolist()
@@ -6552,7 +7009,7 @@ def show_orders(t=None):
 
         # Спочатку: загальна таблиця parent-сумаризована (без drill-down)
         st.markdown("#### 📊 Parent ASIN — сумарно по обраних періодах")
-        parent_total = parent_agg.groupby('parent_key').agg(
+        parent_total = parent_agg.groupby('parent_key', observed=True).agg(
             units=('units', 'sum'),
             revenue=('revenue', 'sum'),
             orders_cnt=('orders_cnt', 'sum'),
@@ -6768,7 +7225,7 @@ def show_orders(t=None):
                 children = df_work[df_work['parent_key'] == pkey]
 
             if not children.empty:
-                child_grouped = children.groupby(['asin', 'sku']).agg(
+                child_grouped = children.groupby(['asin', 'sku'], observed=True).agg(
                     units=('units', 'sum'),
                     revenue=('revenue', 'sum'),
                     orders_cnt=('orders_cnt', 'sum'),
@@ -6869,7 +7326,7 @@ function toggleParent_{idx}(row) {{
 
     with col1:
         df['has_promo'] = df['offer'] != ''
-        promo_rev = df.groupby('has_promo')['revenue'].sum()
+        promo_rev = df.groupby('has_promo', observed=True)['revenue'].sum()
         promo_labels = {True: '🎫 З промо', False: '📦 Без промо'}
         promo_data = pd.DataFrame({
             'Type': [promo_labels.get(k, k) for k in promo_rev.index],
@@ -6882,7 +7339,7 @@ function toggleParent_{idx}(row) {{
 
     with col2:
         st.markdown("#### 📊 CVR: промо vs без промо")
-        promo_agg = df.groupby('has_promo').agg(
+        promo_agg = df.groupby('has_promo', observed=True).agg(
             units=('units', 'sum'), impressions=('impressions', 'sum')
         ).reset_index()
         promo_agg['cvr'] = (promo_agg['units'] / promo_agg['impressions'].replace(0, float('nan')) * 100).fillna(0)
@@ -6908,14 +7365,13 @@ function toggleParent_{idx}(row) {{
         prev_d2 = str(date_range[0] - dt.timedelta(days=1))
 
         with engine.connect() as conn:
-            prev = pd.read_sql(text("""
+            prev = pd.read_sql(text(f"""
                 SELECT
-                    SUM(CASE WHEN item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS revenue,
-                    SUM(CASE WHEN quantity ~ '^[0-9]+$' THEN quantity::numeric ELSE 1 END) AS units,
-                    COUNT(DISTINCT amazon_order_id) AS orders
-                FROM orders
-                WHERE SUBSTRING(purchase_date,1,10)::date BETWEEN :d1 AND :d2
-                  AND purchase_date IS NOT NULL AND purchase_date != ''
+                    SUM(COALESCE(o.item_price, 0)) AS revenue,
+                    SUM(COALESCE(o.quantity, 1))   AS units,
+                    COUNT(DISTINCT o.amazon_order_id) AS orders
+                FROM {tv('orders', 'o')}
+                WHERE o.purchase_day BETWEEN CAST(:d1 AS date) AND CAST(:d2 AS date)
             """), conn, params={"d1": prev_d1, "d2": prev_d2}).iloc[0]
 
         prev_rev = float(prev['revenue'] or 0)
@@ -6959,18 +7415,15 @@ function toggleParent_{idx}(row) {{
     try:
         with engine.connect() as conn:
             # Беремо raw orders без агрегації для точного підрахунку units per order
-            df_comp = pd.read_sql(text("""
+            df_comp = pd.read_sql(text(f"""
                 SELECT
-                    SUBSTRING(o.purchase_date, 1, 10)::date  AS date,
+                    o.purchase_day                  AS date,
                     o.amazon_order_id,
-                    SUM(CASE WHEN o.quantity ~ '^[0-9]+$'
-                        THEN o.quantity::numeric ELSE 1 END)  AS units,
-                    SUM(CASE WHEN o.item_price ~ '^[0-9.]+$'
-                        THEN o.item_price::numeric ELSE 0 END) AS revenue,
-                    COUNT(DISTINCT o.sku)                     AS unique_skus
-                FROM orders o
-                WHERE SUBSTRING(o.purchase_date, 1, 10)::date BETWEEN :d1 AND :d2
-                  AND o.purchase_date IS NOT NULL AND o.purchase_date != ''
+                    SUM(COALESCE(o.quantity, 1))    AS units,
+                    SUM(COALESCE(o.item_price, 0))  AS revenue,
+                    COUNT(DISTINCT o.sku)           AS unique_skus
+                FROM {tv('orders', 'o')}
+                WHERE o.purchase_day BETWEEN CAST(:d1 AS date) AND CAST(:d2 AS date)
                   AND o.amazon_order_id IS NOT NULL
                 GROUP BY 1, 2
             """), conn, params={"d1": d1, "d2": d2})
@@ -7000,7 +7453,7 @@ function toggleParent_{idx}(row) {{
                   f"{multi_unit_orders:,} замовлень")
 
         # ── Тренд AOV + Units/Order по днях ──
-        daily_comp = df_comp.groupby('date').agg(
+        daily_comp = df_comp.groupby('date', observed=True).agg(
             orders=('amazon_order_id', 'nunique'),
             units=('units', 'sum'),
             revenue=('revenue', 'sum'),
@@ -7071,7 +7524,7 @@ function toggleParent_{idx}(row) {{
             return '5️⃣ Bulk (10+)'
 
         df_comp['bucket'] = df_comp['units'].apply(_bucket)
-        bucket_stats = df_comp.groupby('bucket').agg(
+        bucket_stats = df_comp.groupby('bucket', observed=True).agg(
             orders=('amazon_order_id', 'nunique'),
             units=('units', 'sum'),
             revenue=('revenue', 'sum'),
@@ -7552,11 +8005,7 @@ def _get_existing_review_ids(asin, domain, limit=500):
     """Повертає список review_id що вже є в БД — для Bright Data dedup."""
     try:
         conn = _scr_get_conn(); cur = conn.cursor()
-        cur.execute("""
-            SELECT review_id FROM amazon_reviews
-            WHERE asin=%s AND domain=%s AND review_id IS NOT NULL
-            ORDER BY created_at DESC LIMIT %s
-        """, (asin, domain, limit))
+        cur.execute(_qidx.REVIEW_IDS_SQL, (asin, domain, limit))
         ids = [r[0] for r in cur.fetchall() if r[0]]
         cur.close(); conn.close()
         return ids
@@ -8041,7 +8490,7 @@ def show_listings():
         col1, col2 = st.columns(2)
         with col1:
             st.markdown("#### 📊 По маркетплейсах")
-            mp_cnt = df_f['marketplace'].value_counts().reset_index()
+            mp_cnt = df_f['marketplace'].astype(object).value_counts().reset_index()
             mp_cnt.columns = ['Marketplace', 'Count']
             fig = px.pie(mp_cnt, values='Count', names='Marketplace', hole=0.4,
                          color_discrete_sequence=px.colors.qualitative.Set2)
@@ -8049,7 +8498,7 @@ def show_listings():
             st.plotly_chart(fig, width="stretch")
         with col2:
             st.markdown("#### 📊 Active vs Inactive")
-            status_mp = df_f.groupby(['marketplace', 'status']).size().reset_index(name='cnt')
+            status_mp = df_f.groupby(['marketplace', 'status'], observed=True).size().reset_index(name='cnt')
             fig2 = px.bar(status_mp, x='marketplace', y='cnt', color='status',
                           color_discrete_map={'Active': '#4CAF50', 'Inactive': '#F44336'},
                           barmode='stack', height=320)
@@ -8081,7 +8530,7 @@ def show_listings():
                 st.plotly_chart(fig4, width="stretch")
             else:
                 st.markdown("#### 📦 По Fulfillment Channel")
-                fc_cnt = df_f['fulfillment_channel'].value_counts().reset_index()
+                fc_cnt = df_f['fulfillment_channel'].astype(object).value_counts().reset_index()
                 fc_cnt.columns = ['FC', 'Count']
                 fig4 = px.pie(fc_cnt, values='Count', names='FC', hole=0.4, height=300)
                 st.plotly_chart(fig4, width="stretch")
@@ -8144,8 +8593,8 @@ def show_listings():
         if 'sales_rank' in df_asin.columns:    agg_dict['sales_rank']    = 'first'
         if 'main_image_url' in df_asin.columns:agg_dict['main_image_url']= 'first'
 
-        sku_counts = df_asin.groupby('asin1').size().reset_index(name='sku_count')
-        df_grouped = df_asin.groupby('asin1').agg(agg_dict).reset_index()
+        sku_counts = df_asin.groupby('asin1', observed=True).size().reset_index(name='sku_count')
+        df_grouped = df_asin.groupby('asin1', observed=True).agg(agg_dict).reset_index()
         df_grouped['status'] = df_grouped['_active'].map({1: 'Active', 0: 'Inactive'})
         df_grouped['price']  = df_grouped['price'].round(2)
         df_grouped = df_grouped.merge(sku_counts, on='asin1', how='left').drop(columns=['_active'])
@@ -8250,7 +8699,7 @@ def show_listings():
                 c2.metric("✅ Active", f"{(df_new['status'] == 'Active').sum():,}")
                 c3.metric("💰 Avg Price", f"${df_new['price'].mean():.2f}")
 
-                daily_new = df_new.groupby(df_new['open_date'].dt.date).size().reset_index(name='count')
+                daily_new = df_new.groupby(df_new['open_date'].dt.date, observed=True).size().reset_index(name='count')
                 daily_new.columns = ['Date', 'Count']
                 fig_n = px.bar(daily_new, x='Date', y='Count',
                                color_discrete_sequence=['#4CAF50'], height=250)
@@ -8512,7 +8961,7 @@ def show_custom_quality():
                       ('main_image_url', 'first')]:
             if c in df_v.columns: agg[c] = fn
 
-        df_v = df_v.groupby('asin1', as_index=False).agg(agg)
+        df_v = df_v.groupby('asin1', as_index=False, observed=True).agg(agg)
         df_v['status'] = df_v['_active'].map({1: 'Active', 0: 'Inactive'})
         df_v['price']  = df_v['price'].round(2)
         df_v = df_v.drop(columns=['_active'])
@@ -9430,7 +9879,7 @@ def show_custom_quality():
                     # топ-топіки агреговано
                     st.markdown("##### 📊 Топ-топіки (агрегація по всіх ASIN)")
                     by_topic = (
-                        df_cf.groupby(["topic","sentiment"], as_index=False)
+                        df_cf.groupby(["topic","sentiment"], as_index=False, observed=True)
                         .agg(
                             asins=("asin","nunique"),
                             mentions=("asin_mentions","sum"),
@@ -9575,14 +10024,14 @@ def show_custom_quality():
                     # ── розподіл по категоріях ──
                     if not df_a.empty:
                         cat_summary = (
-                            df_a.groupby(["_cat","sentiment"])
+                            df_a.groupby(["_cat","sentiment"], observed=True)
                             .agg(n=("topic","count"), mentions=("asin_mentions","sum"))
                             .reset_index()
                         )
                         st.markdown("##### 📊 Розподіл топіків по категоріях")
                         cat_pivot = cat_summary.pivot_table(
                             index="_cat", columns="sentiment",
-                            values="n", aggfunc="sum", fill_value=0
+                            values="n", aggfunc="sum", fill_value=0, observed=True
                         )
                         for col in ["negative", "positive"]:
                             if col not in cat_pivot.columns:
@@ -10144,7 +10593,7 @@ def show_custom_quality():
                                 import plotly.express as px
                                 df_bubble = df_m.copy()
                                 df_bubble["asin_label"] = df_bubble["asin"].astype(str) + " · " + (
-                                    df_bubble["asin"].map(_asin_title_map).fillna("").astype(str).str.slice(0, 30)
+                                    df_bubble["asin"].astype(object).map(_asin_title_map).fillna("").astype(str).str.slice(0, 30)
                                 )
                                 fig = px.scatter(
                                     df_bubble,
@@ -10268,11 +10717,13 @@ def show_pricing():
 
     # ── Завантаження ──
     try:
-        with engine.connect() as conn:
-            df_curr  = pd.read_sql(text("SELECT * FROM pricing_current ORDER BY snapshot_time DESC"), conn)
-            df_bb    = pd.read_sql(text("SELECT * FROM pricing_buybox ORDER BY snapshot_time DESC"), conn)
-            df_comp  = pd.read_sql(text("SELECT * FROM pricing_competitive ORDER BY snapshot_time DESC"), conn)
-            df_off   = pd.read_sql(text("SELECT * FROM pricing_offers ORDER BY snapshot_time DESC"), conn)
+        pre = _prefetch.prefetch(engine, {
+            "curr": "SELECT * FROM pricing_current ORDER BY snapshot_time DESC",
+            "bb":   "SELECT * FROM pricing_buybox ORDER BY snapshot_time DESC",
+            "comp": "SELECT * FROM pricing_competitive ORDER BY snapshot_time DESC",
+            "off":  "SELECT * FROM pricing_offers ORDER BY snapshot_time DESC",
+        }, timeout=None)   # уся історія снапшотів, без періоду — не обриваємо
+        df_curr, df_bb, df_comp, df_off = pre["curr"], pre["bb"], pre["comp"], pre["off"]
     except Exception as e:
         st.error(f"Помилка: {e}"); return
 
@@ -10369,7 +10820,7 @@ def show_pricing():
             col1, col2 = st.columns(2)
             with col1:
                 st.markdown("#### 🏆 Buy Box статус по ASIN")
-                bb_status = df_bb.groupby('asin').agg(
+                bb_status = df_bb.groupby('asin', observed=True).agg(
                     is_winner=('is_buybox_winner','max'),
                     price=('price','mean'),
                     fulfillment=('fulfillment','first')
@@ -10392,7 +10843,7 @@ def show_pricing():
 
             with col2:
                 st.markdown("#### 📊 Buy Box по Fulfillment")
-                bb_fc = df_bb.groupby(['fulfillment','is_buybox_winner']).size().reset_index(name='cnt')
+                bb_fc = df_bb.groupby(['fulfillment','is_buybox_winner'], observed=True).size().reset_index(name='cnt')
                 bb_fc['label'] = bb_fc['is_buybox_winner'].map({True:'Winner',False:'Lost'})
                 fig2 = px.bar(bb_fc, x='fulfillment', y='cnt', color='label',
                               color_discrete_map={'Winner':'#4CAF50','Lost':'#F44336'},
@@ -10577,94 +11028,37 @@ def _bb_classify_winner(seller_id, has_bb):
     return "external"
 
 
-@st.cache_data(ttl=300)
+@_frames.cached(ttl=300)
 def _bb_query(sql, params=None):
-    conn = psycopg2.connect(DATABASE_URL, sslmode="require")
+    conn = _qstats.connect(DATABASE_URL, sslmode="require")
     try:
         return pd.read_sql(sql, conn, params=params)
     finally:
         conn.close()
 
 
-@st.cache_data(ttl=300)
+@_frames.cached(ttl=300)
 def _bb_latest_snapshot():
     df = _bb_query("SELECT MAX(snapshot_time) AS ts FROM public.pricing_buybox_winners")
     return df.iloc[0]["ts"] if not df.empty else None
 
 
-@st.cache_data(ttl=300)
+@_frames.cached(ttl=300)
 def _bb_current_state():
-    return _bb_query("""
-        WITH latest AS (
-            SELECT DISTINCT ON (asin)
-                asin, snapshot_time,
-                has_buybox, buybox_seller_id, buybox_price, buybox_landed, buybox_is_fba,
-                own_seller_id, own_is_buybox, own_price, own_landed, own_is_fba,
-                total_offer_count, fba_offer_count, fbm_offer_count,
-                all_offers_json,
-                -- Чесна перевірка "BB у нас": seller_id matches наших, а не зламаний own_is_buybox
-                (has_buybox AND buybox_seller_id = ANY(%s)) AS is_ours
-            FROM public.pricing_buybox_winners
-            ORDER BY asin, snapshot_time DESC
-        ),
-        cat AS (
-            SELECT DISTINCT ON (asin)
-                asin, item_name, brand, main_image_url
-            FROM public.catalog_items
-            ORDER BY asin, created_at DESC NULLS LAST
-        )
-        SELECT l.*, c.item_name, c.brand, c.main_image_url
-        FROM latest l
-        LEFT JOIN cat c USING (asin)
-    """, (MERINO_SELLER_IDS,))
+    return _bb_query(_qidx.BB_CURRENT_STATE_SQL, (MERINO_SELLER_IDS,))
 
 
-@st.cache_data(ttl=300)
+@_frames.cached(ttl=300)
 def _bb_history(days=7):
-    return _bb_query(f"""
-        SELECT
-            DATE_TRUNC('hour', snapshot_time) AS hour,
-            COUNT(*) AS total_asins,
-            COUNT(*) FILTER (
-                WHERE has_buybox AND buybox_seller_id = ANY(%s)
-            ) AS we_hold,
-            COUNT(*) FILTER (
-                WHERE has_buybox
-                  AND buybox_seller_id IS NOT NULL
-                  AND buybox_seller_id <> ALL(%s)
-                  AND own_seller_id IS NOT NULL
-            ) AS we_lost,
-            COUNT(*) FILTER (WHERE NOT has_buybox) AS suppressed
-        FROM public.pricing_buybox_winners
-        WHERE snapshot_time > NOW() - INTERVAL '{days} days'
-        GROUP BY hour
-        ORDER BY hour
-    """, (MERINO_SELLER_IDS, MERINO_SELLER_IDS))
-
-
-@st.cache_data(ttl=300)
+    return _bb_query(_qidx.BB_HISTORY_SQL, (MERINO_SELLER_IDS, MERINO_SELLER_IDS, int(days)))
+
+
+@_frames.cached(ttl=300)
 def _bb_competitors():
-    return _bb_query("""
-        SELECT
-            buybox_seller_id AS seller,
-            COUNT(*) AS asins_holding,
-            AVG(buybox_price)::numeric(10,2) AS avg_price,
-            COUNT(*) FILTER (WHERE buybox_is_fba) AS fba_count
-        FROM (
-            SELECT DISTINCT ON (asin)
-                asin, buybox_seller_id, buybox_price, buybox_is_fba
-            FROM public.pricing_buybox_winners
-            WHERE buybox_seller_id IS NOT NULL
-              AND buybox_seller_id <> ALL(%s)
-            ORDER BY asin, snapshot_time DESC
-        ) latest
-        GROUP BY buybox_seller_id
-        ORDER BY asins_holding DESC
-        LIMIT 15
-    """, (MERINO_SELLER_IDS,))
+    return _bb_query(_qidx.BB_COMPETITORS_SQL, (MERINO_SELLER_IDS,))
 
 
-@st.cache_data(ttl=300)
+@_frames.cached(ttl=300)
 def _bb_recent_events():
     """Порівнює 2 останні snapshot-и по кожному ASIN і визначає тип події:
     LOST   — ми тримали BB → тепер у конкурента
@@ -10799,7 +11193,7 @@ def show_buybox_monitor():
         st.caption(f"📡 Останній snapshot: **{last_ts.strftime('%Y-%m-%d %H:%M')}** ({age_str})")
     with col2:
         if st.button("🔄 Refresh", key="bb_refresh"):
-            st.cache_data.clear()
+            st.cache_data.clear(); _frames.clear()
             st.rerun()
 
     # ══════════════════════════════════════════════════════
@@ -11338,7 +11732,7 @@ def show_buybox_monitor():
             }).sort_values("Our BB $", ascending=False)
 
             # Розподіл по нашим продавцям
-            by_seller = held.groupby("buybox_seller_id").size().to_dict()
+            by_seller = held.groupby("buybox_seller_id", observed=True).size().to_dict()
             chips = " · ".join(
                 f"**{BB_SELLER_NAMES.get(sid, sid)}**: {cnt}"
                 for sid, cnt in sorted(by_seller.items(), key=lambda x: -x[1])
@@ -11672,15 +12066,14 @@ def show_fba_operations():
 
     # ── Завантаження ──
     try:
-        with engine.connect() as conn:
-            df_ship  = pd.read_sql(text("SELECT * FROM fba_shipments ORDER BY created_at DESC"), conn)
-            df_items = pd.read_sql(text("SELECT * FROM fba_shipment_items"), conn)
-            df_rem   = pd.read_sql(text("SELECT * FROM fba_removals ORDER BY order_date DESC"), conn)
-        try:
-            with engine.connect() as conn:
-                df_nc = pd.read_sql(text("SELECT * FROM fba_inbound_noncompliance ORDER BY received_date DESC"), conn)
-        except:
-            df_nc = pd.DataFrame()
+        pre = _prefetch.prefetch(engine, {
+            "ship":  "SELECT * FROM fba_shipments ORDER BY created_at DESC",
+            "items": "SELECT * FROM fba_shipment_items",
+            "rem":   "SELECT * FROM fba_removals ORDER BY order_date DESC",
+            "nc":    "SELECT * FROM fba_inbound_noncompliance ORDER BY received_date DESC",
+        }, timeout=None)   # повні таблиці, без періоду — не обриваємо
+        df_ship, df_items, df_rem = pre["ship"], pre["items"], pre["rem"]
+        df_nc = pre.get("nc", pd.DataFrame())   # таблиці може не бути
     except Exception as e:
         st.error(f"Помилка: {e}"); return
 
@@ -11800,7 +12193,7 @@ def show_fba_operations():
         with col1:
             st.markdown("#### 📦 Топ 15 SKU за відправленою кількістю")
             if "sku" in df_items.columns and "quantity_shipped" in df_items.columns:
-                top_sku = df_items.groupby("sku")["quantity_shipped"].sum().nlargest(15).reset_index()
+                top_sku = df_items.groupby("sku", observed=True)["quantity_shipped"].sum().nlargest(15).reset_index()
                 fig3 = go.Figure(go.Bar(
                     x=top_sku["quantity_shipped"], y=top_sku["sku"], orientation="h",
                     marker_color="#5B9BD5",
@@ -11813,7 +12206,7 @@ def show_fba_operations():
         with col2:
             st.markdown("#### 📊 Shipped vs Received")
             if "quantity_shipped" in df_items.columns and "quantity_received" in df_items.columns:
-                ship_agg = df_items.groupby("shipment_id").agg(
+                ship_agg = df_items.groupby("shipment_id", observed=True).agg(
                     shipped=("quantity_shipped","sum"),
                     received=("quantity_received","sum")
                 ).reset_index().head(20)
@@ -11845,7 +12238,7 @@ def show_fba_operations():
         with col2:
             st.markdown("#### 🏆 Топ SKU по Removals")
             if "sku" in df_rem.columns and "shipped_quantity" in df_rem.columns:
-                top_rem = df_rem.groupby("sku")["shipped_quantity"].sum().nlargest(10).reset_index()
+                top_rem = df_rem.groupby("sku", observed=True)["shipped_quantity"].sum().nlargest(10).reset_index()
                 fig6 = go.Figure(go.Bar(
                     x=top_rem["shipped_quantity"], y=top_rem["sku"], orientation="h",
                     marker_color="#F44336",
@@ -11881,15 +12274,14 @@ def show_fba_operations():
         try:
             with engine.connect() as conn:
                 df_inv = pd.read_sql(text('SELECT * FROM fba_inventory'), conn)
-                df_ord = pd.read_sql(text("""
-                    SELECT sku,
-                        SUBSTRING(purchase_date,1,10)::date AS day,
-                        COUNT(DISTINCT amazon_order_id) AS orders,
-                        SUM(CASE WHEN quantity ~ '^[0-9]+$' THEN quantity::numeric ELSE 1 END) AS units,
-                        SUM(CASE WHEN item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS revenue
-                    FROM orders
-                    WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '90 days'
-                      AND purchase_date IS NOT NULL AND purchase_date != ''
+                df_ord = pd.read_sql(text(f"""
+                    SELECT o.sku,
+                        o.purchase_day AS day,
+                        COUNT(DISTINCT o.amazon_order_id) AS orders,
+                        SUM(COALESCE(o.quantity, 1)) AS units,
+                        SUM(COALESCE(o.item_price, 0)) AS revenue
+                    FROM {tv('orders', 'o')}
+                    WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '90 days'
                     GROUP BY 1, 2
                     ORDER BY 2 DESC
                 """), conn)
@@ -11919,8 +12311,8 @@ def show_fba_operations():
 
             if not df_lst.empty and "SKU" in df_inv.columns:
                 df_lst["status"] = df_lst["status"].astype(str).str.lower()
-                status_map = df_lst.groupby("sku")["status"].first().to_dict()
-                df_inv["listing_status"] = df_inv["SKU"].map(status_map).fillna("unknown")
+                status_map = df_lst.groupby("sku", observed=True)["status"].first().to_dict()
+                df_inv["listing_status"] = df_inv["SKU"].astype(object).map(status_map).fillna("unknown")
             else:
                 df_inv["listing_status"] = "unknown"
 
@@ -11930,10 +12322,10 @@ def show_fba_operations():
 
             if not df_ord.empty and "SKU" in df_inv.columns:
                 last_30 = df_ord[df_ord["day"] >= (pd.Timestamp.now().normalize() - pd.Timedelta(days=30))]
-                sold_30 = last_30.groupby("sku")["units"].sum().to_dict()
-                rev_30  = last_30.groupby("sku")["revenue"].sum().to_dict()
-                df_inv["sold_30d"]      = df_inv["SKU"].map(sold_30).fillna(0).astype(int)
-                df_inv["revenue_30d"]   = df_inv["SKU"].map(rev_30).fillna(0)
+                sold_30 = last_30.groupby("sku", observed=True)["units"].sum().to_dict()
+                rev_30  = last_30.groupby("sku", observed=True)["revenue"].sum().to_dict()
+                df_inv["sold_30d"]      = df_inv["SKU"].astype(object).map(sold_30).fillna(0).astype(int)
+                df_inv["revenue_30d"]   = df_inv["SKU"].astype(object).map(rev_30).fillna(0)
                 df_inv["velocity_real"] = (df_inv["sold_30d"] / 30).round(2)
                 df_inv["dos_real"]      = (df_inv["Available"] / df_inv["velocity_real"].replace(0, float("nan"))).round(0).fillna(0)
             else:
@@ -12053,7 +12445,7 @@ def show_fba_operations():
                     df_agg = df_vel.resample("W", on="day").agg(
                         {"orders":"sum","units":"sum","revenue":"sum"}).reset_index()
                 else:
-                    df_agg = df_vel.groupby("day").agg(
+                    df_agg = df_vel.groupby("day", observed=True).agg(
                         {"orders":"sum","units":"sum","revenue":"sum"}).reset_index()
 
                 col1, col2 = st.columns(2)
@@ -12089,7 +12481,7 @@ def show_fba_operations():
                 # Топ SKU velocity
                 st.markdown("##### 🏆 Топ 15 SKU по продажах (30д)")
                 sku_vel = df_vel[df_vel["day"] >= (pd.Timestamp.now().normalize() - pd.Timedelta(days=30))]
-                sku_agg = sku_vel.groupby("sku").agg(
+                sku_agg = sku_vel.groupby("sku", observed=True).agg(
                     units=("units","sum"), revenue=("revenue","sum"), orders=("orders","sum")
                 ).reset_index().nlargest(15, "units")
 
@@ -12119,7 +12511,7 @@ def show_fba_operations():
 
                 # Velocity таблиця
                 st.markdown("##### 📋 Velocity таблиця (всі SKU з продажами)")
-                sku_all = sku_vel.groupby("sku").agg(
+                sku_all = sku_vel.groupby("sku", observed=True).agg(
                     units=("units","sum"), revenue=("revenue","sum"), orders=("orders","sum")
                 ).reset_index()
                 sku_all["vel/день"] = (sku_all["units"] / 30).round(2)
@@ -12162,18 +12554,18 @@ def show_tax(t=None):
     engine = get_engine()
     try:
         with engine.connect() as conn:
-            kpi = pd.read_sql(text("""
+            kpi = pd.read_sql(text(f"""
                 SELECT
-                    SUM(CASE WHEN charge_type = 'Tax'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END) AS fe_tax,
-                    SUM(CASE WHEN charge_type = 'ShippingTax'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END) AS fe_ship_tax,
-                    SUM(CASE WHEN charge_type = 'GiftWrapTax'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END) AS fe_gift_tax,
-                    COUNT(CASE WHEN charge_type = 'Tax' THEN 1 END) AS fe_tax_rows,
-                    SUM(CASE WHEN event_type='Shipment' AND charge_type='Principal'
-                        THEN NULLIF(amount,'')::numeric ELSE 0 END) AS gross
-                FROM finance_events
+                    SUM(CASE WHEN f.charge_type = 'Tax'
+                        THEN f.amount ELSE 0 END) AS fe_tax,
+                    SUM(CASE WHEN f.charge_type = 'ShippingTax'
+                        THEN f.amount ELSE 0 END) AS fe_ship_tax,
+                    SUM(CASE WHEN f.charge_type = 'GiftWrapTax'
+                        THEN f.amount ELSE 0 END) AS fe_gift_tax,
+                    COALESCE(SUM(f.n_events) FILTER (WHERE f.charge_type = 'Tax'), 0) AS fe_tax_rows,
+                    SUM(CASE WHEN f.event_type='Shipment' AND f.charge_type='Principal'
+                        THEN f.amount ELSE 0 END) AS gross
+                FROM {tv('finance_daily', 'f')}
             """), conn).iloc[0]
             kpi_orders = pd.read_sql(text("""
                 SELECT
@@ -12244,19 +12636,19 @@ def show_tax(t=None):
     with tabs[0]:
         try:
             with engine.connect() as conn:
-                df_trend = pd.read_sql(text("""
+                df_trend = pd.read_sql(text(f"""
                     SELECT
-                        DATE_TRUNC('month', posted_date::date) AS month,
-                        SUM(CASE WHEN charge_type='Tax'
-                            THEN NULLIF(amount,'')::numeric ELSE 0 END) AS item_tax,
-                        SUM(CASE WHEN charge_type='ShippingTax'
-                            THEN NULLIF(amount,'')::numeric ELSE 0 END) AS ship_tax,
-                        SUM(CASE WHEN charge_type IN ('Tax','ShippingTax','GiftWrapTax')
-                            THEN NULLIF(amount,'')::numeric ELSE 0 END) AS total_tax,
-                        SUM(CASE WHEN event_type='Shipment' AND charge_type='Principal'
-                            THEN NULLIF(amount,'')::numeric ELSE 0 END) AS gross
-                    FROM finance_events
-                    WHERE posted_date IS NOT NULL AND posted_date != ''
+                        DATE_TRUNC('month', f.posted_day) AS month,
+                        SUM(CASE WHEN f.charge_type='Tax'
+                            THEN f.amount ELSE 0 END) AS item_tax,
+                        SUM(CASE WHEN f.charge_type='ShippingTax'
+                            THEN f.amount ELSE 0 END) AS ship_tax,
+                        SUM(CASE WHEN f.charge_type IN ('Tax','ShippingTax','GiftWrapTax')
+                            THEN f.amount ELSE 0 END) AS total_tax,
+                        SUM(CASE WHEN f.event_type='Shipment' AND f.charge_type='Principal'
+                            THEN f.amount ELSE 0 END) AS gross
+                    FROM {tv('finance_daily', 'f')}
+                    WHERE f.posted_day IS NOT NULL
                     GROUP BY 1 ORDER BY 1
                 """), conn)
             if not df_trend.empty:
@@ -12337,14 +12729,14 @@ def show_tax(t=None):
             if not df_det.empty:
                 col1, col2 = st.columns(2)
                 with col1:
-                    ct = df_det["charge_type"].value_counts().reset_index()
+                    ct = df_det["charge_type"].astype(object).value_counts().reset_index()
                     ct.columns = ["Type","Count"]
                     fig = px.pie(ct, values="Count", names="Type", hole=0.4,
                                  color_discrete_sequence=px.colors.qualitative.Set2)
                     fig.update_layout(height=300)
                     st.plotly_chart(fig, width="stretch")
                 with col2:
-                    by_type = df_det.groupby("charge_type")["amount"].agg(["sum","count"]).reset_index()
+                    by_type = df_det.groupby("charge_type", observed=True)["amount"].agg(["sum","count"]).reset_index()
                     by_type.columns = ["charge_type","total","count"]
                     st.dataframe(by_type.style.format({"total":"${:,.2f}"}), width="stretch", hide_index=True)
                 st.dataframe(df_det.style.format({"amount":"${:.2f}"}), width="stretch", hide_index=True, height=400)
@@ -12409,12 +12801,12 @@ def show_restock_agent(t=None):
     def get_sales_trend(sku):
         try:
             with engine.connect() as conn:
-                df = pd.read_sql(text("""
-                    SELECT SUBSTRING(purchase_date,1,10)::date as day,
+                df = pd.read_sql(text(f"""
+                    SELECT o.purchase_day as day,
                         COUNT(*) as orders,
-                        SUM(COALESCE(NULLIF(quantity,'')::numeric,1)) as units
-                    FROM orders WHERE sku = :sku
-                      AND SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'
+                        SUM(COALESCE(o.quantity, 1)) as units
+                    FROM {tv('orders', 'o')} WHERE o.sku = :sku
+                      AND o.purchase_day >= CURRENT_DATE - INTERVAL '30 days'
                     GROUP BY 1 ORDER BY 1
                 """), conn, params={"sku": sku})
             if df.empty: return "Даних за 30 днів немає"
@@ -12679,16 +13071,15 @@ def show_forecast(t=None):
     # ── Завантаження даних ──
     try:
         with engine.connect() as conn:
-            where_sku = "AND sku = :sku" if sku_filter else ""
+            where_sku = "AND o.sku = :sku" if sku_filter else ""
             df_raw = pd.read_sql(text(f"""
                 SELECT
-                    SUBSTRING(purchase_date,1,10)::date AS day,
-                    COUNT(DISTINCT amazon_order_id) AS orders,
-                    SUM(CASE WHEN item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS revenue,
-                    SUM(CASE WHEN quantity ~ '^[0-9]+$' THEN quantity::numeric ELSE 1 END) AS units
-                FROM orders
-                WHERE SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '{history_days} days'
-                  AND purchase_date IS NOT NULL AND purchase_date != ''
+                    o.purchase_day AS day,
+                    COUNT(DISTINCT o.amazon_order_id) AS orders,
+                    SUM(COALESCE(o.item_price, 0)) AS revenue,
+                    SUM(COALESCE(o.quantity, 1)) AS units
+                FROM {tv('orders', 'o')}
+                WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '{history_days} days'
                   {where_sku}
                 GROUP BY 1 ORDER BY 1
             """), conn, params={"sku": sku_filter} if sku_filter else {})
@@ -12926,18 +13317,17 @@ ML ПРОГНОЗ на {forecast_days} днів:
     try:
         with engine.connect() as conn:
             df_sku = pd.read_sql(text(f"""
-                SELECT sku,
-                    SUM(CASE WHEN SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'
-                        AND item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS rev_30d,
-                    SUM(CASE WHEN SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '60 days'
-                        AND SUBSTRING(purchase_date,1,10)::date < CURRENT_DATE - INTERVAL '30 days'
-                        AND item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) AS rev_prev30d,
-                    COUNT(DISTINCT CASE WHEN SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'
-                        THEN amazon_order_id END) AS orders_30d
-                FROM orders
-                WHERE item_price ~ '^[0-9.]+$'
-                GROUP BY sku HAVING SUM(CASE WHEN SUBSTRING(purchase_date,1,10)::date >= CURRENT_DATE - INTERVAL '30 days'
-                    AND item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END) > 0
+                SELECT o.sku,
+                    SUM(CASE WHEN o.purchase_day >= CURRENT_DATE - INTERVAL '30 days'
+                        THEN o.item_price ELSE 0 END) AS rev_30d,
+                    SUM(CASE WHEN o.purchase_day < CURRENT_DATE - INTERVAL '30 days'
+                        THEN o.item_price ELSE 0 END) AS rev_prev30d,
+                    COUNT(DISTINCT CASE WHEN o.purchase_day >= CURRENT_DATE - INTERVAL '30 days'
+                        THEN o.amazon_order_id END) AS orders_30d
+                FROM {tv('orders', 'o')}
+                WHERE o.purchase_day >= CURRENT_DATE - INTERVAL '60 days' AND o.item_price >= 0
+                GROUP BY o.sku HAVING SUM(CASE WHEN o.purchase_day >= CURRENT_DATE - INTERVAL '30 days'
+                    THEN o.item_price ELSE 0 END) > 0
                 ORDER BY rev_30d DESC LIMIT 10
             """), conn)
         if not df_sku.empty:
@@ -13160,40 +13550,35 @@ def safe_column(table: str, candidates, schema: str = 'public', default=None):
 # ── PAYLOAD BUILDERS: читаємо агреговані метрики з БД ──
 def _agent_orders_payload() -> str:
     engine = get_engine()
-    # Числові колонки — TEXT → regex guard для безпечного касту
-    price_expr = "CASE WHEN item_price ~ '^[0-9.]+$' THEN item_price::numeric ELSE 0 END"
-    qty_expr   = "CASE WHEN quantity::text ~ '^[0-9]+$' THEN quantity::numeric ELSE 0 END"
-    date_expr  = "SUBSTRING(purchase_date,1,10)::date"
+    # Типізована копія orders (bi.orders): числа й дата вже скастовані
+    price_expr = "COALESCE(item_price, 0)"
+    qty_expr   = "COALESCE(quantity, 0)"
+    date_expr  = "purchase_day"
     try:
+        orders = tv('orders')
         with engine.connect() as conn:
             cur = pd.read_sql(text(f"""
                 SELECT COUNT(DISTINCT amazon_order_id) AS orders_cnt,
                        COALESCE(SUM({qty_expr}),0)     AS units,
                        COALESCE(SUM({price_expr}),0)   AS revenue
-                FROM orders
-                WHERE purchase_date IS NOT NULL
-                  AND purchase_date <> ''
-                  AND {date_expr} >= CURRENT_DATE - INTERVAL '30 days'
+                FROM {orders}
+                WHERE {date_expr} >= CURRENT_DATE - INTERVAL '30 days'
                   AND order_status NOT IN ('Canceled')
             """), conn).iloc[0]
             prev = pd.read_sql(text(f"""
                 SELECT COUNT(DISTINCT amazon_order_id) AS orders_cnt,
                        COALESCE(SUM({qty_expr}),0)     AS units,
                        COALESCE(SUM({price_expr}),0)   AS revenue
-                FROM orders
-                WHERE purchase_date IS NOT NULL
-                  AND purchase_date <> ''
-                  AND {date_expr} BETWEEN CURRENT_DATE - INTERVAL '60 days' AND CURRENT_DATE - INTERVAL '31 days'
+                FROM {orders}
+                WHERE {date_expr} BETWEEN CURRENT_DATE - INTERVAL '60 days' AND CURRENT_DATE - INTERVAL '31 days'
                   AND order_status NOT IN ('Canceled')
             """), conn).iloc[0]
             top = pd.read_sql(text(f"""
                 SELECT asin,
                        COALESCE(SUM({price_expr}),0) AS rev,
                        COALESCE(SUM({qty_expr}),0)   AS units
-                FROM orders
-                WHERE purchase_date IS NOT NULL
-                  AND purchase_date <> ''
-                  AND {date_expr} >= CURRENT_DATE - INTERVAL '30 days'
+                FROM {orders}
+                WHERE {date_expr} >= CURRENT_DATE - INTERVAL '30 days'
                   AND order_status NOT IN ('Canceled')
                   AND asin IS NOT NULL
                 GROUP BY asin
@@ -13223,24 +13608,24 @@ def _agent_traffic_payload() -> str:
     engine = get_engine()
     try:
         with engine.connect() as conn:
-            # report_date може бути TEXT/DATE з порожніми рядками;
-            # числові колонки TEXT → CAST AS FLOAT; ASIN = child_asin
-            _rd  = "CASE WHEN report_date::text ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' THEN report_date::text::date END"
-            _ses = "COALESCE(NULLIF(sessions,'')::float, 0)"
-            _pv  = "COALESCE(NULLIF(page_views,'')::float, 0)"
-            _uo  = "COALESCE(NULLIF(units_ordered,'')::float, 0)"
+            # bi.sales_traffic: report_day — DATE, числові колонки вже NUMERIC; ASIN = child_asin
+            _st  = tv('sales_traffic')
+            _rd  = "report_day"
+            _ses = "COALESCE(sessions, 0)"
+            _pv  = "COALESCE(page_views, 0)"
+            _uo  = "COALESCE(units_ordered, 0)"
             cur = pd.read_sql(text(f"""
                 SELECT COALESCE(SUM({_ses}),0)    AS sessions,
                        COALESCE(SUM({_pv}),0)     AS page_views,
                        COALESCE(SUM({_uo}),0)     AS units
-                FROM spapi.sales_traffic
+                FROM {_st}
                 WHERE {_rd} >= CURRENT_DATE - INTERVAL '30 days'
             """), conn).iloc[0]
             prev = pd.read_sql(text(f"""
                 SELECT COALESCE(SUM({_ses}),0)    AS sessions,
                        COALESCE(SUM({_pv}),0)     AS page_views,
                        COALESCE(SUM({_uo}),0)     AS units
-                FROM spapi.sales_traffic
+                FROM {_st}
                 WHERE {_rd} BETWEEN CURRENT_DATE - INTERVAL '60 days' AND CURRENT_DATE - INTERVAL '31 days'
             """), conn).iloc[0]
             top = pd.read_sql(text(f"""
@@ -13250,7 +13635,7 @@ def _agent_traffic_payload() -> str:
                        CASE WHEN SUM({_ses}) > 0
                             THEN SUM({_uo})/SUM({_ses})*100
                             ELSE 0 END AS cvr
-                FROM spapi.sales_traffic
+                FROM {_st}
                 WHERE {_rd} >= CURRENT_DATE - INTERVAL '30 days'
                   AND child_asin IS NOT NULL AND child_asin <> ''
                 GROUP BY child_asin
@@ -13347,18 +13732,21 @@ def _agent_settlements_payload() -> str:
             if not amt_cols:
                 return "ERROR: settlements не має amount/fee колонок"
             main_col = next((c for c in amt_cols if c.lower() in ('amount', 'net_amount', 'total')), amt_cols[0])
-            # posted_date може бути з сміттям → regex guard (приймаємо лише YYYY-MM-DD...)
-            _pd = "CASE WHEN posted_date::text ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' THEN posted_date::text::date END"
-            # amount теж може бути TEXT з порожніми/неспоможними значеннями
-            _amt = f"CASE WHEN \"{main_col}\"::text ~ '^-?[0-9]+(\\.[0-9]+)?$' THEN \"{main_col}\"::numeric ELSE 0 END"
+            # bi.settlements: posted_day (ISO і DD.MM.YYYY) та amount/quantity вже типізовані
+            _set = tv('settlements')
+            _pd  = "posted_day"
+            if main_col in _typed.VIEWS['settlements']['numeric']:
+                _amt = f'COALESCE("{main_col}", 0)'
+            else:
+                _amt = f"CASE WHEN \"{main_col}\"::text ~ '^-?[0-9]+(\\.[0-9]+)?$' THEN \"{main_col}\"::numeric ELSE 0 END"
             cur = pd.read_sql(text(f"""
                 SELECT COUNT(*) AS n, COALESCE(SUM({_amt}),0) AS total
-                FROM settlements
+                FROM {_set}
                 WHERE {_pd} >= CURRENT_DATE - INTERVAL '30 days'
             """), conn).iloc[0]
             prev = pd.read_sql(text(f"""
                 SELECT COUNT(*) AS n, COALESCE(SUM({_amt}),0) AS total
-                FROM settlements
+                FROM {_set}
                 WHERE {_pd} BETWEEN CURRENT_DATE - INTERVAL '60 days' AND CURRENT_DATE - INTERVAL '31 days'
             """), conn).iloc[0]
 
@@ -13367,7 +13755,7 @@ def _agent_settlements_payload() -> str:
             if type_col:
                 types = pd.read_sql(text(f"""
                     SELECT "{type_col}" AS t, COALESCE(SUM({_amt}),0) AS total
-                    FROM settlements
+                    FROM {_set}
                     WHERE {_pd} >= CURRENT_DATE - INTERVAL '30 days'
                       AND "{type_col}" IS NOT NULL
                     GROUP BY 1 ORDER BY total DESC LIMIT 8
@@ -13376,6 +13764,22 @@ def _agent_settlements_payload() -> str:
     except Exception as e:
         return f"ERROR: {e}"
 
+    # P&L з finance_events (денний rollup) — поточні 30 днів проти попередніх
+    fin = None
+    try:
+        with engine.connect() as conn:
+            fin = pd.read_sql(text(f"""
+                SELECT (f.posted_day >= CURRENT_DATE - 30) AS cur,
+                       SUM(CASE WHEN f.event_type='Shipment' AND f.charge_type='Principal'
+                           THEN f.amount ELSE 0 END) AS gross,
+                       SUM(f.amount) AS net
+                FROM {tv('finance_daily', 'f')}
+                WHERE f.posted_day >= CURRENT_DATE - 60
+                GROUP BY 1
+            """), conn).set_index('cur')
+    except Exception:
+        pass
+
     def _d(a, b):
         return ((float(a) - float(b)) / float(b) * 100.0) if float(b) else 0.0
 
@@ -13384,6 +13788,13 @@ def _agent_settlements_payload() -> str:
         f"Settlements prev 30d: ${float(prev['total']):,.0f} ({int(prev['n'])} tx)",
         f"Δ: {_d(cur['total'], prev['total']):+.1f}%",
     ]
+    if fin is not None and not fin.empty:
+        _fv = lambda flag, c: float(fin.loc[flag, c] or 0) if flag in fin.index else 0.0
+        lines.append(
+            f"Finance events 30d: gross ${_fv(True, 'gross'):,.0f}, net ${_fv(True, 'net'):,.0f} "
+            f"(prev: gross ${_fv(False, 'gross'):,.0f}, net ${_fv(False, 'net'):,.0f}; "
+            f"Δ net {_d(_fv(True, 'net'), _fv(False, 'net')):+.1f}%)"
+        )
     if types_txt:
         lines.append("")
         lines.append("TOP 8 типів транзакцій:")
@@ -13684,7 +14095,7 @@ def _agent_tender_payload() -> str:
         return "\n".join(lines)
 
     # Матриця: скільки quotes per fba_id
-    cov = quotes.groupby('fba_id').size().reset_index(name='n_quotes')
+    cov = quotes.groupby('fba_id', observed=True).size().reset_index(name='n_quotes')
     ships_with_cov = ships.merge(cov, on='fba_id', how='left').fillna({'n_quotes': 0})
     ships_with_cov['n_quotes'] = ships_with_cov['n_quotes'].astype(int)
 
@@ -13706,14 +14117,14 @@ def _agent_tender_payload() -> str:
     # Найдешевші + найдорожчі per FBA
     cheapest_lines = []
     outlier_lines = []
-    best_per_fba = quotes.loc[quotes.groupby('fba_id')['cost_usd'].idxmin()]
+    best_per_fba = quotes.loc[quotes.groupby('fba_id', observed=True)['cost_usd'].idxmin()]
     for _, q in best_per_fba.head(8).iterrows():
         cheapest_lines.append(
             f"  - {q['fba_id']}: {q['carrier']} ({q.get('service_type','')}) · ${float(q['cost_usd']):,.0f} · {int(q['transit_days'] or 0)}d"
         )
 
     # Price spread per FBA (найгірший vs найкращий) — виявляє outliers
-    spread = quotes.groupby('fba_id')['cost_usd'].agg(['min', 'max', 'count']).reset_index()
+    spread = quotes.groupby('fba_id', observed=True)['cost_usd'].agg(['min', 'max', 'count']).reset_index()
     spread = spread[spread['count'] >= 2].copy()
     if not spread.empty:
         spread['spread_pct'] = ((spread['max'] - spread['min']) / spread['min'] * 100).round(1)
@@ -13724,7 +14135,7 @@ def _agent_tender_payload() -> str:
             )
 
     # Carrier-level summary
-    carrier_stats = quotes.groupby('carrier').agg(
+    carrier_stats = quotes.groupby('carrier', observed=True).agg(
         n_quotes=('carrier', 'size'),
         avg_cost=('cost_usd', 'mean'),
         avg_transit=('transit_days', 'mean'),
@@ -14577,22 +14988,11 @@ st.session_state["lang"] = lang   # для auth.py і інших модулів
 t    = translations[lang]
 
 if st.sidebar.button(t["update_btn"], width="stretch"):
-    st.cache_data.clear(); st.rerun()
-
-df = load_data()
+    st.cache_data.clear(); _frames.clear(); st.rerun()
 
-if not df.empty:
-    for col in ['Available','Price','Velocity','Stock Value']:
-        if col not in df.columns: df[col] = 0
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-    df['Stock Value'] = df['Available'] * df['Price']
-    df['created_at']  = pd.to_datetime(df['created_at'])
-    df['date']        = df['created_at'].dt.date
-    dates  = sorted(df['date'].unique(), reverse=True)
-    stores = [t["all_stores"]] + list(df['Store Name'].unique()) if 'Store Name' in df.columns else [t["all_stores"]]
-else:
-    dates  = []
-    stores = [t.get("all_stores","Всі")]
+# Сайдбару потрібні лише дні знімків і магазини; рядки — тільки за вибраний день (нижче)
+dates, _inv_stores = load_inventory_days()
+stores = [t.get("all_stores","Всі")] + _inv_stores
 
 # ── Глобальні фільтри (видимі на всіх сторінках, значення персистяться) ──
 _cur_page = st.session_state.get("report_choice", "🏠 Overview")
@@ -14629,7 +15029,7 @@ def nav_to(page: str, *, asin: str = None, **filters):
 #   @cached_query(ttl=600)
 #   def _load_returns(asin=None): ...
 # 600 сек = 10 хв. Ctrl+клік по "🔄 Оновити дані" — очистить всі кеші.
-cached_query = lambda ttl=300: st.cache_data(ttl=ttl, show_spinner=False)
+cached_query = lambda ttl=300: _frames.cached(ttl=ttl)
 
 
 # ── Preset-селектор періоду + гранулярності (як у Sellerboard) ──────────────
@@ -14770,7 +15170,7 @@ selected_store = st.sidebar.selectbox(t["store_label"], stores, key="sel_store")
 try:
     _eng = get_engine()
     with _eng.connect() as _c:
-        _b = pd.read_sql(text("SELECT MIN(posted_date)::date as mn, MAX(posted_date)::date as mx FROM settlements"), _c).iloc[0]
+        _b = pd.read_sql(text(f"SELECT MIN({day_of('settlements')}) as mn, MAX({day_of('settlements')}) as mx FROM settlements"), _c).iloc[0]
     _fin_min, _fin_max = _b['mn'], _b['mx']
 except Exception:
     _fin_min, _fin_max = dt.date(2024,1,1), dt.date.today()
@@ -14779,8 +15179,9 @@ st.sidebar.date_input(
     min_value=_fin_min, max_value=_fin_max, key="fin_date"
 )
 
+df = load_data(INV_PAGE_COLUMNS, selected_date, selected_date) if selected_date else pd.DataFrame()
 if not df.empty:
-    df_filtered = df[df['date']==selected_date] if selected_date else df
+    df_filtered = df
     if selected_store != t.get("all_stores","Всі"):
         df_filtered = df_filtered[df_filtered['Store Name']==selected_store]
 else:
@@ -14907,6 +15308,7 @@ else:
     st.session_state.report_choice = raw_choice
 
 report_choice = st.session_state.report_choice
+_qstats.start_run(report_choice)
 
 # ── ROUTING ──
 if   report_choice == "🏠 Overview":                show_overview(df_filtered, t, selected_date)
@@ -1,67 +1,180 @@
 """
-MR.EQUIPP — скачування через FastAPI
+MR.EQUIPP — інкрементальна синхронізація через FastAPI
+Таблиці тягнемо паралельно з /export/{table} (Parquet) лише з дня watermark
+і дописуємо в локальний Parquet-датасет, партиціонований по днях.
+Перезавантажені дні перезаписуються цілком — дублів немає.
+День рядка — як mr_day() у Postgres: YYYY-MM-DD або DD.MM.YYYY; решта — у партицію
+без дня і у watermark не йде (інакше /export отримає невалідний date_from і дасть 422).
+
+    python deploy_api.py            # інкрементально
+    python deploy_api.py --full     # повне перевантаження
 """
+import io
+import os
+import sys
+import json
+import shutil
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-import pandas as pd
-from datetime import datetime
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE_URL = os.getenv("BI_API_URL", "https://mrequipp-api-33065495432e.herokuapp.com")
+API_KEY  = os.getenv("API_KEY", "merino2024")
+OUT_DIR  = os.getenv("SYNC_DIR", "bi_data")
+WORKERS  = int(os.getenv("SYNC_WORKERS", "4"))
+TIMEOUT  = (10, 300)   # connect, read
+
+STATE_FILE = os.path.join(OUT_DIR, "_sync_state.json")
+
+# таблиця -> колонка дати (та сама, що EXPORT_TABLES в api.py)
+TABLES = {
+    "orders":         "purchase_date",
+    "finance_events": "posted_date",
+    "fba_inventory":  "created_at",
+    "pricing_buybox": "snapshot_time",
+    "fba_shipments":  "created_at",
+    "amazon_reviews": "review_date",
+}
+
+
+def make_session() -> requests.Session:
+    s = requests.Session()
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=(502, 503, 504),
+                  allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=WORKERS, pool_maxsize=WORKERS, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.params = {"key": API_KEY}
+    return s
+
+
+def load_state() -> dict:
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict):
+    os.makedirs(OUT_DIR, exist_ok=True)
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_FILE)
 
-BASE_URL = "https://mrequipp-api-33065495432e.herokuapp.com"
-API_KEY  = "merino2024"
 
-def get(endpoint, **params):
-    url = f"{BASE_URL}/{endpoint}"
-    r = requests.get(url, params={"key": API_KEY, **params}, timeout=60)
-    print(f"  → HTTP {r.status_code} | {len(r.text)} bytes")
+def get_json(session, endpoint, **params):
+    r = session.get(f"{BASE_URL}/{endpoint}", params=params, timeout=TIMEOUT)
+    print(f"  → /{endpoint} HTTP {r.status_code} | {len(r.content)} bytes")
     if r.status_code != 200:
         print(f"  ❌ Response: {r.text[:300]}")
         return None
     try:
         return r.json()
-    except Exception as e:
+    except ValueError as e:       # HTML-сторінка помилки проксі з кодом 200 — пропускаємо датасет
         print(f"  ❌ JSON error: {e}")
         print(f"  Response: {r.text[:300]}")
         return None
 
-def save(data, name):
-    if data and isinstance(data, list):
-        df = pd.DataFrame(data)
-        fname = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-        df.to_csv(fname, index=False)
-        print(f"  💾 {fname} ({len(df)} рядків)")
-
-# Проверка доступности
-print("🔌 Перевірка API...")
-try:
-    r = requests.get(f"{BASE_URL}/", params={"key": API_KEY}, timeout=10)
-    print(f"  HTTP {r.status_code}: {r.text[:200]}")
-except Exception as e:
-    print(f"  ❌ Не доступний: {e}")
-    print(f"\n  ⚠️  Переконайся що api.py задеплоєний на Heroku:")
-    print(f"  heroku logs --tail --app mrequipp-api")
-    exit(1)
-
-print("\n📦 Inventory...")
-d = get("inventory")
-if d: print(f"  ✅ {d['count']} SKU"); save(d.get('data',[]), "inventory")
-
-print("\n💰 Finance...")
-d = get("finance", days=30)
-if d: print(f"  ✅ Net: ${d['net']:,.0f} | Маржа: {d['margin_pct']}%")
-
-print("\n🛒 Orders...")
-d = get("orders", days=30)
-if d: print(f"  ✅ {d['count']} замовлень"); save(d.get('data',[]), "orders")
-
-print("\n🏆 Buy Box...")
-d = get("buybox")
-if d: print(f"  ✅ Win Rate: {d['win_rate_pct']}%"); save(d.get('data',[]), "buybox")
-
-print("\n🚨 Alerts...")
-d = get("alerts")
-if d:
-    print(f"  ✅ {d['alerts_count']} алертів")
-    for a in d.get('alerts', []):
-        if a['type'] == 'LOW_STOCK':    print(f"     🔴 {a.get('sku','')} — {a.get('days_left',0)}д")
-        elif a['type'] == 'LOST_BUYBOX': print(f"     ⚠️  {a.get('asin','')} @ ${a.get('price',0)}")
-
-print("\n✅ Готово!")
+
+def is_iso_day(v) -> bool:
+    try:
+        return bool(v) and dt.date.fromisoformat(v).isoformat() == v
+    except (TypeError, ValueError):
+        return False
+
+
+def day_of(col) -> pa.Array:
+    """Колонка дати -> 'YYYY-MM-DD' (ISO-префікс або DD.MM.YYYY); інше й неіснуючі дати -> null."""
+    s  = pc.utf8_slice_codeunits(pc.cast(col, pa.string()), 0, 10)
+    ts = pc.coalesce(pc.strptime(s, format="%Y-%m-%d", unit="s", error_is_null=True),
+                     pc.strptime(s, format="%d.%m.%Y", unit="s", error_is_null=True))
+    return pc.strftime(ts, format="%Y-%m-%d")
+
+
+def sync_table(session, table, date_col, watermark=None, full=False):
+    """Тягне таблицю з дня watermark включно, перезаписує ці дні в датасеті.
+    full — датасет таблиці очищується перед записом. -> (таблиця, рядків, новий watermark)."""
+    params = {"format": "parquet"}
+    if not is_iso_day(watermark):
+        watermark = None              # зіпсований стан — тягнемо таблицю цілком
+    if watermark and not full:
+        params["date_from"] = watermark
+    r = session.get(f"{BASE_URL}/export/{table}", params=params, timeout=TIMEOUT)
+    if r.status_code != 200:
+        raise RuntimeError(f"/export/{table} HTTP {r.status_code}: {r.text[:300]}")
+    tbl = pq.read_table(io.BytesIO(r.content))
+    if full or not watermark:
+        # дні, яких уже немає в джерелі, delete_matching не прибрав би
+        shutil.rmtree(os.path.join(OUT_DIR, table), ignore_errors=True)
+    if tbl.num_rows == 0:
+        return table, 0, watermark
+    day = day_of(tbl[date_col])
+    tbl = tbl.append_column("day", day)
+    ds.write_dataset(
+        tbl, os.path.join(OUT_DIR, table), format="parquet",
+        partitioning=["day"], partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+    )
+    wm = pc.max(day).as_py()           # null-и (нерозібрані дні) max пропускає
+    return table, tbl.num_rows, wm if is_iso_day(wm) else watermark
+
+
+def main(full=False):
+    print("🔌 Перевірка API...")
+    session = make_session()
+    try:
+        r = session.get(f"{BASE_URL}/", timeout=10)
+        print(f"  HTTP {r.status_code}: {r.text[:200]}")
+    except Exception as e:
+        print(f"  ❌ Не доступний: {e}")
+        print(f"\n  ⚠️  Переконайся що api.py задеплоєний на Heroku:")
+        print(f"  heroku logs --tail --app mrequipp-api")
+        sys.exit(1)
+
+    state = {} if full else load_state()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        fin = pool.submit(get_json, session, "finance", days=30)
+        alr = pool.submit(get_json, session, "alerts")
+        jobs = {t: pool.submit(sync_table, session, t, col, state.get(t), full)
+                for t, col in TABLES.items()}
+
+        print("\n📦 Таблиці...")
+        for t, job in jobs.items():
+            try:
+                _, rows, wm = job.result()
+                if is_iso_day(wm):
+                    state[t] = wm
+                else:
+                    state.pop(t, None)
+                print(f"  ✅ {t}: {rows} рядків (watermark {wm})")
+            except Exception as e:
+                print(f"  ❌ {t}: {e}")
+        save_state(state)
+
+        print("\n💰 Finance...")
+        d = fin.result()
+        if d: print(f"  ✅ Net: ${d['net']:,.0f} | Маржа: {d['margin_pct']}%")
+
+        print("\n🚨 Alerts...")
+        d = alr.result()
+        if d:
+            print(f"  ✅ {d['alerts_count']} алертів")
+            for a in d.get('alerts', []):
+                if a['type'] == 'LOW_STOCK':    print(f"     🔴 {a.get('sku','')} — {a.get('days_left',0)}д")
+                elif a['type'] == 'LOST_BUYBOX': print(f"     ⚠️  {a.get('asin','')} @ ${a.get('price',0)}")
+
+    print(f"\n✅ Готово! Дані в {OUT_DIR}/")
+
+
+if __name__ == "__main__":
+    main(full="--full" in sys.argv)
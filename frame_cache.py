@@ -0,0 +1,547 @@
+"""
+MR.EQUIPP — спільний кеш даних для dashboard.py і вкладок (margin / weather / customer feedback)
+- @cached(ttl=...) замість @st.cache_data: один екземпляр результату на процес
+  для всіх сесій, загальний бюджет пам'яті (FRAME_CACHE_MB) і LRU з урахуванням розміру
+- статистика hit/miss по кожному запису — сторінка ETL Status
+- кадри віддаються shallow copy: без копії даних на кожен виклик. Контракт — лише
+  читання: нові/перезаписані колонки (df[col] = ...) кеш не зачіпають, а запис у наявні
+  значення (.loc/.iloc[...] = , inplace=True) — зачепить; тоді спершу df.copy()
+- IncrementalFrame: після TTL таблиця не перечитується цілком — тягнемо лише рядки
+  з watermark-колонкою (created_at / snapshot_time / posted_date) >= останнього значення
+  й зливаємо з кадром, дедуп по натуральному ключу (amazon_order_id+sku, review_id).
+  Раз на FULL_RELOAD_SEC — повне перечитування: ловить UPDATE/DELETE заднім числом.
+- компактні dtype для всього, що проходить через кеш: низькокардинальні рядки -> category,
+  int64 -> int32; звіт пам'яті до/після по кожному loader-у
+- кадри IncrementalFrame знімаються в Parquet (FRAME_CACHE_DIR) разом з watermark:
+  після рестарту процесу кадр піднімається з диска й лише дочитується з Postgres.
+  Каталог має пережити рестарт (не /tmp); без FRAME_CACHE_DIR теплого старту немає.
+  Після дочитування знімок переписується не частіше FRAME_DISK_SAVE_SEC
+
+Модуль імпортується, а не виконується Streamlit-ом, тож стан живе весь процес.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+TTL_SEC         = int(os.getenv("FRAME_TTL_SEC", "60"))
+FULL_RELOAD_SEC = int(os.getenv("FRAME_FULL_RELOAD_SEC", "3600"))
+BUDGET_BYTES    = int(os.getenv("FRAME_CACHE_MB", "512")) * 1024 * 1024
+DISK_DIR        = os.getenv("FRAME_CACHE_DIR", "")
+DISK_SAVE_SEC   = int(os.getenv("FRAME_DISK_SAVE_SEC", "600"))
+DISK_MAX_AGE    = int(os.getenv("FRAME_DISK_MAX_AGE_SEC", str(7 * 86400)))
+IDLE_SEC        = int(os.getenv("FRAME_IDLE_SEC", "3600"))
+
+PANDAS_MAJOR = int(pd.__version__.split(".")[0])
+
+if not DISK_DIR:
+    print("frame_cache: FRAME_CACHE_DIR не задано — знімки кадрів на диск вимкнено, "
+          "після рестарту orders / reviews читаються з Postgres цілком")
+
+# category і на pandas 2 (він стоїть у проді): у dashboard усі groupby / pivot_table
+# явно з observed=True — без порожніх груп для категорій, яких немає у відфільтрованому
+# кадрі; map / value_counts по цих колонках — через astype(object), бо fillna новим
+# значенням на category падає, а value_counts повертає категорії з нулем
+CATEGORY_OK        = PANDAS_MAJOR >= 2
+CATEGORY_COLUMNS   = frozenset({
+    "asin", "ASIN", "sku", "SKU", "domain", "marketplace", "Store Name",
+    "order_status", "Order Status", "ship_country", "Ship Country",
+    "fulfillment_channel", "Currency", "currency", "event_type", "charge_type",
+    "Transaction Type", "condition", "report_type",
+})
+CATEGORY_MAX_RATIO = 0.5    # унікальних / рядків: вище — category не економить
+
+
+# ══════════════════════════════════════════
+# Спільний кеш з бюджетом пам'яті
+# ══════════════════════════════════════════
+def _nbytes(v) -> int:
+    if isinstance(v, pd.DataFrame):
+        return int(v.memory_usage(index=True, deep=True).sum())
+    if isinstance(v, pd.Series):
+        return int(v.memory_usage(index=True, deep=True))
+    if isinstance(v, (tuple, list)):
+        return sys.getsizeof(v) + sum(_nbytes(x) for x in v)
+    if isinstance(v, dict):
+        return sys.getsizeof(v) + sum(_nbytes(k) + _nbytes(x) for k, x in v.items())
+    return sys.getsizeof(v)
+
+
+def _share(v):
+    """Спільний кадр -> новий контейнер над тими ж даними. Без глобального CoW на pandas 2:
+    присвоєння колонки лишається в копії, а запис у наявні значення — ні (див. шапку)."""
+    if isinstance(v, (pd.DataFrame, pd.Series)):
+        return v.copy(deep=False)
+    if isinstance(v, tuple):
+        return tuple(_share(x) for x in v)
+    if isinstance(v, list):
+        return [_share(x) for x in v]
+    if isinstance(v, dict):
+        return {k: _share(x) for k, x in v.items()}
+    return v
+
+
+# ══════════════════════════════════════════
+# Компактні dtype
+# ══════════════════════════════════════════
+_dtype_report = {}   # loader -> {rows, before_mb, after_mb, category}
+
+
+def compact(df, name=None):
+    """Спільний прохід для кадрів loader-ів: category для відомих низькокардинальних
+    рядкових колонок, int64 -> int32 там, де влазить. float64 не чіпаємо — це гроші."""
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return df
+    before = _nbytes(df)
+    cats, out = [], {}
+    for col in df.columns:
+        s = df[col]
+        if not isinstance(col, str) or isinstance(s, pd.DataFrame):
+            continue
+        if (CATEGORY_OK and col in CATEGORY_COLUMNS
+                and (s.dtype == object or pd.api.types.is_string_dtype(s.dtype))
+                and not isinstance(s.dtype, pd.CategoricalDtype)):
+            if s.nunique(dropna=True) <= len(s) * CATEGORY_MAX_RATIO:
+                out[col] = s.astype("category")
+                cats.append(col)
+        elif s.dtype == "int64" and len(s):
+            mn, mx = s.min(), s.max()
+            if -2**31 <= mn and mx < 2**31:
+                out[col] = s.astype("int32")
+    if out:
+        df = df.assign(**out)
+    if name:
+        _dtype_report[name] = {"rows": len(df),
+                               "before_mb": round(before / 1024 / 1024, 2),
+                               "after_mb":  round(_nbytes(df) / 1024 / 1024, 2),
+                               "category":  ", ".join(cats)}
+    return df
+
+
+def _compact_result(v, name):
+    if isinstance(v, pd.DataFrame):
+        return compact(v, name)
+    if isinstance(v, tuple) and any(isinstance(x, pd.DataFrame) for x in v):
+        return tuple(compact(x, f"{name}[{i}]") if isinstance(x, pd.DataFrame) else x
+                     for i, x in enumerate(v))
+    return v
+
+
+def dtype_report() -> list:
+    return [{"name": k, **v} for k, v in sorted(_dtype_report.items())]
+
+
+def _freeze(v):
+    if isinstance(v, (list, tuple)):
+        return tuple(_freeze(x) for x in v)
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    if isinstance(v, set):
+        return frozenset(v)
+    try:
+        hash(v)
+        return v
+    except TypeError:
+        return repr(v)
+
+
+class _Entry:
+    __slots__ = ("name", "value", "nbytes", "created", "expires", "hits", "misses", "on_evict")
+
+    def __init__(self, name, value, nbytes, ttl, on_evict=None):
+        self.name     = name
+        self.value    = value
+        self.nbytes   = nbytes
+        self.created  = time.time()
+        self.expires  = self.created + ttl if ttl else None
+        self.hits     = 0
+        self.misses   = 1
+        self.on_evict = on_evict
+
+
+class SharedCache:
+    """key -> значення; LRU у межах budget байт. Один завантажувач на ключ (без dogpile)."""
+
+    def __init__(self, budget=BUDGET_BYTES):
+        self.budget    = budget
+        self.bytes     = 0
+        self.evictions = 0
+        self._data     = OrderedDict()
+        self._misses   = {}    # key -> промахи записів, яких уже немає (перезавантаження після TTL)
+        self._lock     = threading.Lock()
+        self._loading  = {}    # key -> Lock
+
+    def _evict_locked(self, need: int) -> list:
+        dropped = []
+        while self._data and self.bytes + need > self.budget:
+            key, e = self._data.popitem(last=False)
+            self.bytes -= e.nbytes
+            self.evictions += 1
+            if e.on_evict:
+                dropped.append(e.on_evict)
+        return dropped
+
+    def _store(self, key, e: _Entry):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+                e.hits, e.misses = old.hits, old.misses + 1
+            else:
+                e.misses += self._misses.pop(key, 0)
+            if e.nbytes > self.budget:
+                self._misses[key] = e.misses
+                return []
+            dropped = self._evict_locked(e.nbytes)
+            self._data[key] = e
+            self.bytes += e.nbytes
+        return dropped
+
+    def get_or_load(self, name, key, ttl, loader):
+        with self._lock:
+            e = self._data.get(key)
+            if e is not None and (e.expires is None or e.expires > time.time()):
+                e.hits += 1
+                self._data.move_to_end(key)
+                return e.value
+            gate = self._loading.setdefault(key, threading.Lock())
+        with gate:
+            # поки чекали — могла завантажити інша сесія
+            with self._lock:
+                e = self._data.get(key)
+                if e is not None and (e.expires is None or e.expires > time.time()):
+                    e.hits += 1
+                    self._data.move_to_end(key)
+                    return e.value
+                if e is not None:
+                    self._misses[key] = self._misses.get(key, 0) + e.misses
+                    self._data.pop(key)
+                    self.bytes -= e.nbytes
+            # gate знімаємо лише після _store(): інакше наступний виклик між ними
+            # не бачить ні значення, ні gate — і вантажить удруге
+            try:
+                value   = loader()
+                dropped = self._store(key, _Entry(name, value, _nbytes(value), ttl))
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            for cb in dropped:
+                cb()
+            return value
+
+    def track(self, name, key, value, on_evict=None, hit=False):
+        """Облік значення, яке живе поза кешем (IncrementalFrame): розмір у бюджеті, LRU, hit/miss."""
+        with self._lock:
+            e = self._data.get(key)
+            if hit and e is not None:
+                e.hits += 1
+                self._data.move_to_end(key)
+                return
+        for cb in self._store(key, _Entry(name, value, _nbytes(value), None, on_evict)):
+            cb()
+
+    def discard(self, key):
+        """Прибрати запис без on_evict — власник уже сам себе скинув."""
+        with self._lock:
+            e = self._data.pop(key, None)
+            if e is not None:
+                self.bytes -= e.nbytes
+
+    def clear(self, name=None):
+        with self._lock:
+            keys = [k for k, e in self._data.items() if name is None or e.name == name]
+            dropped = []
+            for k in keys:
+                e = self._data.pop(k)
+                self.bytes -= e.nbytes
+                if e.on_evict:
+                    dropped.append(e.on_evict)
+            if name is None:
+                self._misses.clear()
+        for cb in dropped:
+            cb()
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            entries = [{
+                "name":    e.name,
+                "args":    str(k[1]) if isinstance(k, tuple) and len(k) > 1 else "",
+                "mb":      round(e.nbytes / 1024 / 1024, 2),
+                "hits":    e.hits,
+                "misses":  e.misses,
+                "age_sec": int(now - e.created),
+                "ttl_sec": int(e.expires - e.created) if e.expires else None,
+            } for k, e in reversed(self._data.items())]
+            return {"budget_mb": round(self.budget / 1024 / 1024, 1),
+                    "used_mb":   round(self.bytes / 1024 / 1024, 2),
+                    "entries":   len(self._data),
+                    "evictions": self.evictions,
+                    "items":     entries}
+
+
+CACHE = SharedCache()
+
+
+def cached(ttl=TTL_SEC, name=None):
+    """Заміна @st.cache_data(ttl=...): ключ — назва функції + аргументи;
+    аргументи з _ на початку (як _engine) у ключ не входять — як у Streamlit."""
+    def deco(fn):
+        sig   = inspect.signature(fn)
+        label = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (label, tuple((k, _freeze(v)) for k, v in bound.arguments.items()
+                                if not k.startswith("_")))
+            return _share(CACHE.get_or_load(label, key, ttl,
+                                            lambda: _compact_result(fn(*args, **kwargs), label)))
+
+        wrapper.clear = lambda: CACHE.clear(label)
+        return wrapper
+    return deco
+
+
+def clear():
+    """Кнопки "Оновити дані" — разом із st.cache_data.clear()."""
+    CACHE.clear()
+    with _frames_lock:
+        frames = list(_frames.values())
+    for fr in frames:
+        fr.invalidate()
+
+
+def _max_watermark(df: pd.DataFrame, col: str):
+    """Максимум сирої watermark-колонки як рядок (Postgres сам зведе до типу колонки)."""
+    if not col or df.empty or col not in df.columns:
+        return None
+    s = df[col].dropna()
+    if s.empty:
+        return None
+    if not pd.api.types.is_datetime64_any_dtype(s) and s.dtype == object:
+        s = s.astype(str)
+    return str(s.max())
+
+
+# ══════════════════════════════════════════
+# Теплий кеш на диску (Parquet + watermark)
+# ══════════════════════════════════════════
+def _fingerprint(fn) -> str:
+    """Зміна коду process() (деплой) -> старі знімки не підходять."""
+    code = getattr(fn, "__code__", None)
+    if code is None:
+        return ""
+    return hashlib.sha1(code.co_code + repr(code.co_consts).encode()).hexdigest()[:12]
+
+
+def _disk_path(key) -> str:
+    return os.path.join(DISK_DIR, hashlib.sha1(repr(key).encode()).hexdigest()[:20])
+
+
+def _disk_load(key, fingerprint):
+    """-> (df, watermark) або None, якщо знімка немає / застарів / інший process()."""
+    base = _disk_path(key)
+    try:
+        with open(base + ".json") as f:
+            meta = json.load(f)
+        if (meta.get("key") != repr(key) or meta.get("process") != fingerprint
+                or time.time() - meta.get("saved_at", 0) > DISK_MAX_AGE):
+            return None
+        return pd.read_parquet(base + ".parquet"), meta.get("watermark")
+    except Exception:
+        return None
+
+
+def _disk_save(key, df, wm, fingerprint):
+    base = _disk_path(key)
+    try:
+        os.makedirs(DISK_DIR, exist_ok=True)
+        tmp = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_parquet(base + ".parquet" + tmp, index=False)
+        os.replace(base + ".parquet" + tmp, base + ".parquet")
+        with open(base + ".json" + tmp, "w") as f:
+            json.dump({"key": repr(key), "watermark": wm, "process": fingerprint,
+                       "rows": len(df), "saved_at": time.time()}, f)
+        os.replace(base + ".json" + tmp, base + ".json")
+    except Exception as e:
+        # змішані типи в object-колонці тощо — просто без теплого старту
+        print(f"frame_cache: не вдалося зберегти {key!r}: {e}")
+
+
+class IncrementalFrame:
+    """Кадр + watermark. get(fetch, process):
+    fetch(since) -> сирий DataFrame (since=None — вся таблиця), process(df) -> оброблений."""
+
+    def __init__(self, keys=(), watermark=None, sort_by=None, ascending=False,
+                 ttl=TTL_SEC, full_reload=FULL_RELOAD_SEC, name=None):
+        self.name        = name
+        self.keys        = list(keys)
+        self.watermark   = watermark
+        self.sort_by     = sort_by
+        self.ascending   = ascending
+        self.ttl         = ttl
+        self.full_reload = full_reload
+        self.df          = None
+        self.wm          = None
+        self.loaded_at   = 0.0
+        self.full_at     = 0.0
+        self.used_at     = time.time()
+        self.saved_at    = 0.0
+        self.save_lock   = threading.Lock()   # один запис знімка на кадр: parquet і json з одного проходу
+        self.lock        = threading.Lock()
+        self.restored    = False
+        self.stale       = False     # витіснено з CACHE — решту стану скинути на наступному get()
+        self.stats       = {"full": 0, "incremental": 0, "rows_fetched": 0, "from_disk": 0}
+
+    def _full_due(self, now) -> bool:
+        return (self.df is None or not self.watermark or self.wm is None
+                or now - self.full_at >= self.full_reload)
+
+    def get(self, fetch, process=None) -> pd.DataFrame:
+        with self.lock:
+            if self.stale:
+                self._drop()
+                self.restored, self.stale = False, False
+            now = time.time()
+            df  = self.df
+            self.used_at = now
+            if df is not None and now - self.loaded_at < self.ttl:
+                CACHE.track(self._label(), ("frame", self.name), df, self._evicted, hit=True)
+                return df
+            if df is None and not self.restored and self.name is not None and DISK_DIR:
+                self._restore(process, now)
+                df = self.df
+            full = self._full_due(now)
+            raw  = fetch(None if full else self.wm)
+            wm   = _max_watermark(raw, self.watermark)
+            new  = process(raw) if process and not raw.empty else raw
+            self.stats["rows_fetched"] += len(raw)
+            if full:
+                df, self.full_at = compact(new, self._label()), now
+                self.stats["full"] += 1
+            else:
+                self.stats["incremental"] += 1
+                if not new.empty:
+                    # concat category з різними наборами категорій дає object — стискаємо заново
+                    df = compact(self._merge(df, new), self._label())
+            self.stale, self.df = False, df
+            if wm is not None:
+                self.wm = wm if self.wm is None or full else max(self.wm, wm)
+            self.loaded_at = now
+            # повне — знімаємо одразу; дочитування — не частіше DISK_SAVE_SEC (старіший
+            # знімок безпечний: після рестарту просто дочитаємо від його watermark)
+            if (self.name is not None and DISK_DIR
+                    and (full or (not raw.empty and now - self.saved_at >= DISK_SAVE_SEC))):
+                self.saved_at = now
+                threading.Thread(target=self._save, daemon=True,
+                                 args=(df, self.wm, _fingerprint(process))).start()
+            CACHE.track(self._label(), ("frame", self.name), df, self._evicted)
+            return df
+
+    def _restore(self, process, now):
+        # після рестарту: кадр з диска, далі звичайне дочитування від його watermark;
+        # повне перечитування — через FULL_RELOAD_SEC, а не одразу
+        self.restored = True
+        if not self.watermark:
+            return
+        hit = _disk_load(self.name, _fingerprint(process))
+        if hit is None or hit[1] is None:
+            return
+        self.df, self.wm = hit
+        self.full_at = now
+        self.stats["from_disk"] += 1
+
+    def _save(self, df, wm, fingerprint):
+        if not self.save_lock.acquire(blocking=False):
+            self.saved_at = 0.0    # попередній ще пише — спробуємо на наступному дочитуванні
+            return
+        try:
+            _disk_save(self.name, df, wm, fingerprint)
+        finally:
+            self.save_lock.release()
+
+    def _label(self) -> str:
+        return "frame:" + str(self.name[0] if isinstance(self.name, tuple) else self.name)
+
+    def _drop(self):
+        self.df, self.wm, self.loaded_at, self.full_at = None, None, 0.0, 0.0
+
+    def _evicted(self):
+        # виклик з CACHE при витісненні; без self.lock — його може тримати інший get().
+        # Присвоєння атрибута під GIL атомарне: посилання на кадр відпускаємо одразу,
+        # watermark і решту скине наступний get() під lock (і підніме кадр з диска)
+        self.df = None
+        self.stale = True
+
+    def _merge(self, old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+        if old is None or old.empty:
+            return new
+        df = pd.concat([old, new], ignore_index=True)
+        keys = [k for k in self.keys if k in df.columns]
+        if keys:
+            df = df.drop_duplicates(subset=keys, keep="last")
+        if self.sort_by and self.sort_by in df.columns:
+            df = df.sort_values(self.sort_by, ascending=self.ascending, kind="stable")
+        return df.reset_index(drop=True)
+
+    def invalidate(self):
+        with self.lock:
+            self._drop()
+            self.stale = False
+
+
+_frames = {}
+_frames_lock = threading.Lock()
+
+
+def _prune_locked(now):
+    """Кадри, витіснені з CACHE або без звернень IDLE_SEC, — геть із _frames:
+    ключ містить діапазон дат, тож інакше словник росте з кожним новим періодом."""
+    for key, fr in list(_frames.items()):
+        idle = now - fr.used_at
+        if not ((fr.df is None and idle > fr.ttl) or idle > IDLE_SEC):
+            continue
+        if not fr.lock.acquire(blocking=False):
+            continue    # саме вантажиться
+        try:
+            fr._drop()
+        finally:
+            fr.lock.release()
+        CACHE.discard(("frame", key))
+        del _frames[key]
+
+
+def get_frame(key, **kw) -> IncrementalFrame:
+    """Один IncrementalFrame на ключ (loader + його аргументи) на процес."""
+    with _frames_lock:
+        _prune_locked(time.time())
+        fr = _frames.get(key)
+        if fr is None:
+            fr = _frames[key] = IncrementalFrame(name=key, **kw)
+        return fr
+
+
+def stats() -> list:
+    """Стан усіх кадрів — для сторінки ETL Status."""
+    with _frames_lock:
+        items = list(_frames.items())
+    out = []
+    for key, fr in items:
+        df = fr.df
+        out.append({
+            "key":       key,
+            "rows":      0 if df is None else len(df),
+            "watermark": fr.wm,
+            "age_sec":   round(time.time() - fr.loaded_at, 1) if fr.loaded_at else None,
+            **fr.stats,
+        })
+    return out
@@ -7,7 +7,7 @@
 # COGS хранится в public.sku_cogs (заполняется тут же через редактор).
 # Без COGS показывает "маржу после Amazon".
 #
-# Источник комиссий: public.finance_events (charge_type).
+# Источник комиссий: public.finance_events (charge_type) через bi.finance_daily.
 # Подключение в dashboard.py:
 #   from margin_tab import show_margin_tab
 #   show_margin_tab(get_engine())
@@ -16,31 +16,35 @@ import streamlit as st
 import pandas as pd
 from sqlalchemy import text
 
+import typed_views
+from frame_cache import cached
+
 # charge_type, которые НЕ вычитаем (проходные налоги/обёртка — не наши расходы/доходы)
 _PASSTHROUGH = ("Tax", "GiftWrap", "GiftWrapTax", "ShippingTax", "ShippingCharge")
 
 
-@st.cache_data(ttl=1800)
+@cached(ttl=1800)
 def _load_margin(_engine, days=30):
-    """Маржа после Amazon по SKU за N дней (из finance_events)."""
+    """Маржа после Amazon по SKU за N дней (из дневного rollup finance_events)."""
+    src = typed_views.relation(_engine, "finance_daily", "f")
     sql = f"""
-        SELECT sku,
-               SUM(CASE WHEN charge_type='Principal' THEN amount::numeric ELSE 0 END) AS revenue,
-               SUM(CASE WHEN charge_type NOT IN {_PASSTHROUGH}
-                        THEN amount::numeric ELSE 0 END)                              AS net_after_amazon,
-               SUM(CASE WHEN charge_type='Principal' THEN quantity::numeric ELSE 0 END) AS units
-        FROM public.finance_events
-        WHERE sku IS NOT NULL AND sku <> ''
-          AND amount ~ '^-?[0-9.]+$'
-          AND event_type IN ('Shipment','Refund','ShipmentPromo','RefundFee','ShipmentFee')
-          AND posted_date >= (CURRENT_DATE - INTERVAL '{int(days)} days')::text
-        GROUP BY sku
-        HAVING SUM(CASE WHEN charge_type='Principal' THEN amount::numeric ELSE 0 END) > 0
+        SELECT f.sku,
+               SUM(CASE WHEN f.charge_type='Principal' THEN f.amount ELSE 0 END)   AS revenue,
+               SUM(CASE WHEN f.charge_type NOT IN {_PASSTHROUGH}
+                        THEN f.amount ELSE 0 END)                                   AS net_after_amazon,
+               SUM(CASE WHEN f.charge_type='Principal' THEN f.quantity ELSE 0 END) AS units
+        FROM {src}
+        WHERE f.sku IS NOT NULL AND f.sku <> ''
+          AND f.amount IS NOT NULL
+          AND f.event_type IN ('Shipment','Refund','ShipmentPromo','RefundFee','ShipmentFee')
+          AND f.posted_day >= CURRENT_DATE - {int(days)}
+        GROUP BY f.sku
+        HAVING SUM(CASE WHEN f.charge_type='Principal' THEN f.amount ELSE 0 END) > 0
     """
     return pd.read_sql(sql, _engine)
 
 
-@st.cache_data(ttl=300)
+@cached(ttl=300)
 def _load_cogs(_engine):
     try:
         return pd.read_sql("SELECT sku, cost FROM public.sku_cogs", _engine)
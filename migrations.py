@@ -0,0 +1,218 @@
+"""
+MR.EQUIPP — версіоновані міграції схеми public
+Дати в orders / finance_events / settlements лежать як TEXT, тож фільтр періоду
+(SUBSTRING(purchase_date,1,10)::date BETWEEN ..., posted_date BETWEEN ...) не
+бачить індексів — кожна зміна періоду = seq scan по всій історії. Тут до таблиць
+додаються збережені згенеровані DATE-колонки (purchase_day, posted_day) з
+B-tree / BRIN індексами; ETL нічого не змінює — Postgres рахує їх сам при INSERT/UPDATE.
+
+Кожна міграція — функція (conn) -> None, ідемпотентна (IF NOT EXISTS, перевірка
+колонок), виконується в окремій транзакції; застосовані версії — у public.schema_migrations.
+Нову міграцію лише дописувати в кінець MIGRATIONS з наступним номером.
+
+ADD COLUMN ... STORED переписує таблицю під ACCESS EXCLUSIVE — ETL на цей час
+стоїть. Тому запуск — окремим кроком релізу (Procfile: release), а не з
+веб-процесу; дашборд мігрує сам лише з AUTO_MIGRATE=1.
+
+    python migrations.py             # застосувати нові
+    python migrations.py --status    # що застосовано
+"""
+import os
+import sys
+import time
+
+from sqlalchemy import create_engine, text
+
+LOCK_ID = 0x6D696772        # pg_advisory_lock: одна міграція на всю базу ('migr')
+
+# TEXT -> DATE до міграції: ті самі формати, що й public.mr_day() (ISO або DD.MM.YYYY)
+_TEXT_DAY = ("CASE WHEN {c}::text ~ '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}' THEN LEFT({c}::text, 10)::date"
+             " WHEN {c}::text ~ '^[0-9]{{2}}[.][0-9]{{2}}[.][0-9]{{4}}'"
+             " THEN to_date(LEFT({c}::text, 10), 'DD.MM.YYYY') END")
+
+# таблиця -> (TEXT-колонка дати, згенерована DATE-колонка, вираз-замінник до міграції)
+DAY_COLUMNS = {
+    "orders":         ("purchase_date", "purchase_day", _TEXT_DAY),
+    "finance_events": ("posted_date",   "posted_day",   _TEXT_DAY),
+    "settlements":    ("posted_date",   "posted_day",   _TEXT_DAY),
+}
+
+
+def text_day(col: str) -> str:
+    """DATE з TEXT-колонки (SQL-вираз col) тим самим розбором, що й замінники нижче."""
+    return _TEXT_DAY.format(c=col)
+
+
+def day_expr(table: str, cols, alias: str = None) -> str:
+    """DATE-день рядка для WHERE/GROUP BY: згенерована колонка, якщо міграція вже пройшла,
+    інакше — еквівалентний вираз по TEXT (працює, але без індексу)."""
+    src, day, fallback = DAY_COLUMNS[table]
+    p = f"{alias}." if alias else ""
+    if day in cols:
+        return f"{p}{day}"
+    return fallback.format(c=f"{p}{src}")
+
+
+# ══════════════════════════════════════════
+# Кроки
+# ══════════════════════════════════════════
+
+def _col_type(conn, table: str, col: str):
+    return conn.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = :t AND column_name = :c"
+    ), {"t": table, "c": col}).scalar()
+
+
+def _add_day(conn, table: str):
+    """Згенерована DATE-колонка дня; False — якщо таблиці / колонки дати немає."""
+    src, day, _ = DAY_COLUMNS[table]
+    kind = _col_type(conn, table, src)
+    if kind is None:
+        return False
+    if _col_type(conn, table, day) is not None:
+        return True
+    # вираз генерованої колонки має бути IMMUTABLE: ::date по TEXT залежить від DateStyle
+    expr = {
+        "date":                        f'"{src}"',
+        "timestamp without time zone": f'"{src}"::date',
+        "timestamp with time zone":    f"(\"{src}\" AT TIME ZONE 'UTC')::date",
+    }.get(kind, f'public.mr_day("{src}"::text)')
+    conn.execute(text(
+        f'ALTER TABLE public.{table} ADD COLUMN "{day}" date GENERATED ALWAYS AS ({expr}) STORED'
+    ))
+    return True
+
+
+def _index(conn, table: str, cols: tuple, using: str = "btree"):
+    name = "ix_" + table + "_" + "_".join(cols) + ("" if using == "btree" else "_" + using)
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {name} ON public.{table} USING {using} "
+        f"({', '.join(chr(34) + c + chr(34) for c in cols)})"
+    ))
+
+
+def m001_mr_day(conn):
+    # ISO (YYYY-MM-DD...) або DD.MM.YYYY -> DATE; сміття й неіснуючі дати -> NULL.
+    # make_date замість ::date — не залежить від DateStyle, тому IMMUTABLE чесний
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION public.mr_day(t text) RETURNS date
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        BEGIN
+            IF t ~ '^[0-9]{4}-[0-9]{2}-[0-9]{2}' THEN
+                RETURN make_date(substr(t, 1, 4)::int, substr(t, 6, 2)::int, substr(t, 9, 2)::int);
+            ELSIF t ~ '^[0-9]{2}[.][0-9]{2}[.][0-9]{4}' THEN
+                RETURN make_date(substr(t, 7, 4)::int, substr(t, 4, 2)::int, substr(t, 1, 2)::int);
+            END IF;
+            RETURN NULL;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END $$
+    """))
+
+
+def m002_orders_purchase_day(conn):
+    if _add_day(conn, "orders"):
+        _index(conn, "orders", ("purchase_day",))
+        if _col_type(conn, "orders", "sku"):
+            _index(conn, "orders", ("sku", "purchase_day"))
+
+
+def m003_finance_events_posted_day(conn):
+    # найбільша таблиця, ETL дописує її в хронологічному порядку — BRIN у сотні разів менший за B-tree
+    if _add_day(conn, "finance_events"):
+        _index(conn, "finance_events", ("posted_day",), using="brin")
+        _index(conn, "finance_events", ("event_type", "posted_day"))
+
+
+def m004_settlements_posted_day(conn):
+    if _add_day(conn, "settlements"):
+        _index(conn, "settlements", ("posted_day",))
+
+
+MIGRATIONS = [
+    (1, m001_mr_day),
+    (2, m002_orders_purchase_day),
+    (3, m003_finance_events_posted_day),
+    (4, m004_settlements_posted_day),
+]
+
+
+# ══════════════════════════════════════════
+# Раннер
+# ══════════════════════════════════════════
+
+def _ensure_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS public.schema_migrations (
+                version    INT PRIMARY KEY,
+                name       TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                seconds    NUMERIC
+            )
+        """))
+
+
+def applied(engine) -> dict:
+    """version -> (name, applied_at, seconds)."""
+    _ensure_table(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT version, name, applied_at, seconds FROM public.schema_migrations"
+        )).fetchall()
+    return {r[0]: tuple(r[1:]) for r in rows}
+
+
+def migrate(engine) -> list:
+    """Застосовує нові міграції по черзі -> [(version, name, сек)].
+    Інший процес уже мігрує — повертає [] (не чекає)."""
+    _ensure_table(engine)
+    done = []
+    with engine.connect() as lock:
+        if not lock.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_ID}).scalar():
+            return done
+        try:
+            have = applied(engine)
+            for version, step in MIGRATIONS:
+                if version in have:
+                    continue
+                t0 = time.time()
+                with engine.begin() as conn:     # міграція + запис про неї — одна транзакція
+                    step(conn)
+                    conn.execute(text(
+                        "INSERT INTO public.schema_migrations (version, name, seconds) "
+                        "VALUES (:v, :n, :s)"
+                    ), {"v": version, "n": step.__name__, "s": round(time.time() - t0, 2)})
+                done.append((version, step.__name__, round(time.time() - t0, 2)))
+        finally:
+            lock.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_ID})
+            lock.commit()
+    return done
+
+
+def pending(engine) -> list:
+    have = applied(engine)
+    return [(v, step.__name__) for v, step in MIGRATIONS if v not in have]
+
+
+def main(show_status=False):
+    url = os.getenv("DATABASE_URL", "")
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    engine = create_engine(url, connect_args={"connect_timeout": 10})
+    if show_status:
+        have = applied(engine)
+        for v, step in MIGRATIONS:
+            row = have.get(v)
+            print(f"{v:>4}  {step.__name__:<36} {row[1]:%Y-%m-%d %H:%M} ({row[2]} с)" if row
+                  else f"{v:>4}  {step.__name__:<36} —")
+        return
+    for v, name, sec in migrate(engine):
+        print(f"✅ {v} {name}: {sec} с")
+    left = pending(engine)
+    print("📋 Невиконані: " + ", ".join(n for _, n in left) if left else "✅ Схема актуальна")
+
+
+if __name__ == "__main__":
+    main(show_status="--status" in sys.argv)
@@ -0,0 +1,77 @@
+"""
+MR.EQUIPP — паралельне завантаження незалежних запитів сторінки
+Сторінки на кшталт Pricing / FBA Operations / Command Center робили 4–11 SELECT-ів
+послідовно на одному конекшені: час сторінки = сума запитів. prefetch() запускає їх
+одночасно на конекшенах пулу рушія — час = найповільніший запит.
+
+Пул потоків — свій на кожен виклик (не більше WORKERS): сесії не стоять у спільній
+черзі одна за одною, а спільне обмеження лишається одне — пул конекшенів рушія.
+Таймаут — на кожен запит від моменту, коли він отримав конекшен (SET LOCAL
+statement_timeout), тож очікування в черзі не з'їдає час запиту. timeout=None — без
+ліміту: для SELECT * без періоду (Pricing, FBA Operations), які просто довгі.
+
+    pre = prefetch(engine, {"bb": "SELECT * FROM pricing_buybox", ...})
+    df_bb = pre["bb"]                 # помилка запиту -> виняток тут
+    df_nc = pre.get("nc", empty_df)   # необов'язковий запит
+"""
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pandas as pd
+from sqlalchemy import text
+
+TIMEOUT_SEC = float(os.getenv("PREFETCH_TIMEOUT_SEC", "30"))
+WORKERS     = int(os.getenv("PREFETCH_WORKERS", "4"))   # на виклик; <= pool_size + max_overflow рушія
+
+
+class Results:
+    """name -> DataFrame. [name] піднімає помилку свого запиту; get(name, default) — ні."""
+
+    def __init__(self, frames, errors, timings, elapsed):
+        self.frames  = frames
+        self.errors  = errors
+        self.timings = timings     # name -> сек (лише завершені)
+        self.elapsed = elapsed     # сек на всю пачку
+
+    def __getitem__(self, name) -> pd.DataFrame:
+        if name in self.errors:
+            raise self.errors[name]
+        return self.frames[name]
+
+    def __contains__(self, name) -> bool:
+        return name in self.frames
+
+    def get(self, name, default=None):
+        return self.frames.get(name, default)
+
+
+def _run(engine, sql, params, timeout):
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        if timeout:
+            conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout * 1000)}"))
+        df = pd.read_sql(text(sql), conn, params=params)
+    return df, time.perf_counter() - t0
+
+
+def prefetch(engine, queries: dict, timeout: float = TIMEOUT_SEC) -> Results:
+    """queries: name -> sql або (sql, params). Стартують одразу, до WORKERS паралельно;
+    timeout — секунд на кожен запит (None — без ліміту)."""
+    t0      = time.perf_counter()
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(WORKERS, len(queries))),
+                            thread_name_prefix="prefetch") as pool:
+        for name, q in queries.items():
+            sql, params = q if isinstance(q, tuple) else (q, None)
+            # копія контексту — облік запитів (query_stats) бачить сторінку, що їх запустила
+            futures[pool.submit(contextvars.copy_context().run, _run, engine, sql, params, timeout)] = name
+        wait(futures)
+    frames, errors, timings = {}, {}, {}
+    for fut, name in futures.items():
+        try:
+            frames[name], timings[name] = fut.result()
+        except Exception as e:
+            errors[name] = e
+    return Results(frames, errors, timings, time.perf_counter() - t0)
@@ -0,0 +1,263 @@
+"""
+MR.EQUIPP — індекси під гарячі запити дашборду
+Декларація: який запит (код-шлях) якого індексу потребує. Тексти гарячих запитів
+живуть тут і імпортуються в місця виклику — EXPLAIN бачить рівно той SQL, що
+виконується. ensure() створює відсутні (CREATE INDEX CONCURRENTLY IF NOT EXISTS —
+без блокування записів ETL, невалідний залишок перерваної побудови перестворюється),
+verify() проганяє EXPLAIN кожного запиту й попереджає, якщо на великій таблиці
+план скотився в Seq Scan.
+
+Викликається кроком релізу після migrations.py (Procfile: release), фоном при
+старті дашборду (лише verify; створення — з AUTO_MIGRATE=1) та вручну:
+    python query_indexes.py            # створити відсутні + перевірити
+    python query_indexes.py --verify   # лише EXPLAIN
+"""
+import os
+import sys
+import json
+import time
+
+from sqlalchemy import create_engine, text
+
+from alerts_engine import LOST_BUYBOX_SQL
+
+MIN_ROWS = int(os.getenv("INDEX_CHECK_MIN_ROWS", "5000"))   # менші таблиці Postgres чесно сканує
+
+# ══════════════════════════════════════════
+# Гарячі запити — єдине джерело тексту: код-шляхи виконують саме ці рядки,
+# verify() робить EXPLAIN по них же (не по спрощеній копії)
+# ══════════════════════════════════════════
+# dashboard._bb_current_state — psycopg2, %s = список наших seller_id
+BB_CURRENT_STATE_SQL = """
+    WITH latest AS (
+        SELECT DISTINCT ON (asin)
+            asin, snapshot_time,
+            has_buybox, buybox_seller_id, buybox_price, buybox_landed, buybox_is_fba,
+            own_seller_id, own_is_buybox, own_price, own_landed, own_is_fba,
+            total_offer_count, fba_offer_count, fbm_offer_count,
+            all_offers_json,
+            -- Чесна перевірка "BB у нас": seller_id matches наших, а не зламаний own_is_buybox
+            (has_buybox AND buybox_seller_id = ANY(%s)) AS is_ours
+        FROM public.pricing_buybox_winners
+        ORDER BY asin, snapshot_time DESC
+    ),
+    cat AS (
+        SELECT DISTINCT ON (asin)
+            asin, item_name, brand, main_image_url
+        FROM public.catalog_items
+        ORDER BY asin, created_at DESC NULLS LAST
+    )
+    SELECT l.*, c.item_name, c.brand, c.main_image_url
+    FROM latest l
+    LEFT JOIN cat c USING (asin)
+"""
+
+# dashboard._bb_history — %s: наші seller_id (двічі), кількість днів
+BB_HISTORY_SQL = """
+    SELECT
+        DATE_TRUNC('hour', snapshot_time) AS hour,
+        COUNT(*) AS total_asins,
+        COUNT(*) FILTER (
+            WHERE has_buybox AND buybox_seller_id = ANY(%s)
+        ) AS we_hold,
+        COUNT(*) FILTER (
+            WHERE has_buybox
+              AND buybox_seller_id IS NOT NULL
+              AND buybox_seller_id <> ALL(%s)
+              AND own_seller_id IS NOT NULL
+        ) AS we_lost,
+        COUNT(*) FILTER (WHERE NOT has_buybox) AS suppressed
+    FROM public.pricing_buybox_winners
+    WHERE snapshot_time > NOW() - %s * INTERVAL '1 day'
+    GROUP BY hour
+    ORDER BY hour
+"""
+
+# dashboard._bb_competitors — %s = список наших seller_id
+BB_COMPETITORS_SQL = """
+    SELECT
+        buybox_seller_id AS seller,
+        COUNT(*) AS asins_holding,
+        AVG(buybox_price)::numeric(10,2) AS avg_price,
+        COUNT(*) FILTER (WHERE buybox_is_fba) AS fba_count
+    FROM (
+        SELECT DISTINCT ON (asin)
+            asin, buybox_seller_id, buybox_price, buybox_is_fba
+        FROM public.pricing_buybox_winners
+        WHERE buybox_seller_id IS NOT NULL
+          AND buybox_seller_id <> ALL(%s)
+        ORDER BY asin, snapshot_time DESC
+    ) latest
+    GROUP BY buybox_seller_id
+    ORDER BY asins_holding DESC
+    LIMIT 15
+"""
+
+# dashboard._get_existing_review_ids — %s: asin, domain, limit
+REVIEW_IDS_SQL = """
+    SELECT review_id FROM amazon_reviews
+    WHERE asin=%s AND domain=%s AND review_id IS NOT NULL
+    ORDER BY created_at DESC LIMIT %s
+"""
+
+# weather_tab._load_weather_today
+WEATHER_TODAY_SQL = """
+    SELECT DISTINCT ON (state_code)
+           state_code, state_name,
+           temperature_2m_max_f, temperature_2m_max_c,
+           temperature_2m_min_f, temperature_2m_min_c,
+           precipitation_sum_mm,
+           thunderstorm, flood_risk, weather_emoji, weather_desc, kind
+    FROM weather.weather_all
+    WHERE date = CURRENT_DATE
+    ORDER BY state_code, loaded_at DESC
+"""
+
+# review_requests_tab._load_existing — SQLAlchemy text(), :s = магазин
+REVIEW_REQUESTS_SQL = "SELECT order_id FROM public.review_requests WHERE store_name = :s"
+
+_SELLERS = ["A0000000000000"]      # типові значення параметрів для EXPLAIN
+
+# назва, схема, таблиця, колонки індексу, де в коді, запит, параметри для EXPLAIN
+# (tuple — psycopg2 %s, dict — SQLAlchemy :name)
+INDEXES = [
+    ("ix_pbw_asin_snapshot", "public", "pricing_buybox_winners", ("asin", "snapshot_time DESC"),
+     "Buy Box: поточний стан (DISTINCT ON asin)", BB_CURRENT_STATE_SQL, (_SELLERS,)),
+    ("ix_pbw_asin_snapshot", "public", "pricing_buybox_winners", ("asin", "snapshot_time DESC"),
+     "Buy Box: конкуренти (DISTINCT ON asin)", BB_COMPETITORS_SQL, (_SELLERS,)),
+    ("ix_pbw_snapshot", "public", "pricing_buybox_winners", ("snapshot_time",),
+     "Buy Box: історія за N днів", BB_HISTORY_SQL, (_SELLERS, _SELLERS, 7)),
+    ("ix_catalog_items_asin_created", "public", "catalog_items", ("asin", "created_at DESC NULLS LAST"),
+     "Buy Box: назви/фото з catalog_items", BB_CURRENT_STATE_SQL, (_SELLERS,)),
+    ("ix_pricing_buybox_asin_mkt_snapshot", "public", "pricing_buybox",
+     ("asin", "marketplace", "snapshot_time DESC"),
+     "Алерти / API: останній знімок Buy Box по (asin, marketplace)", LOST_BUYBOX_SQL, {}),
+    ("ix_amazon_reviews_asin_domain_created", "public", "amazon_reviews",
+     ("asin", "domain", "created_at DESC"),
+     "Скрапер відгуків: dedup review_id по (asin, domain)", REVIEW_IDS_SQL, ("B000000000", "com", 500)),
+    ("ix_weather_all_date_state_loaded", "weather", "weather_all",
+     ("date", "state_code", "loaded_at DESC"),
+     "Погода: сьогодні по штатах", WEATHER_TODAY_SQL, {}),
+    ("ix_review_requests_store", "public", "review_requests", ("store_name",),
+     "Review requests: вже надіслані по магазину", REVIEW_REQUESTS_SQL, {"s": "store"}),
+]
+
+LAST_REPORT = []     # останній run() — для сторінки ETL Status
+
+
+def _col_name(col: str) -> str:
+    return col.split()[0]
+
+
+def _missing_cols(conn, schema: str, table: str, cols: tuple) -> list:
+    have = {r[0] for r in conn.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = :s AND table_name = :t"
+    ), {"s": schema, "t": table})}
+    if not have:
+        return ["<таблиці немає>"]
+    return [c for c in map(_col_name, cols) if c not in have]
+
+
+def _index_state(conn, schema: str, name: str):
+    """None — немає, True — валідний, False — залишок перерваної CONCURRENTLY-побудови."""
+    return conn.execute(text("""
+        SELECT i.indisvalid FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :s AND c.relname = :n
+    """), {"s": schema, "n": name}).scalar()
+
+
+def ensure(engine) -> dict:
+    """Створює відсутні індекси -> name -> 'exists' | 'created' | 'skipped: ...' | 'error: ...'."""
+    out = {}
+    # CONCURRENTLY не працює в транзакції
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for name, schema, table, cols, *_ in INDEXES:
+            if name in out:                 # той самий індекс під кілька запитів
+                continue
+            try:
+                missing = _missing_cols(conn, schema, table, cols)
+                if missing:
+                    out[name] = "skipped: " + ", ".join(missing)
+                    continue
+                state = _index_state(conn, schema, name)
+                if state:
+                    out[name] = "exists"
+                    continue
+                if state is False:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{name}"))
+                t0 = time.time()
+                col_sql = ", ".join('"' + _col_name(c) + '"' + c[len(_col_name(c)):] for c in cols)
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {schema}.{table} ({col_sql})"
+                ))
+                out[name] = f"created ({time.time() - t0:.1f} с)"
+            except Exception as e:
+                out[name] = f"error: {type(e).__name__}: {str(e).splitlines()[0][:200]}"
+    return out
+
+
+def _plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+def verify(engine) -> list:
+    """EXPLAIN кожного гарячого запиту -> [{index, table, rows, plan, seq_scan, warning}]."""
+    rows = []
+    with engine.connect() as conn:
+        for name, schema, table, cols, where, sql, params in INDEXES:
+            row = {"index": name, "table": f"{schema}.{table}", "where": where,
+                   "rows": None, "plan": "", "seq_scan": False, "warning": ""}
+            try:
+                if _missing_cols(conn, schema, table, cols):
+                    row["plan"] = "—"
+                    rows.append(row)
+                    continue
+                row["rows"] = int(conn.execute(text(
+                    "SELECT GREATEST(c.reltuples, 0) FROM pg_class c "
+                    "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = :s AND c.relname = :t"
+                ), {"s": schema, "t": table}).scalar() or 0)
+                if isinstance(params, dict):
+                    plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+                else:
+                    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql, params).scalar()
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+                nodes = list(_plan_nodes(plan))
+                scans = [n for n in nodes if n.get("Relation Name") == table]
+                row["plan"] = ", ".join(dict.fromkeys(
+                    n["Node Type"] + (f" {n['Index Name']}" if n.get("Index Name") else "") for n in scans
+                ))
+                row["seq_scan"] = any(n["Node Type"] == "Seq Scan" for n in scans)
+                if row["seq_scan"] and row["rows"] >= MIN_ROWS:
+                    row["warning"] = f"Seq Scan по {row['rows']:,} рядках — {name} не використовується"
+            except Exception as e:
+                conn.rollback()
+                row["warning"] = f"{type(e).__name__}: {str(e).splitlines()[0][:200]}"
+            rows.append(row)
+    return rows
+
+
+def run(engine, create=True) -> list:
+    """ensure() + verify(); попередження — у лог. Результат також у LAST_REPORT."""
+    global LAST_REPORT
+    created = ensure(engine) if create else {}
+    report  = verify(engine)
+    for r in report:
+        r["status"] = created.get(r["index"], "")
+        if r["status"].startswith(("created", "error")):
+            print(f"🧭 index {r['index']}: {r['status']}")
+        if r["warning"]:
+            print(f"⚠️ hot query [{r['where']}]: {r['warning']}")
+    LAST_REPORT = report
+    return report
+
+
+if __name__ == "__main__":
+    url = os.getenv("DATABASE_URL", "")
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    for r in run(create_engine(url, connect_args={"connect_timeout": 10}), create="--verify" not in sys.argv):
+        print(f"{r['index']:<40} {r['status'] or '—':<14} {r['plan'] or '—'}")
@@ -0,0 +1,263 @@
+"""
+MR.EQUIPP — облік SQL-запитів дашборду по сторінках
+Кожен execute на psycopg2-рівні (і через рушій get_engine(), і в «сирих»
+psycopg2.connect у _bb_query / customer_feedback / tender) пишеться в ковзний
+журнал: відбиток SQL (літерали й параметри -> ?), час, рядки, оцінка байтів,
+активна сторінка (report_choice). ETL Status показує найповільніші запити й
+найважчі сторінки — список того, що оптимізувати далі.
+
+Хук стоїть на рівні DBAPI (connection_factory), а не на подіях SQLAlchemy:
+так однаково видно обидва шляхи, а також рядки, які реально вичитали fetch*()
+(server-side курсори stream_read теж).
+
+    engine = create_engine(url, connect_args={"connection_factory": TracedConnection})
+    conn   = query_stats.connect(url)            # замість psycopg2.connect
+    query_stats.start_run("🏠 Overview")         # на початку рендеру сторінки
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import deque
+from contextvars import ContextVar
+
+import psycopg2
+import psycopg2.extensions
+
+MAX_RECORDS = int(os.getenv("QUERY_STATS_MAX", "5000"))    # ковзне вікно — останні N запитів
+SAMPLE_ROWS = 50                                           # по скількох рядках оцінювати байти
+
+_page    = ContextVar("mr_page", default=None)
+_lock    = threading.Lock()
+_records = deque(maxlen=MAX_RECORDS)
+_runs    = deque(maxlen=MAX_RECORDS)     # (сторінка, час) кожного рендеру
+_fps     = {}      # SQL -> (відбиток, нормалізований текст); обмежений кеш
+
+
+def set_page(name):
+    _page.set(name)
+
+
+def start_run(name):
+    """Новий рендер сторінки: запити далі в цьому потоці рахуються на неї."""
+    _page.set(name)
+    with _lock:
+        _runs.append((name, time.time()))
+
+
+# ══════════════════════════════════════════
+# Відбиток SQL
+# ══════════════════════════════════════════
+_COMMENT = re.compile(r"--[^\n]*")
+_STRING  = re.compile(r"'(?:[^']|'')*'")
+_PARAM   = re.compile(r"%\(\w+\)s|%s")
+_NUMBER  = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST    = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE   = re.compile(r"\s+")
+
+
+def fingerprint(sql: str):
+    """-> (12-символьний ключ, нормалізований SQL). Однакові запити з різними
+    значеннями (дати, ASIN, IN-списки) мають один відбиток."""
+    hit = _fps.get(sql)
+    if hit:
+        return hit
+    norm = _COMMENT.sub(" ", sql)
+    norm = _STRING.sub("?", norm)
+    norm = _PARAM.sub("?", norm)
+    norm = _NUMBER.sub("?", norm)
+    norm = _LIST.sub("(?…)", norm)
+    norm = _SPACE.sub(" ", norm).strip()
+    fp = (hashlib.md5(norm.encode()).hexdigest()[:12], norm)
+    if len(_fps) > 2000:
+        _fps.clear()
+    _fps[sql] = fp
+    return fp
+
+
+def _sql_text(query, conn) -> str:
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    try:
+        return query.as_string(conn)         # psycopg2.sql.Composed
+    except Exception:
+        return str(query)
+
+
+def _row_bytes(rows) -> float:
+    """Середній розмір рядка (текстове представлення) по перших SAMPLE_ROWS."""
+    sample = rows[:SAMPLE_ROWS]
+    if not sample:
+        return 0.0
+    total = 0
+    for r in sample:
+        vals = r.values() if isinstance(r, dict) else r
+        total += sum(len(str(v)) for v in vals if v is not None)
+    return total / len(sample)
+
+
+# ══════════════════════════════════════════
+# psycopg2: курсор і конекшен з обліком
+# ══════════════════════════════════════════
+class _TracedCursor:
+    """Домішка до будь-якого класу курсора (звичайний, DictCursor, RealDictCursor, іменований)."""
+    _mr_rec = None
+
+    def _mr_start(self, query):
+        key, norm = fingerprint(_sql_text(query, self.connection))
+        if norm == "SELECT ?":                    # pool_pre_ping
+            self._mr_rec = {"sec": 0.0, "rows": 0, "bytes": 0.0}
+            return self._mr_rec
+        self._mr_rec = {"fp": key, "sql": norm, "page": _page.get(), "at": time.time(),
+                        "sec": 0.0, "rows": 0, "bytes": 0.0}
+        with _lock:
+            _records.append(self._mr_rec)
+        return self._mr_rec
+
+    def execute(self, query, vars=None):
+        rec = self._mr_start(query)
+        t0  = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            rec["sec"] += time.perf_counter() - t0
+            if self.name is None and self.rowcount and self.rowcount > 0:
+                rec["rows"] = self.rowcount      # клієнтський курсор: весь результат уже тут
+
+    def executemany(self, query, vars_list):
+        rec = self._mr_start(query)
+        t0  = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            rec["sec"] += time.perf_counter() - t0
+            rec["rows"] = max(self.rowcount, 0)
+
+    def _mr_fetched(self, rows, t0):
+        rec = self._mr_rec
+        if rec is None:
+            return
+        rec["sec"] += time.perf_counter() - t0     # для server-side курсора основний час тут
+        if self.name is not None:
+            rec["rows"] += len(rows)
+        rec["bytes"] += _row_bytes(rows) * len(rows)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._mr_fetched(rows, t0)
+        return rows
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._mr_fetched(rows, t0)
+        return rows
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._mr_fetched([row] if row is not None else [], t0)
+        return row
+
+
+_traced_classes = {}
+
+
+def _traced(factory):
+    cls = _traced_classes.get(factory)
+    if cls is None:
+        cls = _traced_classes[factory] = type("Traced" + factory.__name__, (_TracedCursor, factory), {})
+    return cls
+
+
+class TracedConnection(psycopg2.extensions.connection):
+    """connection_factory для psycopg2.connect / create_engine(connect_args=...)."""
+
+    def cursor(self, *args, **kwargs):
+        if len(args) > 1:                          # cursor(name, cursor_factory, ...)
+            args, kwargs["cursor_factory"] = (args[0],) + args[2:], args[1]
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _traced(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def connect(*args, **kwargs):
+    """psycopg2.connect з обліком запитів."""
+    return psycopg2.connect(*args, connection_factory=TracedConnection, **kwargs)
+
+
+# ══════════════════════════════════════════
+# Звіти
+# ══════════════════════════════════════════
+def _snapshot() -> list:
+    with _lock:
+        return [dict(r) for r in _records]
+
+
+def slowest(limit: int = 20) -> list:
+    """Відбитки за сумарним часом: виклики, сума/середнє/макс, рядки, байти, сторінки."""
+    agg = {}
+    for r in _snapshot():
+        a = agg.get(r["fp"])
+        if a is None:
+            a = agg[r["fp"]] = {"fp": r["fp"], "sql": r["sql"], "calls": 0, "total_sec": 0.0,
+                                "max_sec": 0.0, "rows": 0, "bytes": 0.0, "pages": set(), "last": 0}
+        a["calls"]     += 1
+        a["total_sec"] += r["sec"]
+        a["max_sec"]    = max(a["max_sec"], r["sec"])
+        a["rows"]      += r["rows"]
+        a["bytes"]     += r["bytes"]
+        a["pages"].add(r["page"] or "фон")
+        a["last"]       = max(a["last"], r["at"])
+    out = sorted(agg.values(), key=lambda a: a["total_sec"], reverse=True)[:limit]
+    for a in out:
+        a["avg_sec"] = a["total_sec"] / a["calls"]
+        a["pages"]   = sorted(a["pages"])
+    return out
+
+
+def pages() -> list:
+    """Сторінки за часом у БД: рендери, запити, сек (усього і на рендер), рядки, байти."""
+    agg  = {}
+    recs = _snapshot()
+    for r in recs:
+        name = r["page"] or "фон"
+        a = agg.get(name)
+        if a is None:
+            a = agg[name] = {"page": name, "queries": 0, "db_sec": 0.0, "rows": 0, "bytes": 0.0,
+                             "fps": set()}
+        a["queries"] += 1
+        a["db_sec"]  += r["sec"]
+        a["rows"]    += r["rows"]
+        a["bytes"]   += r["bytes"]
+        a["fps"].add(r["fp"])
+    # рендери — лише ті, що потрапили у вікно журналу запитів
+    since = recs[0]["at"] if recs else 0
+    runs  = {}
+    with _lock:
+        for name, at in _runs:
+            if at >= since:
+                runs[name] = runs.get(name, 0) + 1
+    out = sorted(agg.values(), key=lambda a: a["db_sec"], reverse=True)
+    for a in out:
+        a["runs"]         = runs.get(a["page"], 0)
+        a["sec_per_run"]  = a["db_sec"] / a["runs"] if a["runs"] else None
+        a["distinct_sql"] = len(a.pop("fps"))
+    return out
+
+
+def stats() -> dict:
+    with _lock:
+        n, oldest = len(_records), (_records[0]["at"] if _records else None)
+    return {"records": n, "max_records": MAX_RECORDS,
+            "window_sec": time.time() - oldest if oldest else 0}
+
+
+def clear():
+    with _lock:
+        _records.clear()
+        _runs.clear()
@@ -14,6 +14,7 @@ import plotly.graph_objects as go
 import streamlit as st
 from datetime import datetime, timezone, timedelta
 from sqlalchemy import text
+from query_indexes import REVIEW_REQUESTS_SQL
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -140,7 +141,7 @@ def _send_one(order_id: str) -> tuple:
 def _load_existing(engine) -> set:
     with engine.connect() as conn:
         rows = conn.execute(
-            text("SELECT order_id FROM public.review_requests WHERE store_name = :s"),
+            text(REVIEW_REQUESTS_SQL),
             {"s": STORE_NAME}).fetchall()
     return {r[0] for r in rows}
 
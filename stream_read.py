@@ -0,0 +1,87 @@
+"""
+MR.EQUIPP — потокове читання великих таблиць іменованим (server-side) курсором
+pd.read_sql / cursor.fetchall() тримають одночасно весь результат libpq, список
+кортежів Python і готовий DataFrame — 2–3 копії amazon_reviews (з повним content)
+чи sales_traffic. Тут Postgres віддає рядки пачками по BATCH_ROWS через
+DECLARE ... CURSOR: у клієнті живе лише одна сира пачка, вона одразу стає
+типізованим DataFrame, а в кінці пачки склеюються поколонково зі звільненням
+уже скопійованих колонок — пік пам'яті близький до розміру фінального кадру.
+
+    df = read_frame(engine, "SELECT * FROM amazon_reviews WHERE review_date >= %(d)s",
+                    {"d": "2024-01-01"}, convert=_reviews_batch)
+
+SQL — у стилі psycopg2 (%(name)s), як у _select_sql(..., pyformat=True).
+"""
+import os
+import uuid
+
+import pandas as pd
+
+BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "20000"))
+
+
+def iter_batches(engine, sql: str, params=None, batch_rows: int = BATCH_ROWS, convert=None):
+    """Генератор DataFrame-пачок. convert(df) -> df типізує кожну пачку окремо."""
+    raw = engine.raw_connection()     # конекшен з пулу рушія (search_path, таймаути ті самі)
+    try:
+        # іменований курсор живе в транзакції — після читання відкочуємо її
+        cur = raw.cursor(name=f"mr_stream_{uuid.uuid4().hex[:12]}")
+        cur.itersize = batch_rows
+        try:
+            cur.execute(sql, params or None)
+            cols, sent = None, False
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if cols is None:
+                    cols = [d[0] for d in cur.description]
+                if not rows:
+                    break
+                df = pd.DataFrame.from_records(rows, columns=cols, coerce_float=True)
+                del rows
+                sent = True
+                yield convert(df) if convert else df
+            if not sent:
+                yield pd.DataFrame(columns=cols)     # порожній результат — але з колонками
+        finally:
+            try:
+                cur.close()
+            except Exception:
+                pass            # транзакція вже зламана помилкою запиту — курсор і так закритий
+            raw.rollback()
+    finally:
+        raw.close()
+
+
+def _concat_col(parts: list) -> pd.Series:
+    # порожня чи повністю NULL пачка приходить як object (None). Приводимо до dtype решти
+    # лише з підвищенням: int/bool -> nullable Int64/boolean (NULL лишається NULL, а не
+    # TypeError чи False); float / datetime / str приймають NULL і так
+    nulls = [p.dtype == object and p.isna().all() for p in parts]
+    kinds = {p.dtype for p, n in zip(parts, nulls) if not n}
+    if len(kinds) == 1 and any(nulls):
+        dtype = kinds.pop()
+        if pd.api.types.is_bool_dtype(dtype):
+            dtype = "boolean"
+        elif pd.api.types.is_integer_dtype(dtype):
+            dtype = "Int64"
+        parts = [p if p.dtype == dtype else p.astype(dtype) for p in parts]
+    return pd.concat(parts, ignore_index=True)
+
+
+def concat(batches: list) -> pd.DataFrame:
+    """Склеює пачки поколонково: колонку забираємо з пачок (pop) одразу після копії."""
+    if not batches:
+        return pd.DataFrame()
+    if len(batches) == 1:
+        return batches.pop().reset_index(drop=True)
+    cols = list(batches[0].columns)
+    out  = {}
+    for col in cols:
+        out[col] = _concat_col([b.pop(col) for b in batches])
+    batches.clear()
+    return pd.DataFrame(out, columns=cols)
+
+
+def read_frame(engine, sql: str, params=None, batch_rows: int = BATCH_ROWS, convert=None) -> pd.DataFrame:
+    """Увесь результат як один DataFrame, прочитаний пачками (див. iter_batches)."""
+    return concat(list(iter_batches(engine, sql, params, batch_rows, convert)))
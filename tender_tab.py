@@ -33,17 +33,18 @@ import io
 import os
 import re
 import tempfile
-import psycopg2
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
 
+import query_stats
+
 # ============================================
 # DB helper
 # ============================================
 def _get_conn():
     url = os.getenv("DATABASE_URL") or st.secrets.get("DATABASE_URL", "")
-    return psycopg2.connect(url)
+    return query_stats.connect(url)
 
 @st.cache_data(ttl=300)
 def fetch_tender_shipments():
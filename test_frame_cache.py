@@ -0,0 +1,118 @@
+"""frame_cache: бюджет пам'яті для IncrementalFrame (без БД)."""
+import pandas as pd
+import pytest
+
+import frame_cache
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    c = frame_cache.SharedCache(budget=0)
+    monkeypatch.setattr(frame_cache, "CACHE", c)
+    monkeypatch.setattr(frame_cache, "DISK_DIR", str(tmp_path))
+    monkeypatch.setattr(frame_cache, "_frames", {})
+    return c
+
+
+def _fetch(since):
+    return pd.DataFrame({"id": range(1000), "v": [1.5] * 1000})
+
+
+def test_evicted_frames_release_df(cache):
+    one = frame_cache._nbytes(frame_cache.compact(_fetch(None)))
+    cache.budget = one * 2 + one // 2
+    frames = [frame_cache.get_frame(("t", i), keys=("id",)) for i in range(4)]
+    for fr in frames:
+        fr.get(_fetch)
+    assert cache.bytes <= cache.budget
+    assert [fr.df is None for fr in frames] == [True, True, False, False]
+    assert cache.evictions == 2
+
+
+def test_evicted_frame_reloads(cache):
+    cache.budget = 1
+    fr = frame_cache.get_frame(("t", 0), keys=("id",))
+    assert len(fr.get(_fetch)) == 1000     # більший за бюджет — у CACHE не потрапляє
+    cache.budget = 10 ** 9
+    fr.get(_fetch)
+    fr._evicted()
+    assert fr.df is None
+    assert len(fr.get(_fetch)) == 1000 and not fr.stale
+
+
+def test_prune_evicted_and_idle(cache, monkeypatch):
+    cache.budget = 10 ** 9
+    old = frame_cache.get_frame(("t", "old"), keys=("id",))
+    old.get(_fetch)
+    gone = frame_cache.get_frame(("t", "gone"), keys=("id",))
+    gone.get(_fetch)
+    gone._evicted()
+    old.used_at = gone.used_at = 0.0
+    frame_cache.get_frame(("t", "new"))
+    assert list(frame_cache._frames) == [("t", "new")]
+    assert old.df is None and cache.bytes == 0
+
+
+def test_share_column_assignment_stays_local():
+    src = pd.DataFrame({"a": [1, 2], "b": [3.0, 4.0]})
+    out = frame_cache._share((src, {"x": src}))
+    out[0]["a"] = [9, 9]
+    out[1]["x"]["c"] = 1
+    assert src["a"].tolist() == [1, 2] and list(src.columns) == ["a", "b"]
+
+
+def test_get_or_load_single_loader(cache):
+    import threading
+    cache.budget = 10 ** 9
+    calls, start = [], threading.Event()
+
+    def loader():
+        calls.append(1)
+        start.wait(0.2)
+        return pd.DataFrame({"a": [1]})
+
+    threads = [threading.Thread(target=cache.get_or_load, args=("t", "k", 60, loader))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    start.set()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and not cache._loading
+
+
+def test_get_or_load_failure_releases_gate(cache):
+    def boom():
+        raise RuntimeError("db down")
+    with pytest.raises(RuntimeError):
+        cache.get_or_load("t", "k", 60, boom)
+    assert not cache._loading
+
+
+def test_disk_snapshot_throttled(cache, monkeypatch):
+    import time
+    cache.budget = 10 ** 9
+    saved = []
+    monkeypatch.setattr(frame_cache, "_disk_save", lambda key, df, wm, fp: saved.append(len(df)))
+    monkeypatch.setattr(frame_cache, "DISK_SAVE_SEC", 3600)
+    rows = iter(range(10, 100))
+
+    def fetch(since):
+        n = next(rows)
+        return pd.DataFrame({"id": [n], "created_at": [f"2024-01-{n % 28 + 1:02d}"]})
+
+    fr = frame_cache.get_frame(("t", "disk"), keys=("id",), watermark="created_at", ttl=0)
+    for _ in range(3):
+        fr.get(fetch)
+    time.sleep(0.2)
+    assert saved == [1]                 # лише повне завантаження
+    fr.saved_at -= 3600
+    fr.get(fetch)
+    time.sleep(0.2)
+    assert saved == [1, 4]
+
+
+def test_no_disk_dir_no_snapshot(cache, monkeypatch):
+    monkeypatch.setattr(frame_cache, "DISK_DIR", "")
+    monkeypatch.setattr(frame_cache, "_disk_save", lambda *a: pytest.fail("saved"))
+    frame_cache.get_frame(("t", "nodisk"), watermark="id").get(_fetch)
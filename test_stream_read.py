@@ -0,0 +1,34 @@
+"""stream_read.concat: склеювання пачок з повністю NULL колонками (без БД)."""
+import pandas as pd
+
+from stream_read import concat
+
+
+def _batches(values_a, values_b):
+    return [pd.DataFrame({"x": values_a, "id": [1] * len(values_a)}),
+            pd.DataFrame({"x": values_b, "id": [2] * len(values_b)})]
+
+
+def test_int_batch_with_all_null_batch():
+    df = concat(_batches([1, 2], [None, None]))
+    assert str(df["x"].dtype) == "Int64"
+    assert df["x"].tolist()[:2] == [1, 2]
+    assert df["x"].isna().tolist() == [False, False, True, True]
+
+
+def test_bool_batch_keeps_nulls():
+    df = concat(_batches([True, False], [None]))
+    assert str(df["x"].dtype) == "boolean"
+    assert df["x"].isna().tolist() == [False, False, True]
+
+
+def test_float_and_datetime_take_nulls():
+    assert concat(_batches([1.5], [None]))["x"].dtype == "float64"
+    ts = pd.to_datetime(["2024-01-01"])
+    df = concat(_batches(ts, [None]))
+    assert pd.api.types.is_datetime64_any_dtype(df["x"]) and df["x"].isna().tolist() == [False, True]
+
+
+def test_same_dtype_untouched():
+    df = concat(_batches([1, 2], [3]))
+    assert df["x"].dtype == "int64" and df["x"].tolist() == [1, 2, 3]
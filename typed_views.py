@@ -0,0 +1,424 @@
+"""
+MR.EQUIPP — типізовані аналітичні копії TEXT-таблиць (схема bi)
+Дати й числа у orders / finance_events / settlements / spapi.sales_traffic /
+fba_inventory зберігаються як TEXT, і кожен запит дашборда парсить їх заново
+(SUBSTRING(...)::date, regex-касти, NULLIF(...)::numeric). Тут вони кастуються
+один раз: bi.<назва> = ті самі колонки, але числові — NUMERIC, плюс DATE-колонка дня.
+
+bi.finance_daily — денний rollup finance_events на рівні
+(день, marketplace, sku, event_type, charge_type): SUM(amount), SUM(quantity), кількість подій.
+Фінансові KPI (Overview, Settlements, Tax, маржа, /finance) читають його замість 1M+ рядків.
+
+Оновлення інкрементальне: перезаписуються дні від останнього завантаженого
+мінус LOOKBACK (ETL дописує й оновлює свіжі дні). Зміну джерела бачимо за
+лічильниками pg_stat_user_tables — без COUNT(*) по таблиці. Рядки, вставлені чи
+змінені після минулого оновлення зі старішою датою (замовлення заднім числом),
+знаходимо за xmin: since розширюється до їхнього найранішого дня. DELETE старіших
+днів інкремент не бачить, тому повна перебудова — коли з минулої повної
+зросли n_tup_upd + n_tup_del (не частіше FULL_MIN_SEC) і в будь-якому разі раз на FULL_MAX_SEC.
+
+    python typed_views.py            # після ETL (і в release, Procfile): оновити змінені таблиці
+    python typed_views.py --full     # перебудувати все
+
+Дашборд додатково перевіряє джерела фоном кожні TYPED_REFRESH_SEC.
+"""
+import os
+import sys
+import time
+import hashlib
+import threading
+
+from sqlalchemy import create_engine, text
+
+SCHEMA       = "bi"
+LOOKBACK     = int(os.getenv("TYPED_LOOKBACK_DAYS", "3"))
+FULL_MIN_SEC = int(os.getenv("TYPED_FULL_MIN_SEC", "3600"))     # UPDATE/DELETE у джерелі -> повна, не частіше
+FULL_MAX_SEC = int(os.getenv("TYPED_FULL_MAX_SEC", "86400"))    # повна перебудова щонайменше раз на добу
+READY_TTL    = 60      # сек — як часто перечитувати bi.refresh_state
+SPEC_VERSION = "1"     # змінити при зміні виразів нижче → повна перебудова
+
+_ISO = "'^[0-9]{4}-[0-9]{2}-[0-9]{2}'"
+_NUM = "'^-?[0-9]*[.]?[0-9]+$'"
+
+
+def _q(col: str) -> str:
+    return '"' + col.replace('"', '""') + '"'
+
+
+def iso_day(col: str) -> str:
+    """TEXT/DATE/TIMESTAMP -> DATE; сміття -> NULL (замість помилки касту)."""
+    return f"CASE WHEN {col}::text ~ {_ISO} THEN LEFT({col}::text, 10)::date END"
+
+
+def num(col: str) -> str:
+    """TEXT -> NUMERIC; порожні й нечислові -> NULL."""
+    return f"CASE WHEN TRIM({col}::text) ~ {_NUM} THEN TRIM({col}::text)::numeric END"
+
+
+# кандидати колонок розрізів finance_events (перша наявна) — спільні для rollup
+# finance_daily і api.finance_exprs, щоб сирий шлях і rollup групували однаково
+FIN_MARKETPLACE_COLS = ("marketplace", "marketplace_name", "marketplace_id")
+FIN_SKU_COLS         = ("sku", "seller_sku")
+
+
+# settlements.posted_date буває і YYYY-MM-DD, і DD.MM.YYYY
+_SETTLEMENT_DAY = (
+    "CASE WHEN posted_date::text ~ " + _ISO + " THEN LEFT(posted_date::text, 10)::date"
+    " WHEN posted_date::text ~ '^[0-9]{2}[.][0-9]{2}[.][0-9]{4}'"
+    " THEN to_date(LEFT(posted_date::text, 10), 'DD.MM.YYYY') END"
+)
+
+_TRAFFIC_NUMERIC = (
+    "sessions", "page_views", "units_ordered", "units_ordered_b2b",
+    "total_order_items", "total_order_items_b2b",
+    "ordered_product_sales", "ordered_product_sales_b2b",
+    "session_percentage", "page_views_percentage",
+    "buy_box_percentage", "unit_session_percentage",
+    "mobile_sessions", "mobile_page_views", "browser_sessions", "browser_page_views",
+    "mobile_session_percentage", "mobile_page_views_percentage",
+    "mobile_unit_session_percentage", "mobile_buy_box_percentage",
+    "browser_session_percentage", "browser_page_views_percentage",
+    "browser_unit_session_percentage", "browser_buy_box_percentage",
+)
+
+# назва -> джерело, вираз дня, колонка дня, числові колонки, індекси
+VIEWS = {
+    "orders": {
+        "source":  ("public", "orders"),
+        "day":     iso_day("purchase_date"),
+        "day_col": "purchase_day",
+        "numeric": ("quantity", "item_price", "item_tax", "shipping_price", "shipping_tax",
+                    "promotion_discount"),
+        "indexes": (("purchase_day",), ("asin", "purchase_day"), ("sku", "purchase_day")),
+    },
+    "finance_events": {
+        "source":  ("public", "finance_events"),
+        "day":     iso_day("posted_date"),
+        "day_col": "posted_day",
+        "numeric": ("amount", "quantity"),
+        "indexes": (("posted_day",), ("event_type", "charge_type", "posted_day"),
+                    ("seller_sku", "posted_day")),
+    },
+    "settlements": {
+        "source":  ("public", "settlements"),
+        "day":     _SETTLEMENT_DAY,
+        "day_col": "posted_day",
+        "numeric": ("amount", "quantity"),
+        "indexes": (("posted_day",),),
+    },
+    "sales_traffic": {
+        "source":  ("spapi", "sales_traffic"),
+        "day":     iso_day("report_date"),
+        "day_col": "report_day",
+        "numeric": _TRAFFIC_NUMERIC,
+        "indexes": (("report_day",), ("child_asin", "report_day")),
+    },
+    "fba_inventory": {
+        "source":  ("public", "fba_inventory"),
+        "day":     iso_day("created_at"),
+        "day_col": "snapshot_day",
+        "numeric": ("Available", "Price", "Velocity", "Inbound", "Reserved", "Days of Supply"),
+        "indexes": (("snapshot_day",), ("SKU", "snapshot_day")),
+    },
+    # rollup: group — розрізи (перша наявна колонка джерела, назва = перша в кортежі),
+    # numeric сумуються, n_events = COUNT(*)
+    "finance_daily": {
+        "source":  ("public", "finance_events"),
+        "day":     iso_day("posted_date"),
+        "day_col": "posted_day",
+        "numeric": ("amount", "quantity"),
+        "group":   (FIN_MARKETPLACE_COLS, FIN_SKU_COLS, ("event_type",), ("charge_type",)),
+        "indexes": (("posted_day",), ("event_type", "charge_type", "posted_day"),
+                    ("sku", "posted_day")),
+    },
+}
+
+STATE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {SCHEMA}.refresh_state (
+        view_name      TEXT PRIMARY KEY,
+        spec_sig       TEXT,
+        source_changes BIGINT,
+        watermark      DATE,
+        row_count      BIGINT,
+        refreshed_at   TIMESTAMPTZ DEFAULT NOW(),
+        duration_sec   REAL
+    );
+    ALTER TABLE {SCHEMA}.refresh_state ADD COLUMN IF NOT EXISTS source_rewrites BIGINT;
+    ALTER TABLE {SCHEMA}.refresh_state ADD COLUMN IF NOT EXISTS full_at TIMESTAMPTZ;
+    ALTER TABLE {SCHEMA}.refresh_state ADD COLUMN IF NOT EXISTS source_xid BIGINT;
+"""
+
+_LOCK_KEY = 0x6269_7476   # pg advisory lock: один оновлювач на всі процеси
+
+_ready      = set()
+_ready_at   = 0.0
+_select_sql = {}   # назва -> (sig, SELECT ... FROM джерело) — для fallback у relation()
+_state_lock = threading.Lock()
+
+
+# ══════════════════════════════════════════
+# Метадані джерела
+# ══════════════════════════════════════════
+def _source_cols(conn, name: str) -> list:
+    schema, table = VIEWS[name]["source"]
+    rows = conn.execute(text("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = :s AND table_name = :t
+        ORDER BY ordinal_position
+    """), {"s": schema, "t": table}).fetchall()
+    # згенерована колонка дня в джерелі (migrations.py) — рахуємо її тут самі, без дубля
+    return [r[0] for r in rows if r[0] != VIEWS[name]["day_col"]]
+
+
+def _source_changes(conn, name: str) -> tuple:
+    """(n_tup_ins + n_tup_upd + n_tup_del, n_tup_upd + n_tup_del) — ростуть з кожним записом ETL;
+    друге — зміни, які могли зачепити дні старші за LOOKBACK."""
+    schema, table = VIEWS[name]["source"]
+    row = conn.execute(text("""
+        SELECT n_tup_ins + n_tup_upd + n_tup_del, n_tup_upd + n_tup_del FROM pg_stat_user_tables
+        WHERE schemaname = :s AND relname = :t
+    """), {"s": schema, "t": table}).fetchone()
+    return (int(row[0]), int(row[1])) if row and row[0] is not None else (-1, -1)
+
+
+def _group_cols(name: str, cols: list) -> list:
+    """[(колонка джерела, назва в rollup)] — розрізи, які є в джерелі."""
+    have = set(cols)
+    out = []
+    for names in VIEWS[name].get("group", ()):
+        src = next((c for c in names if c in have), None)
+        if src:
+            out.append((src, names[0]))
+    return out
+
+
+def _out_cols(name: str, cols: list) -> set:
+    spec = VIEWS[name]
+    if "group" not in spec:
+        return set(cols) | {spec["day_col"]}
+    return ({alias for _, alias in _group_cols(name, cols)} | {spec["day_col"], "n_events"}
+            | {c for c in spec["numeric"] if c in cols})
+
+
+def _select(name: str, cols: list, where: str = None) -> str:
+    spec = VIEWS[name]
+    schema, table = spec["source"]
+    numeric = set(spec["numeric"])
+    cond = f" WHERE {where}" if where else ""
+    if "group" in spec:
+        groups = _group_cols(name, cols)
+        keys   = [spec["day"]] + [_q(src) for src, _ in groups]
+        parts  = [f"{spec['day']} AS {spec['day_col']}"]
+        parts += [f"{_q(src)} AS {_q(alias)}" for src, alias in groups]
+        parts += [f"SUM({num(_q(c))}) AS {_q(c)}" for c in spec["numeric"] if c in cols]
+        parts.append("COUNT(*) AS n_events")
+        return (f"SELECT {', '.join(parts)} FROM {schema}.{table}{cond} "
+                f"GROUP BY {', '.join(keys)}")
+    parts = [f"{num(_q(c))} AS {_q(c)}" if c in numeric else _q(c) for c in cols]
+    parts.append(f"{spec['day']} AS {spec['day_col']}")
+    return f"SELECT {', '.join(parts)} FROM {schema}.{table}{cond}"
+
+
+def _sig(name: str, cols: list) -> str:
+    return hashlib.md5((SPEC_VERSION + "|" + _select(name, cols)).encode()).hexdigest()
+
+
+# ══════════════════════════════════════════
+# Оновлення
+# ══════════════════════════════════════════
+def _indexes(name: str, cols: list) -> list:
+    """[(ім'я індексу, колонки)] — лише ті, чиї колонки є в джерелі."""
+    have = _out_cols(name, cols)
+    return [(f"ix_{name}_{'_'.join(c.lower().replace(' ', '_') for c in idx)}", idx)
+            for idx in VIEWS[name]["indexes"] if set(idx) <= have]
+
+
+def _rebuild(conn, name: str, select: str, cols: list):
+    """Повна перебудова в bi.<name>__new і підміна в одній транзакції —
+    читачі не бачать порожньої таблиці."""
+    new = f"{SCHEMA}.{name}__new"
+    conn.execute(text(f"DROP TABLE IF EXISTS {new}"))
+    conn.execute(text(f"CREATE TABLE {new} AS {select}"))
+    for idx, icols in _indexes(name, cols):
+        conn.execute(text(f"CREATE INDEX {idx}__new ON {new} ({', '.join(_q(c) for c in icols)})"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {SCHEMA}.{name}"))
+    conn.execute(text(f"ALTER TABLE {new} RENAME TO {name}"))
+    for idx, _ in _indexes(name, cols):
+        conn.execute(text(f"ALTER INDEX {SCHEMA}.{idx}__new RENAME TO {idx}"))
+
+
+def _late_day(conn, name: str, xid: int):
+    """Найраніший день серед рядків джерела, записаних транзакціями, новішими за xid
+    (знімок минулого оновлення). age() рахує по модулю 2^32 — переповнення xid не страшне."""
+    schema, table = VIEWS[name]["source"]
+    return conn.execute(text(
+        f"SELECT MIN({VIEWS[name]['day']}) FROM {schema}.{table} "
+        f"WHERE age(xmin) <= age(CAST(CAST(:xid AS text) AS xid))"
+    ), {"xid": int(xid) % 2**32}).scalar()
+
+
+def _top_up(conn, name: str, cols: list, since):
+    """Перезаписує дні >= since (і рядки без дати — їх мало)."""
+    spec = VIEWS[name]
+    day_col, day_expr = spec["day_col"], spec["day"]
+    conn.execute(text(
+        f"DELETE FROM {SCHEMA}.{name} WHERE {day_col} >= :since OR {day_col} IS NULL"
+    ), {"since": since})
+    select = _select(name, cols, f"({day_expr}) >= :since OR ({day_expr}) IS NULL")
+    conn.execute(text(f"INSERT INTO {SCHEMA}.{name} {select}"), {"since": since})
+
+
+def refresh(engine, names=None, full=False, force=False) -> dict:
+    """Оновлює типізовані таблиці; -> {назва: 'full'|'incremental'|'fresh'|'missing'|'busy'|помилка}.
+    Без force таблиця, чиє джерело не змінилося, пропускається."""
+    out = {}
+    with engine.connect() as conn:
+        got = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _LOCK_KEY}).scalar()
+        conn.commit()
+        if not got:
+            return {n: "busy" for n in (names or VIEWS)}
+        try:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+            conn.execute(text(STATE_DDL))
+            conn.commit()
+            state = {r[0]: r for r in conn.execute(text(
+                f"SELECT view_name, spec_sig, source_changes, watermark, source_rewrites, "
+                f"EXTRACT(EPOCH FROM NOW() - full_at), source_xid FROM {SCHEMA}.refresh_state"
+            )).fetchall()}
+            for name in (names or VIEWS):
+                t0 = time.time()
+                try:
+                    cols = _source_cols(conn, name)
+                    if not cols:
+                        out[name] = "missing"
+                        continue
+                    select  = _select(name, cols)
+                    sig     = _sig(name, cols)
+                    # усе, що закомічено до цього xid, оновлення побачить; новіше — наступне
+                    xid     = conn.execute(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+                    changes, rewrites = _source_changes(conn, name)
+                    prev    = state.get(name)
+                    age     = prev[5] if prev is not None else None
+                    # повна: UPDATE/DELETE з минулої повної (стара історія могла змінитись) або давно не було
+                    stale   = age is None or age >= FULL_MAX_SEC or (
+                        age >= FULL_MIN_SEC and prev[4] is not None and prev[4] != rewrites)
+                    if (not force and not full and prev is not None
+                            and prev[1] == sig and prev[2] == changes and not stale):
+                        out[name] = "fresh"
+                        continue
+                    if full or stale or prev is None or prev[1] != sig or prev[3] is None:
+                        _rebuild(conn, name, select, cols)
+                        out[name] = "full"
+                    else:
+                        since = conn.execute(text(
+                            f"SELECT (:wm)::date - (:lb)::int"
+                        ), {"wm": prev[3], "lb": LOOKBACK}).scalar()
+                        late = _late_day(conn, name, prev[6]) if prev[6] is not None else None
+                        if late is not None and late < since:
+                            since = late
+                        _top_up(conn, name, cols, since)
+                        out[name] = "incremental"
+                    day_col = VIEWS[name]["day_col"]
+                    wm, n = conn.execute(text(
+                        f"SELECT MAX({day_col}), COUNT(*) FROM {SCHEMA}.{name}"
+                    )).fetchone()
+                    # source_rewrites / full_at — стан на момент останньої повної перебудови
+                    conn.execute(text(f"""
+                        INSERT INTO {SCHEMA}.refresh_state
+                            (view_name, spec_sig, source_changes, watermark, row_count, refreshed_at,
+                             duration_sec, source_rewrites, full_at, source_xid)
+                        VALUES (:v, :sig, :ch, :wm, :n, NOW(), :dur, :rw, NOW(), :xid)
+                        ON CONFLICT (view_name) DO UPDATE SET
+                            spec_sig = EXCLUDED.spec_sig, source_changes = EXCLUDED.source_changes,
+                            watermark = EXCLUDED.watermark, row_count = EXCLUDED.row_count,
+                            refreshed_at = EXCLUDED.refreshed_at, duration_sec = EXCLUDED.duration_sec,
+                            source_xid = EXCLUDED.source_xid,
+                            source_rewrites = CASE WHEN :is_full THEN EXCLUDED.source_rewrites
+                                                   ELSE refresh_state.source_rewrites END,
+                            full_at = CASE WHEN :is_full THEN EXCLUDED.full_at ELSE refresh_state.full_at END
+                    """), {"v": name, "sig": sig, "ch": changes, "wm": wm, "n": n,
+                           "dur": round(time.time() - t0, 2), "rw": rewrites, "xid": xid,
+                           "is_full": out[name] == "full"})
+                    conn.commit()
+                    conn.execute(text(f"ANALYZE {SCHEMA}.{name}"))
+                    conn.commit()
+                    with _state_lock:
+                        _ready.add(name)
+                        _select_sql[name] = (sig, select)
+                except Exception as e:
+                    conn.rollback()
+                    out[name] = f"{type(e).__name__}: {e}"
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _LOCK_KEY})
+            conn.commit()
+    return out
+
+
+def status(engine) -> list:
+    """Рядки bi.refresh_state для сторінки ETL Status."""
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text(f"""
+                SELECT view_name, watermark, row_count, refreshed_at, duration_sec, full_at
+                FROM {SCHEMA}.refresh_state ORDER BY view_name
+            """)).mappings().fetchall()
+        return [dict(r) for r in rows]
+    except Exception:
+        return []
+
+
+# ══════════════════════════════════════════
+# Для запитів
+# ══════════════════════════════════════════
+def ready_views(engine) -> set:
+    """Які bi-таблиці вже побудовані під поточну схему джерела (кеш READY_TTL)."""
+    global _ready_at
+    if time.time() - _ready_at < READY_TTL:
+        return set(_ready)
+    found = set()
+    try:
+        with engine.connect() as conn:
+            state = dict(conn.execute(text(
+                f"SELECT view_name, spec_sig FROM {SCHEMA}.refresh_state"
+            )).fetchall())
+            for name in VIEWS:
+                cols = _source_cols(conn, name)
+                if cols and state.get(name) == _sig(name, cols):
+                    found.add(name)
+                if cols:
+                    _select_sql[name] = (_sig(name, cols), _select(name, cols))
+    except Exception:
+        pass
+    with _state_lock:
+        _ready.clear()
+        _ready.update(found)
+    _ready_at = time.time()
+    return found
+
+
+def relation(engine, name: str, alias: str = None) -> str:
+    """FROM-фрагмент: bi.<name> якщо вже побудована, інакше той самий SELECT
+    з кастами як підзапит — колонки й типи однакові, лише повільніше."""
+    alias = alias or name
+    if name in ready_views(engine):
+        return f"{SCHEMA}.{name} AS {alias}"
+    if name not in _select_sql:
+        with engine.connect() as conn:
+            cols = _source_cols(conn, name)
+        _select_sql[name] = (_sig(name, cols), _select(name, cols))
+    return f"({_select_sql[name][1]}) AS {alias}"
+
+
+def main(full=False):
+    url = os.getenv("DATABASE_URL", "")
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if not url:
+        print("❌ DATABASE_URL not set"); sys.exit(1)
+    engine = create_engine(url)
+    for name, res in refresh(engine, full=full).items():
+        print(f"  {name}: {res}")
+
+
+if __name__ == "__main__":
+    main(full="--full" in sys.argv)
@@ -17,6 +17,9 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
+from frame_cache import cached
+from query_indexes import WEATHER_TODAY_SQL
+
 try:
     import requests
 except ImportError:
@@ -54,7 +57,7 @@ _POP_FALLBACK = {
 # DATA LOADERS
 # ============================================================
 
-@st.cache_data(ttl=86400)
+@cached(ttl=86400)
 def _load_population():
     """Население штатов: Census API -> fallback на зашитые данные."""
     key = os.environ.get("CENSUS_API_KEY", "")
@@ -96,23 +99,12 @@ def _load_population():
     return dict(_POP_FALLBACK), "fallback (Census 2023 est.)"
 
 
-@st.cache_data(ttl=1800)
+@cached(ttl=1800)
 def _load_weather_today(_engine):
-    sql = """
-        SELECT DISTINCT ON (state_code)
-               state_code, state_name,
-               temperature_2m_max_f, temperature_2m_max_c,
-               temperature_2m_min_f, temperature_2m_min_c,
-               precipitation_sum_mm,
-               thunderstorm, flood_risk, weather_emoji, weather_desc, kind
-        FROM weather.weather_all
-        WHERE date = CURRENT_DATE
-        ORDER BY state_code, loaded_at DESC
-    """
-    return pd.read_sql(sql, _engine)
+    return pd.read_sql(WEATHER_TODAY_SQL, _engine)
 
 
-@st.cache_data(ttl=1800)
+@cached(ttl=1800)
 def _load_sales_by_state(_engine, days=30):
     sql = f"""
         SELECT state_code,
@@ -126,7 +118,7 @@ def _load_sales_by_state(_engine, days=30):
     return pd.read_sql(sql, _engine)
 
 
-@st.cache_data(ttl=1800)
+@cached(ttl=1800)
 def _load_forecast(_engine, days=16):
     sql = f"""
         SELECT state_code, state_name, date,